@@ -0,0 +1,153 @@
+# AggregateRunResults.py
+#
+# This is a Python script that summarizes the runs in a results file (such as RunResults.tsv
+# from a combinations batch): for each variable and year, it finds the number of runs, the
+# mean, standard deviation, smallest and largest values, and percentiles of the variable's
+# values across the runs, optionally separately for each group of runs sharing the same
+# values of some annotations (such as the setting of one policy).  Variables with subscripts
+# (such as "Output Total CO2e Emissions by Sector[electricity sector]") are summarized
+# separately for each subscript, so each sector has its own summary.
+#
+# The file is read in parts, one per process, so large files are summarized in about the time
+# it takes to read them once, divided by the number of processors.  Each process keeps a fixed
+# amount of information for each group, variable, and year, with the mergeable summaries in
+# StreamingStatistics.py (the moments, with Welford's method, and a t-digest for the
+# percentiles), and the summaries of the parts are then merged.  The memory needed depends on
+# the number of groups and variables, not on the number of runs.
+#
+# Summaries File
+# --------------
+# The summaries are written in the layout of a results file (see RunResultsReader.py), as
+# MonteCarloInputs.py writes its percentiles: one row per group, statistic, and variable, with
+# the group's annotations and a "Statistic=" annotation (Count, Mean, StdDev, Min, Max, or a
+# percentile such as P50) before the yearly values.  It can be read by the other scripts that
+# read results files, such as RenderGraphs.py and CompareRunResults.py.
+
+
+# File Names
+# ----------
+RunResultsFile = "RunResults.tsv" # The results file to summarize (it may be pruned; see PruneRunResults.py)
+SummariesFile = "RunResultsSummaries.tsv" # The desired filename for the summaries
+
+
+# Groups
+# ------
+# The names of the annotations whose values define the groups of runs summarized separately.
+# In results from CreateCombinationsScript.py, the annotations are the ShortNames of the
+# policies, so ["Carbon-free Electricity Standard"] summarizes the runs with each setting of
+# that policy separately.  Leave the list empty to summarize all runs together.  Runs without
+# one of the annotations are grouped with an empty value for it.
+GroupBy = []
+
+
+# Statistics
+# ----------
+Variables = [] # The variables to summarize (leave empty to summarize every variable in the file)
+Years = [] # The years to summarize (leave empty to summarize every year)
+Percentiles = [5, 25, 50, 75, 95] # The percentiles of each variable's values to report
+Compression = 100 # Larger values make the percentiles more accurate, but take more time and memory.  Percentiles are exact for groups of up to this many runs.
+
+
+# Other Settings
+# --------------
+Workers = 0 # The number of processes reading the file at once.  Use 0 for one per processor.
+PartsPerWorker = 4 # The file is divided into this many parts for each process, so the processes finish at about the same time
+MinimumPartBytes = 4000000 # Smaller files are divided into fewer parts (a part has some fixed costs)
+
+
+import multiprocessing
+import os
+import time
+import RunResultsReader
+from StreamingStatistics import MergeableSeriesSummary
+
+
+# Summarizing Part of the File
+# ----------------------------
+# Each part is summarized in a separate process.  Rows of the same run are consecutive and
+# share their Annotations (the same tuple), so each run's group is only found once.  This
+# returns a dictionary mapping (Group, Variable) to a MergeableSeriesSummary, where Group is
+# the tuple of values of the GroupBy annotations, in the order the rows first appear.
+def SummarizePart(Task):
+
+	FileName, Start, End, FileYears, BaselineValues, GroupBy, Variables, YearPositions, Compression = Task
+	Summaries = {}
+	PreviousAnnotations = None
+	Group = None
+	AllYears = YearPositions == list(range(len(FileYears)))
+	for RowYears, Variable, Annotations, Values in RunResultsReader.IterateRunResultsPart(FileName, Start, End, FileYears, BaselineValues):
+		if Variables and Variable not in Variables:
+			continue
+		if Annotations is not PreviousAnnotations:
+			PreviousAnnotations = Annotations
+			Group = tuple(RunResultsReader.AnnotationValue(Annotations, Name, "") for Name in GroupBy)
+		Summary = Summaries.get((Group, Variable))
+		if Summary is None:
+			Summary = Summaries[(Group, Variable)] = MergeableSeriesSummary(len(YearPositions), Compression)
+		Summary.Add(Values if AllYears else [Values[Position] for Position in YearPositions])
+	for Summary in Summaries.values():
+		Summary.Flush()
+	return Summaries
+
+def MergeSummaries(Summaries, PartSummaries):
+	for Key, Summary in PartSummaries.items():
+		if Key in Summaries:
+			Summaries[Key].Merge(Summary)
+		else:
+			Summaries[Key] = Summary
+
+
+# Writing the Summaries
+# ---------------------
+# The rows for each group and statistic are written together, so each looks like one run to
+# scripts that read results files.
+def WriteSummaries(Summaries, SummaryYears, GroupBy, Percentiles, FileName):
+	Groups = []
+	GroupVariables = {}
+	for Group, Variable in Summaries:
+		if Group not in GroupVariables:
+			Groups.append(Group)
+			GroupVariables[Group] = []
+		GroupVariables[Group].append(Variable)
+
+	Statistics = [("Count", lambda Summary: Summary.Count()), ("Mean", lambda Summary: Summary.Mean()), ("StdDev", lambda Summary: Summary.StandardDeviation()),
+		("Min", lambda Summary: Summary.Minimum()), ("Max", lambda Summary: Summary.Maximum())]
+	Statistics += [("P" + format(Percent, "g"), lambda Summary, Percent=Percent: Summary.Percentile(Percent)) for Percent in Percentiles]
+	with open(FileName, 'w') as f:
+		for GroupNumber, Group in enumerate(Groups):
+			GroupColumns = "".join("\t" + Name + "=" + Value for Name, Value in zip(GroupBy, Group))
+			if GroupNumber == 0:
+				f.write("Time" + GroupColumns + "\tStatistic=Count\t" + "\t".join(str(Year) for Year in SummaryYears) + "\n")
+			for Statistic, Calculate in Statistics:
+				for Variable in GroupVariables[Group]:
+					f.write(Variable + GroupColumns + "\tStatistic=" + Statistic + "\t" + "\t".join("%.6g" % Value for Value in Calculate(Summaries[(Group, Variable)])) + "\n")
+	return len(Groups)
+
+
+if __name__ == "__main__":
+
+	Start = time.perf_counter()
+	FileYears, BaselineValues = RunResultsReader.ReadFirstRun(RunResultsFile)
+	SummaryYears = Years if Years else FileYears
+	YearPositions = RunResultsReader.YearPositions(FileYears, SummaryYears)
+
+	NumWorkers = Workers if Workers > 0 else (os.cpu_count() or 1)
+	NumParts = max(1, min(NumWorkers * PartsPerWorker, os.path.getsize(RunResultsFile) // MinimumPartBytes))
+	Tasks = [(RunResultsFile, PartStart, PartEnd, FileYears, BaselineValues, GroupBy, set(Variables), YearPositions, Compression) for PartStart, PartEnd in RunResultsReader.FileParts(RunResultsFile, NumParts)]
+
+	# The parts' summaries are merged in order as they arrive, so the groups and variables keep
+	# the order in which they appear in the file.
+	Summaries = {}
+	if NumWorkers == 1 or len(Tasks) == 1:
+		for Task in Tasks:
+			MergeSummaries(Summaries, SummarizePart(Task))
+	else:
+		with multiprocessing.get_context("spawn").Pool(min(NumWorkers, len(Tasks))) as Pool:
+			for PartSummaries in Pool.imap(SummarizePart, Tasks):
+				MergeSummaries(Summaries, PartSummaries)
+
+	MissingVariables = [Variable for Variable in Variables if not any(Key[1] == Variable for Key in Summaries)]
+	if MissingVariables:
+		print("These variables are not in " + RunResultsFile + ": " + ", ".join(MissingVariables))
+	NumGroups = WriteSummaries(Summaries, SummaryYears, GroupBy, Percentiles, SummariesFile)
+	print("Summarized " + str(len(set(Variable for Group, Variable in Summaries))) + " variables in " + str(NumGroups) + " groups from " + RunResultsFile + " (in " + str(len(Tasks)) + " parts) in " + format(time.perf_counter() - Start, ".1f") + " seconds.")
@@ -0,0 +1,396 @@
+# CompareRunResults.py
+#
+# This is a Python script that compares two sets of results from the same runs, such as the
+# results of the standard scenarios before and after a new release of the model or its input
+# data.  The results may be from any of the generated command scripts: the separate files
+# written by the script from CreateDataLoggingScript.py, a combinations batch, a contribution
+# test, and so on.  For each pair of files, every row (a variable in a run) in the baseline
+# file is matched with the row for the same variable in the same run (the run being identified
+# by its annotations) in the candidate file, and the values in every year are compared.
+#
+# The script writes the changed variables, ranked by the size of their largest change, and a
+# summary for each sector of the model.  It also prints the runs and variables that are found
+# in only one of the files.
+#
+# Speed
+# -----
+# The two files are read side by side, one row at a time, so files of any size can be compared
+# without holding them in memory.  Rows written in the same order in both files (as they are
+# when the same command script produced both) are compared as soon as they are read; rows that
+# appear in a different order are held until their partner is found.  Most rows are usually
+# identical, so the values are first compared as text, and only rows whose text differs are
+# converted to numbers and compared year by year.  Large files are split into pieces that are
+# compared at the same time by several processes (see "Splitting the Files into Pieces").
+#
+# Sectors
+# -------
+# Many output variables are defined in views that gather outputs from the whole model, so a
+# variable's view doesn't always say which sector it describes.  Each row is assigned to the
+# first sector whose SectorKeywords appear in the row's name (including its subscripts, such
+# as "[transportation sector]"), or otherwise to the sector of the view in which the model
+# defines the variable (as in ProfileModelEquations.py).  Rows that match neither are grouped
+# as "Economy-wide".
+
+
+# File Names
+# ----------
+# Each entry is a pair of results files to compare: the baseline file first, then the
+# candidate.  For results from CreateDataLoggingScript.py, list one pair for each scenario.
+ComparedFiles = [
+	("Baseline/NoSettings.tsv", "NoSettings.tsv"),
+	("Baseline/Scenario_Example.tsv", "Scenario_Example.tsv"),
+	("Baseline/Scenario_MEIMTarget.tsv", "Scenario_MEIMTarget.tsv")
+]
+ModelFile = "EPS.mdl" # The model file, used to find the sector of each variable
+ComparisonFile = "ResultsComparison.tsv" # The desired filename of the TSV file listing the changed variables
+SectorComparisonFile = "ResultsComparisonBySector.tsv" # The desired filename of the TSV file summarizing the changes in each sector
+
+
+# Tolerance
+# ---------
+# A value is treated as changed if it differs from the baseline value by more than
+# AbsoluteTolerance plus RelativeTolerance times the size of the baseline value.  Vensim writes
+# about six significant figures, so smaller differences are usually just rounding.
+AbsoluteTolerance = 0
+RelativeTolerance = 1e-5
+
+
+# Other Settings
+# --------------
+RankBy = "relative" # "relative" or "absolute": how the changed variables are ranked
+Workers = 0 # The number of processes comparing pieces of large files at once.  Use 0 for one per processor.
+IgnoredAnnotations = [] # Annotations that don't identify a run (such as "CurrentRunNumber", if the two batches numbered their runs differently)
+SectorKeywords = {
+	"Transportation": ["transportation", "vehicle", "vehicles", "LDVs", "HDVs", "aircraft", "rail", "ships", "motorbikes", "passenger", "freight"],
+	"Electricity Supply": ["electricity sector", "electricity generation", "power plants", "curtailed electricity"],
+	"Buildings": ["buildings", "building", "residential", "commercial", "distributed solar", "components"],
+	"Industry": ["industry", "industrial", "process emissions", "agriculture", "waste management"],
+	"Hydrogen Supply": ["hydrogen"],
+	"District Heating": ["district heat"],
+	"Land Use and Forestry": ["LULUCF", "land use", "forestry"],
+	"Fuels": ["petroleum", "coal", "biofuels", "natural gas"]
+} # Words (matched as whole words, ignoring case) that assign a row to a sector
+
+
+import itertools
+import math
+import multiprocessing
+import os
+import re
+import time
+import ModelIndex
+from ProfileModelEquations import Sector
+from RunResultsReader import ParseAnnotations, ParseValue, BaselineReference, BaselineRow, TimeRowYears, Encoding, ReadFirstRun, FileParts, ReadLines
+
+
+# Sectors
+# -------
+# Views that collect outputs from the whole model don't identify a sector.
+ReportingViews = ["Web Application Support Variables", "Additional Outputs", "Cost Outputs", "Cumulators", "Debugging Assistance", "(no view)"]
+OtherSector = "Economy-wide"
+
+SectorPatterns = [(SectorName, re.compile(r"\b(" + "|".join(re.escape(Keyword) for Keyword in Keywords) + r")\b", re.I)) for SectorName, Keywords in SectorKeywords.items()]
+
+# This returns a function that finds the sector of a row from its name, remembering each name's
+# sector, since the same rows appear in every run.
+def SectorFinder(Index):
+	Sectors = {}
+	def RowSector(RowName):
+		if RowName not in Sectors:
+			Matches = [(Match.start(), SectorName) for SectorName, Pattern in SectorPatterns for Match in [Pattern.search(RowName)] if Match]
+			if Matches:
+				Sectors[RowName] = min(Matches)[1]
+			else:
+				Variable = ModelIndex.FindVariable(Index, RowName) if Index is not None else None
+				ViewSector = Sector(Variable["View"]) if Variable is not None else None
+				Sectors[RowName] = ViewSector if ViewSector is not None and ViewSector not in ReportingViews else OtherSector
+		return Sectors[RowName]
+	return RowSector
+
+
+# Comparing Rows
+# --------------
+# Changes are ranked by their relative or absolute difference, according to RankBy.
+RankPosition = 0 if RankBy == "relative" else 1
+
+# Converting a whole row at once is faster, unless it has entries that aren't numbers.
+def ParseValues(Texts):
+	try:
+		return list(map(float, Texts))
+	except ValueError:
+		return [ParseValue(Text) for Text in Texts]
+
+# This compares one row's values (as text) in the years the two files share, given as a list of
+# (Year, Baseline Position, Candidate Position).  It returns None if no value changed, or
+# (Largest Relative Difference, Largest Absolute Difference, Year of the largest change,
+# Baseline Value, Candidate Value) otherwise.  A value that is missing (":NA:") in only one of
+# the files is an infinitely large change.
+def CompareValues(BaselineText, CandidateText, YearPairs, SameYears):
+	if SameYears:
+		if BaselineText == CandidateText:
+			return None
+		Baselines = ParseValues(BaselineText)
+		Candidates = ParseValues(CandidateText)
+	else:
+		Baselines = ParseValues([BaselineText[Position] for Year, Position, CandidatePosition in YearPairs])
+		Candidates = ParseValues([CandidateText[CandidatePosition] for Year, Position, CandidatePosition in YearPairs])
+	Changed = [Position for Position, (Baseline, Candidate) in enumerate(zip(Baselines, Candidates))
+		if not abs(Candidate - Baseline) <= AbsoluteTolerance + RelativeTolerance * abs(Baseline) and (Baseline == Baseline or Candidate == Candidate)]
+	Largest = None
+	for Position in Changed:
+		Baseline, Candidate = Baselines[Position], Candidates[Position]
+		Difference = abs(Candidate - Baseline) if Baseline == Baseline and Candidate == Candidate else math.inf
+		Relative = Difference / abs(Baseline) if Baseline != 0 and Baseline == Baseline else math.inf
+		Change = (Relative, Difference, YearPairs[Position][0], Baseline, Candidate)
+		if Largest is None or Change[RankPosition] > Largest[RankPosition]:
+			Largest = Change
+	return Largest
+
+# This lists (Year, Baseline Position, Candidate Position) for the years in both files.
+def MatchYears(BaselineYears, CandidateYears):
+	if BaselineYears is None or CandidateYears is None:
+		raise ValueError("One of the results files has no \"Time\" row, so its years can't be matched with the other file's years.")
+	CandidatePositions = {Year: Position for Position, Year in enumerate(CandidateYears)}
+	return [(Year, Position, CandidatePositions[Year]) for Position, Year in enumerate(BaselineYears) if Year in CandidatePositions]
+
+
+# Reading the Files Side by Side
+# ------------------------------
+# Files are read as bytes, with the helpers in RunResultsReader.py for reading parts of a file,
+# so they can be split into pieces at any line (see below), and rows are only decoded when they
+# need to be parsed.
+BaselineMarker = ("\t" + BaselineReference).encode()
+
+# This returns the years from a file's first "Time" row and the text of the values of each
+# variable in its first run (the baseline run, in pruned files), which every piece of the file
+# needs.
+def FileStart(FileName):
+	Years, BaselineValues = ReadFirstRun(FileName, AsText=True)
+	return Years, {Variable: "\t".join(Values).encode(Encoding) for Variable, Values in BaselineValues.items()}
+
+# This yields (Years, Line) for every row between the Start and End positions of a file, other
+# than "Time" rows, with the values of the baseline run written out in place of any "@BAU"
+# reference (see RunResultsReader.py), so rows from pruned and unpruned files can be compared.
+def ReadRows(FileName, Start, End, Years, BaselineText):
+	for Line in ReadLines(FileName, Start, End, Decode=False):
+		Line = Line.rstrip(b"\r\n")
+		if not Line.strip():
+			continue
+		if Line.endswith(BaselineMarker):
+			Variable = Line[:Line.index(b"\t")].strip().decode(Encoding)
+			Line = Line[:-len(BaselineReference)] + BaselineRow(BaselineText, Variable, FileName)
+		if Line.startswith(b"Time\t"):
+			Years = TimeRowYears(Line.decode(Encoding).split("\t"))
+			continue
+		yield Years, Line
+
+# This returns (Variable, Annotations, Values) for a row, with the values as text.  Every row
+# of a run has the same annotation columns, so their parsed Annotations are remembered (for up
+# to MaxRememberedRuns runs at a time).
+MaxRememberedRuns = 10000
+RememberedAnnotations = {}
+
+def ParseLine(Years, Line):
+	Fields = Line.decode(Encoding).split("\t")
+	if Years is None or len(Fields) - len(Years) < 1:
+		Annotations, ValuesStart = ParseAnnotations(Fields, None if Years is None else len(Years))
+		return Fields[0].strip(), Annotations, Fields[ValuesStart:]
+	ValuesStart = len(Fields) - len(Years)
+	AnnotationText = "\t".join(Fields[1:ValuesStart])
+	if AnnotationText not in RememberedAnnotations:
+		if len(RememberedAnnotations) >= MaxRememberedRuns:
+			RememberedAnnotations.clear()
+		RememberedAnnotations[AnnotationText] = ParseAnnotations(Fields, len(Years))[0]
+	return Fields[0].strip(), RememberedAnnotations[AnnotationText], Fields[ValuesStart:]
+
+def RowKey(Variable, Annotations):
+	return (tuple((Name, Value) for Name, Value in Annotations if Name not in IgnoredAnnotations), Variable)
+
+def RunLabel(Annotations):
+	return ", ".join(Name + "=" + Value if Name else Value for Name, Value in Annotations) or "(unlabeled run)"
+
+
+# Comparing Pieces of the Files
+# -----------------------------
+# For each variable, the comparison keeps a summary: [Runs Compared, Runs Changed, Largest
+# Change, Run with the Largest Change].  This adds the comparison of one row to the summaries.
+def AddComparison(Variables, Variable, RunText, BaselineRow, CandidateRow, YearMatches):
+	YearsKey = (id(BaselineRow[0]), id(CandidateRow[0]))
+	if YearsKey not in YearMatches:
+		YearMatches[YearsKey] = (MatchYears(BaselineRow[0], CandidateRow[0]), BaselineRow[0] == CandidateRow[0])
+	Change = CompareValues(BaselineRow[1], CandidateRow[1], *YearMatches[YearsKey])
+	Summary = Variables.setdefault(Variable, [0, 0, None, None])
+	Summary[0] += 1
+	if Change is not None:
+		Summary[1] += 1
+		if Summary[2] is None or Change[RankPosition] > Summary[2][RankPosition]:
+			Summary[2] = Change
+			Summary[3] = RunText
+
+# This compares a piece of the baseline file with the corresponding piece of the candidate file
+# (each given as (Start, End, Years, BaselineText)).  Rows whose text is identical in both files
+# are only counted.  Other rows are matched by their key, holding each row until its partner is
+# read, and compared value by value.  It returns the summaries of the variables and the rows
+# left without a partner, as a dictionary for each file mapping each row's key to its (Years,
+# Values), so rows that are in different pieces of the two files can be matched afterward.
+def ComparePieces(BaselineFile, BaselinePiece, CandidateFile, CandidatePiece):
+
+	Variables = {}
+	Pending = ({}, {})
+	YearMatches = {}
+	Rows = itertools.zip_longest(ReadRows(BaselineFile, *BaselinePiece), ReadRows(CandidateFile, *CandidatePiece))
+	for BaselineLine, CandidateLine in Rows:
+		if BaselineLine is not None and CandidateLine is not None and BaselineLine[1] == CandidateLine[1] and BaselineLine[0] == CandidateLine[0]:
+			Line = BaselineLine[1]
+			Variables.setdefault(Line[:Line.index(b"\t")].strip().decode(Encoding), [0, 0, None, None])[0] += 1
+			continue
+		for Side, Line in enumerate((BaselineLine, CandidateLine)):
+			if Line is None:
+				continue
+			Variable, Annotations, Values = ParseLine(*Line)
+			Key = RowKey(Variable, Annotations)
+			if Key in Pending[1 - Side]:
+				Other = Pending[1 - Side].pop(Key)
+				Rows = ((Line[0], Values), Other) if Side == 0 else (Other, (Line[0], Values))
+				AddComparison(Variables, Variable, BaselineFile + ": " + RunLabel(Annotations), *Rows, YearMatches)
+			else:
+				Pending[Side][Key] = (Line[0], Values)
+	return Variables, Pending
+
+def ComparePiecesInWorker(Arguments):
+	return ComparePieces(*Arguments)
+
+
+# Splitting the Files into Pieces
+# -------------------------------
+# Large files are compared in pieces of about PieceBytes, in separate processes.  The baseline
+# file is split into parts as RunResultsReader.py splits files to read them in parallel, and the
+# candidate file is split at the same rows, each of which is looked for near the same fraction of
+# the way through the file.  (If a row isn't found, the candidate is split at that fraction; the
+# rows then left without a partner in their own pieces are matched once all the pieces are done.)
+PieceBytes = 32 * 1024 * 1024
+SearchBytes = 4 * 1024 * 1024
+
+def NextLineStart(ResultsFile, Position):
+	ResultsFile.seek(Position)
+	if Position > 0:
+		ResultsFile.readline()
+	return ResultsFile.tell()
+
+# The beginning of a row, up to its values, identifies the row.
+def RowStart(Line, Years):
+	if Line.rstrip().endswith(BaselineMarker) or Years is None:
+		return Line[:Line.rfind(b"\t") + 1]
+	Fields = Line.split(b"\t")
+	return b"\t".join(Fields[:max(1, len(Fields) - len(Years))]) + b"\t"
+
+def SplitFiles(BaselineFile, CandidateFile, Years):
+	BaselineSize = os.path.getsize(BaselineFile)
+	CandidateSize = os.path.getsize(CandidateFile)
+	Boundaries = [(0, 0)]
+	with open(BaselineFile, 'rb') as Baseline, open(CandidateFile, 'rb') as Candidate:
+		for BaselineStart, BaselineEnd in FileParts(BaselineFile, max(1, round(BaselineSize / PieceBytes)))[1:]:
+			Baseline.seek(BaselineStart)
+			Row = RowStart(Baseline.readline(), Years)
+			Estimate = NextLineStart(Candidate, BaselineStart * CandidateSize // BaselineSize)
+			WindowStart = max(0, Estimate - SearchBytes // 2)
+			Candidate.seek(WindowStart)
+			Found = Candidate.read(SearchBytes).find(b"\n" + Row)
+			CandidateStart = WindowStart + Found + 1 if Found >= 0 else Estimate
+			if BaselineStart > Boundaries[-1][0] and CandidateStart >= Boundaries[-1][1]:
+				Boundaries.append((BaselineStart, CandidateStart))
+	Boundaries.append((BaselineSize, CandidateSize))
+	return [(Boundaries[Piece], Boundaries[Piece + 1]) for Piece in range(len(Boundaries) - 1)]
+
+# This compares one pair of files, adding to the summaries of the Variables and to the lists of
+# runs found in only one of the files.  It returns the number of rows compared.
+def CompareFiles(BaselineFile, CandidateFile, Variables, OnlyIn, Pool):
+
+	BaselineStart = FileStart(BaselineFile)
+	CandidateStart = FileStart(CandidateFile)
+	Tasks = [(BaselineFile, (Piece[0], Next[0]) + BaselineStart, CandidateFile, (Piece[1], Next[1]) + CandidateStart)
+		for Piece, Next in SplitFiles(BaselineFile, CandidateFile, BaselineStart[0])]
+	if len(Tasks) > 1 and Pool is not None:
+		Results = Pool.imap(ComparePiecesInWorker, Tasks)
+	else:
+		Results = (ComparePieces(*Task) for Task in Tasks)
+
+	Pending = ({}, {})
+	YearMatches = {}
+	Compared = 0
+	for PieceVariables, PiecePending in Results:
+		for Variable, Summary in PieceVariables.items():
+			Compared += Summary[0]
+			Total = Variables.setdefault(Variable, [0, 0, None, None])
+			Total[0] += Summary[0]
+			Total[1] += Summary[1]
+			if Summary[2] is not None and (Total[2] is None or Summary[2][RankPosition] > Total[2][RankPosition]):
+				Total[2], Total[3] = Summary[2], Summary[3]
+		for Side in (0, 1):
+			for Key, Row in PiecePending[Side].items():
+				if Key in Pending[1 - Side]:
+					Compared += 1
+					Rows = (Row, Pending[1 - Side].pop(Key)) if Side == 0 else (Pending[1 - Side].pop(Key), Row)
+					AddComparison(Variables, Key[1], BaselineFile + ": " + RunLabel(Key[0]), *Rows, YearMatches)
+				else:
+					Pending[Side][Key] = Row
+
+	for Side, FileName in enumerate((BaselineFile, CandidateFile)):
+		for Annotations, Variable in Pending[Side]:
+			OnlyIn[Side].setdefault(FileName, set()).add(RunLabel(Annotations))
+	return Compared
+
+
+if __name__ == "__main__":
+
+	if RankBy not in ("relative", "absolute"):
+		raise ValueError("RankBy must be \"relative\" or \"absolute\", not \"" + str(RankBy) + "\".")
+	try:
+		RowSector = SectorFinder(ModelIndex.LoadModelIndex(ModelFile))
+	except OSError:
+		print("The model file " + ModelFile + " could not be read, so sectors are assigned by SectorKeywords only.")
+		RowSector = SectorFinder(None)
+
+	# For each variable, we keep the number of runs in which it was compared and in which it
+	# changed, its largest change, and the run with that change.
+	Start = time.perf_counter()
+	Variables = {}
+	Compared = 0
+	OnlyIn = ({}, {})
+	Pool = None
+	if any(os.path.getsize(BaselineFile) > 2 * PieceBytes for BaselineFile, CandidateFile in ComparedFiles):
+		Pool = multiprocessing.get_context("spawn").Pool(Workers if Workers > 0 else None)
+	try:
+		for BaselineFile, CandidateFile in ComparedFiles:
+			Compared += CompareFiles(BaselineFile, CandidateFile, Variables, OnlyIn, Pool)
+	finally:
+		if Pool is not None:
+			Pool.terminate()
+
+	Changed = sorted((Variable for Variable in Variables if Variables[Variable][1] > 0), key=lambda Variable: Variables[Variable][2][RankPosition], reverse=True)
+	with open(ComparisonFile, 'w') as f:
+		f.write("Rank\tVariable\tSector\tRuns Compared\tRuns Changed\tLargest Relative Difference\tLargest Absolute Difference\tYear\tBaseline Value\tCandidate Value\tRun\n")
+		for Rank, Variable in enumerate(Changed, start=1):
+			RunsCompared, RunsChanged, Change, Run = Variables[Variable]
+			f.write(str(Rank) + "\t" + Variable + "\t" + RowSector(Variable) + "\t" + str(RunsCompared) + "\t" + str(RunsChanged))
+			f.write("".join("\t" + str(Value) for Value in Change) + "\t" + Run + "\n")
+
+	Sectors = {}
+	for Variable, (RunsCompared, RunsChanged, Change, Run) in Variables.items():
+		SectorSummary = Sectors.setdefault(RowSector(Variable), [0, 0, 0, None])
+		SectorSummary[0] += 1
+		if RunsChanged:
+			SectorSummary[1] += 1
+			SectorSummary[2] += RunsChanged
+			if SectorSummary[3] is None or Change[RankPosition] > SectorSummary[3][0]:
+				SectorSummary[3] = (Change[RankPosition], Variable)
+	with open(SectorComparisonFile, 'w') as f:
+		f.write("Sector\tVariables Compared\tVariables Changed\tChanged Rows\tLargest " + RankBy.capitalize() + " Difference\tVariable with the Largest Difference\n")
+		for SectorName, (VariablesCompared, VariablesChanged, RowsChanged, Largest) in sorted(Sectors.items(), key=lambda Item: -1 if Item[1][3] is None else Item[1][3][0], reverse=True):
+			f.write(SectorName + "\t" + str(VariablesCompared) + "\t" + str(VariablesChanged) + "\t" + str(RowsChanged))
+			f.write("\t" + ("" if Largest is None else str(Largest[0]) + "\t" + Largest[1]) + "\n")
+
+	print("Compared " + str(Compared) + " rows in " + format(time.perf_counter() - Start, ".1f") + " seconds: " + str(len(Changed)) + " of " + str(len(Variables)) + " variables changed.")
+	for Side, Label in enumerate(("baseline", "candidate")):
+		for FileName, Runs in OnlyIn[Side].items():
+			print(str(len(Runs)) + " runs (or some of their variables) are only in the " + Label + " file " + FileName + ", such as " + sorted(Runs)[0] + ".")
@@ -0,0 +1,258 @@
+# CreateAdaptiveSweepScript.py
+#
+# This is a Python script that is used to generate Vensim command scripts that trace how the
+# model's outputs respond to the setting of each of several policies (a "response curve"),
+# using far fewer runs than testing a fine, evenly spaced list of settings.  Each swept policy
+# is run on its own (with every other policy at its BAU setting), starting with the settings
+# listed for it below.  After each round of runs, settings are added only between neighboring
+# settings where the outputs curve (where the value at a setting differs from a straight line
+# through the settings on either side) or where an output crosses one of the Thresholds.
+# Where the response is a straight line, no further runs are spent.
+#
+# Each time you run this script, it reads the results of the previous round from the
+# RunResultsFile, adds them to the SweepHistoryFile, and writes a new command script
+# containing only the runs needed next.  Run the script, run the generated command script in
+# Vensim, and repeat until the script reports that it has finished.  The response curves
+# found so far are written to the ResponseCurvesFile after each round.  Delete the
+# SweepHistoryFile to start over.
+
+
+# File Names
+# ----------
+ModelFile = "EPS.mdl" # The name of the Vensim model file (typically with .mdl or .vpm extension)
+OutputScript = "GeneratedAdaptiveSweepScript.cmd" # The desired filename of the Vensim command script to be generated
+RunResultsFile = "AdaptiveSweepResults.tsv" # The desired filename for TSV file containing model run results (replaced each round)
+OutputVarsFile = "OutputVarsToExport.lst" # The name of the file containing a list of variables to be included in the RunResultsFile
+SweepHistoryFile = "AdaptiveSweepHistory.tsv" # The response variables' values in every run so far.  Delete it to start over.
+ResponseCurvesFile = "AdaptiveSweepCurves.tsv" # The desired filename of the TSV file containing the response curves
+
+
+# Other Settings
+# --------------
+RunName = "MostRecentRun" # The desired name for all runs performed.  Used as the filename for the VDF files that Vensim creates.
+PolicySchedule = 1 # The number of the policy implementation schedule file to be used (in InputData/plcy-schd/FoPITY)
+
+
+# Response Variables
+# ------------------
+# The outputs whose response curves are traced, as (Variable, Year) pairs.  The variables must
+# be in the OutputVarsFile.  Settings are added wherever any of these outputs curves or crosses
+# a threshold.
+ResponseVariables = [
+	("Output Cumulative Total CO2e Emissions", 2050),
+	("Output First Year NPV of CapEx and OpEx through This Year with Revenue Neutral Taxes and Subsidies", 2050)
+]
+
+# Settings are also added between neighboring settings on either side of any of these values,
+# as (Variable, Year, Value) entries, so the setting at which an output reaches a target can be
+# read from the response curve.  The Variable and Year must be one of the ResponseVariables.
+Thresholds = []
+
+
+# Refinement Settings
+# -------------------
+CurvatureTolerance = 0.02 # Settings are added around a setting whose output differs from the straight line through its neighbors by more than this fraction of the output's range
+MinimumSpacing = 1/64 # Settings closer together than this fraction of a policy's range of settings are never added
+MaxRunsPerRound = 40 # The largest number of runs in each generated command script
+MaxRounds = 8 # The sweep finishes after this many rounds, even if the response curves could be refined further
+
+
+# Index definitions
+# -----------------
+# Each policy is a Python list, in the same format as in CreateCombinationsScript.py.  Do not
+# change any names or numbers in this section.
+Enabled = 0
+LongName = 1
+ShortName = 2
+Settings = 3
+Group = 4 # Groups are not used in this script
+
+
+# Swept Policies
+# --------------
+# Enable the policies whose response curves you wish to trace.  The settings listed for each
+# policy are the settings of the first round.  The lowest and highest settings set the range of
+# the sweep, so list at least two; listing three or more lets the first round detect curvature.
+# Copy additional policies from CreateCombinationsScript.py as needed.
+SweptPolicies = (
+	(False,"Percentage Additional Improvement of Fuel Economy Std[passenger,LDVs]","Fuel Economy Standard - Passenger LDVs",[0,0.5,1],"Vehicle Fuel Economy Standards"),
+	(False,"Renewable Portfolio Std Percentage","Carbon-free Electricity Standard",[0,0.5,1],"Carbon-free Electricity Standard"),
+	(True,"Additional Carbon Tax Rate[electricity sector]","Domestic Carbon Pricing - Electricity Sector",[0,100,200,400],"Carbon Pricing"),
+	(True,"Additional Carbon Tax Rate[industry sector]","Domestic Carbon Pricing - Industry Sector",[0,100,200,400],"Carbon Pricing")
+)
+
+
+import os
+import EPSScriptGenerators
+from RunResultsReader import IterateRunResults, AnnotationValue
+
+
+# Sweep History
+# -------------
+# The sweep history records the response variables' values in every run so far.  It is a
+# dictionary mapping (Round, ShortName, Setting) to a dictionary mapping each (Variable, Year)
+# pair to its value.
+def ReadSweepHistory():
+	History = {}
+	if os.path.exists(SweepHistoryFile):
+		with open(SweepHistoryFile, 'r') as HistoryFile:
+			next(HistoryFile)
+			for Line in HistoryFile:
+				Round, Policy, Setting, Variable, Year, Value = Line.rstrip("\n").split("\t")
+				History.setdefault((int(Round), Policy, float(Setting)), {})[(Variable, int(Year))] = float(Value)
+	return History
+
+def WriteSweepHistory(History):
+	with open(SweepHistoryFile, 'w') as HistoryFile:
+		HistoryFile.write("Round\tPolicy\tSetting\tVariable\tYear\tValue\n")
+		for Round, Policy, Setting in sorted(History):
+			for Variable, Year in sorted(History[(Round, Policy, Setting)]):
+				HistoryFile.write(str(Round) + "\t" + Policy + "\t" + str(Setting) + "\t" + Variable + "\t" + str(Year) + "\t" + str(History[(Round, Policy, Setting)][(Variable, Year)]) + "\n")
+
+# This adds the runs from the most recent round (found in the RunResultsFile) to the history.
+# Runs already in the history are skipped.
+def AddResultsToHistory(History):
+	if not os.path.exists(RunResultsFile):
+		return
+	Variables = set(Variable for Variable, Year in ResponseVariables)
+	NewRuns = {}
+	for Years, Variable, Annotations, Values in IterateRunResults(RunResultsFile):
+		Round = AnnotationValue(Annotations, "SweepRound")
+		if Round is None or Variable not in Variables:
+			continue
+		RunKey = (int(Round), AnnotationValue(Annotations, "SweptPolicy"), float(AnnotationValue(Annotations, "Setting")))
+		if RunKey in History:
+			continue
+		for ResponseVariable, Year in ResponseVariables:
+			if ResponseVariable == Variable:
+				if Year not in Years:
+					raise ValueError(str(Year) + " is not one of the years in the RunResultsFile.")
+				NewRuns.setdefault(RunKey, {})[(Variable, Year)] = Values[Years.index(Year)]
+	for RunKey in NewRuns:
+		MissingVariables = [Variable for Variable, Year in ResponseVariables if (Variable, Year) not in NewRuns[RunKey]]
+		if MissingVariables:
+			raise ValueError("The RunResultsFile is missing " + ", ".join(sorted(set(MissingVariables))) + ".  Add the ResponseVariables to the OutputVarsFile.")
+		History[RunKey] = NewRuns[RunKey]
+
+# This returns the response curve of one policy: a list of (Setting, Responses) pairs sorted by
+# setting, where Responses maps each (Variable, Year) pair to its value.
+def ResponseCurve(History, Policy):
+	Curve = {}
+	for Round, ShortNameOfRun, Setting in History:
+		if ShortNameOfRun == Policy[ShortName]:
+			Curve[Setting] = History[(Round, ShortNameOfRun, Setting)]
+	return sorted(Curve.items())
+
+
+# Refinement
+# ----------
+# Added settings are rounded to six significant figures, as they are written in the results.
+def RoundSetting(Setting):
+	return float(format(Setting, ".6g"))
+
+# This returns the settings to add to one policy's response curve, as a list of (Priority,
+# Setting) pairs.  An interval between neighboring settings is split at its midpoint if the
+# setting at either end is off the straight line through its own neighbors, or if an output
+# crosses a threshold within it.  Crossings come first; otherwise, the more an output curves,
+# the higher the priority.  With only two settings, there is nothing to compare with a straight
+# line, so the interval between them is split.
+def SettingsToAdd(Curve):
+
+	Settings = [Setting for Setting, Responses in Curve]
+	Spacing = MinimumSpacing * (Settings[-1] - Settings[0])
+	Priorities = [0] * (len(Settings) - 1)
+	if len(Settings) == 2:
+		Priorities[0] = 1
+
+	for Response in ResponseVariables:
+		Values = [Responses[Response] for Setting, Responses in Curve]
+		Range = max(Values) - min(Values)
+		if Range == 0:
+			continue
+		for Middle in range(1, len(Settings) - 1):
+			Fraction = (Settings[Middle] - Settings[Middle - 1]) / (Settings[Middle + 1] - Settings[Middle - 1])
+			Line = Values[Middle - 1] + Fraction * (Values[Middle + 1] - Values[Middle - 1])
+			Curvature = abs(Values[Middle] - Line) / Range
+			if Curvature > CurvatureTolerance:
+				Priorities[Middle - 1] = max(Priorities[Middle - 1], Curvature)
+				Priorities[Middle] = max(Priorities[Middle], Curvature)
+
+	for Variable, Year, Value in Thresholds:
+		Values = [Responses[(Variable, Year)] for Setting, Responses in Curve]
+		for Interval in range(len(Settings) - 1):
+			if min(Values[Interval], Values[Interval + 1]) < Value < max(Values[Interval], Values[Interval + 1]):
+				Priorities[Interval] = float("inf")
+
+	Added = []
+	for Interval, Priority in enumerate(Priorities):
+		if Priority > 0 and Settings[Interval + 1] - Settings[Interval] >= 2 * Spacing:
+			Added.append((Priority, RoundSetting((Settings[Interval] + Settings[Interval + 1]) / 2)))
+	return Added
+
+
+# Generate Vensim Command Script
+# ------------------------------
+if __name__ == "__main__":
+
+	Policies = EPSScriptGenerators.EnabledPolicies(SweptPolicies)
+	ErrorMessage = None
+	if not Policies:
+		ErrorMessage = "Error: No policies were enabled in the Python script.  Before running the script, you must enable at least one policy."
+	for Policy in Policies:
+		if len(set(Policy[Settings])) < 2:
+			ErrorMessage = "Error: " + Policy[ShortName] + " needs at least two different settings to set the range of its sweep."
+	for Variable, Year, Value in Thresholds:
+		if (Variable, Year) not in ResponseVariables:
+			ErrorMessage = "Error: The threshold for " + Variable + " in " + str(Year) + " is not for one of the ResponseVariables."
+	if ErrorMessage is not None:
+		f = open(OutputScript, 'w')
+		f.write(ErrorMessage)
+		f.close()
+		import sys
+		sys.exit(ErrorMessage)
+
+	History = ReadSweepHistory()
+	AddResultsToHistory(History)
+	WriteSweepHistory(History)
+	Round = max([RunKey[0] for RunKey in History], default=0) + 1
+
+	# Listed settings without results are run first (in the first round, that is all of them).
+	# After that, settings are added where the curves need them, keeping the highest-priority
+	# ones if there are too many.
+	Runs = []
+	Candidates = []
+	for Policy in Policies:
+		Curve = ResponseCurve(History, Policy)
+		Tested = [Setting for Setting, Responses in Curve]
+		Missing = [Setting for Setting in sorted(set(Policy[Settings])) if Setting not in Tested]
+		if Missing:
+			Runs.extend((Policy, Setting) for Setting in Missing)
+		elif Round <= MaxRounds:
+			Candidates.extend((Priority, Policy[ShortName], Setting, Policy) for Priority, Setting in SettingsToAdd(Curve))
+	Candidates.sort(key=lambda Candidate: Candidate[0], reverse=True)
+	Runs.extend((Policy, Setting) for Priority, PolicyName, Setting, Policy in Candidates[:max(0, MaxRunsPerRound - len(Runs))])
+
+	# The response curves have one row per setting, with a column for each response variable.
+	with open(ResponseCurvesFile, 'w') as CurvesFile:
+		CurvesFile.write("Policy\tSetting" + "".join("\t" + Variable + " " + str(Year) for Variable, Year in ResponseVariables) + "\n")
+		for Policy in Policies:
+			for Setting, Responses in ResponseCurve(History, Policy):
+				CurvesFile.write(Policy[ShortName] + "\t" + str(Setting) + "".join("\t" + str(Responses[Response]) for Response in ResponseVariables) + "\n")
+
+	f = open(OutputScript, 'w')
+	if Runs:
+		f.writelines(EPSScriptGenerators.AdaptiveSweepScript(Runs, Round, ModelFile, RunName, RunResultsFile, OutputVarsFile, PolicySchedule))
+		print("Round " + str(Round) + ": " + str(len(Runs)) + " runs written to " + OutputScript + ".")
+	else:
+		# We compare the runs used with the runs an evenly spaced list of settings would need to
+		# match the closest spacing used for each policy.
+		UniformRuns = 0
+		for Policy in Policies:
+			Tested = [Setting for Setting, Responses in ResponseCurve(History, Policy)]
+			Closest = min(High - Low for Low, High in zip(Tested, Tested[1:]))
+			UniformRuns += int(round((Tested[-1] - Tested[0]) / Closest)) + 1
+		Message = ("The sweep has finished after " + str(Round - 1) + " rounds and " + str(len(History)) + " runs (evenly spaced settings would have needed "
+			+ str(UniformRuns) + ").  The response curves are in " + ResponseCurvesFile + ".  No further runs are needed.")
+		f.write(Message)
+		print(Message)
+	f.close()
@@ -35,6 +35,9 @@ OutputVarsFile = "OutputVarsForCarbonCapToTaxScript.lst"	# The name of the file
 # Any carbon tax settings in the ComplementaryPoliciesFile will be ignored.
 # Any policy schedule selection made in the ComplementaryPoliciesFile will be ignored.
 ComplementaryPoliciesFile = "Scenario_EI.cin"
+InlineComplementaryPolicies = True	# If True, the ComplementaryPoliciesFile is read and checked against the model
+									# once, by this script, and its settings are written into every run as SETVALs
+									# (see ScenarioLibrary.py), so Vensim doesn't reread the file for each run
 
 
 # Policy Schedule
@@ -44,6 +47,23 @@ ComplementaryPoliciesFile = "Scenario_EI.cin"
 PolicySchedule = 1
 
 
+# Mode
+# ----
+# "Scan" mode (the default) generates one run for every whole-currency-unit price between
+# PriceFloor and PriceCeiling.  You then look up the price at which covered emissions fall
+# to the cap in the RunResultsFile, one year at a time.
+#
+# "Solve" mode finds the carbon tax lever setting that meets a year-by-year cap trajectory
+# (specified in CapTrajectory below) in a few short iterations, rather than scanning every
+# price.  Each time you run this script in Solve mode, it reads the results of the previous
+# iteration from the RunResultsFile, updates its estimate for every year at once, and writes
+# a new command script containing only the handful of runs needed next.  Run the script, run
+# the generated command script in Vensim, and repeat until the script reports that it has
+# finished.  The price trajectory is written to SolverTrajectoryFile after each iteration.
+# In Solve mode, the floor and ceiling adjustments described below are made automatically.
+CapToTaxMode = "Scan"
+
+
 # Carbon Cap Floor and Ceiling
 # ----------------------------
 # Here, set the lower and upper bounds of the emissions permit prices that you
@@ -73,10 +93,39 @@ PolicySchedule = 1
 # If interested in permit prices in multiple years, FIRST adjust all the floor and
 # celing prices to reflect the carbon tax policy implementation schedule, THEN
 # enter the lowest floor and the highest ceiling prices here.
+#
+# In Solve mode, enter the floor and ceiling permit prices from the carbon cap policy itself,
+# without adjusting them for the implementation schedule.  They may be single values or
+# dictionaries giving a price for each year in the CapTrajectory, such as {2030: 10, 2040: 20}.
 PriceFloor = 10
 PriceCeiling = 15
 
 
+# Carbon Cap Trajectory (Solve Mode Only)
+# ---------------------------------------
+# The cap on emissions from the covered sectors, in million metric tons CO2e, in each year
+# you wish to find the permit price for.  Covered emissions are the sum of the sector emissions
+# variables listed in SectorEmissionsVariables for the covered sectors, so the OutputVarsFile
+# must include those variables.
+CapTrajectory = {
+	2030: 400,
+	2040: 350,
+	2050: 300
+}
+SectorEmissionsVariables = {
+	"transportation sector": "Output Total CO2e Emissions by Sector[transportation sector]",
+	"electricity sector": "Output Total CO2e Emissions by Sector[electricity sector]",
+	"residential buildings sector": "Output Total CO2e Emissions by Sector[residential buildings sector]",
+	"commercial buildings sector": "Output Total CO2e Emissions by Sector[commercial buildings sector]",
+	"industry sector": "Output Industry Sector Excluding Ag and Waste CO2e Emissions"
+}
+SolverHistoryFile = "CapToTaxSolverHistory.tsv" # Covered emissions observed in every solver run so far.  Delete it to start over.
+SolverTrajectoryFile = "CapToTaxTrajectory.tsv" # The solver's current estimate of the permit price in each year
+SolverTolerance = 0.005 # A year is solved when covered emissions are within this fraction of the cap
+SolverLeverResolution = 0.01 # Lever settings are rounded to this increment, and a year is solved once its bracket is this narrow
+SolverMaxRunsPerIteration = 6 # The largest number of runs in each generated command script
+
+
 # Covered Sectors
 # ---------------
 # Enable sectors that are covered under the same carbon cap.
@@ -92,122 +141,361 @@ Sectors = {
 }
 
 
+# Coverage Options (Scan Mode Only)
+# ---------------------------------
+# To compare several pooled-cap coverage options in one batch, list them here, each as a
+# list of covered sectors (e.g. [["electricity sector"], ["electricity sector", "industry sector"]]),
+# or set CoverageSets = "All" to test all 31 non-empty combinations of the five sectors above.
+# Leave the list empty to test only the sectors enabled in the Sectors setting.
+# Runs that are identical for several coverage options (such as runs with a price of zero)
+# are simulated once and exported once for each option that uses them.  The RunResultsFile
+# includes a "CoverageSet" column numbering the options, which are listed in CoverageSetsFile.
+CoverageSets = []
+CoverageSetsFile = "CoverageSets.tsv"
+
+
 # Other Settings
 # --------------
 RunName = "MostRecentRun" # The desired name for all runs performed.  Used as the filename for the VDF files that Vensim creates.
+PreflightCheck = True # If True, the command script is checked against the model and the files it uses, and against the budgets
+					  # for runs, time, and disk space, before it is written.  See ValidateBatch.py.
 
 
 
-# Building the Covered Sector List
-# --------------------------------
-CoveredSectors = []
-for Sector in Sectors:
-	if Sectors[Sector]:
-		CoveredSectors.append(Sector)
+import csv
+import itertools
+import os
+import EPSScriptGenerators
+from RunResultsReader import IterateRunResults, AnnotationValue
 
 
-# Error Checking
-# --------------
-# Give error and exit if no sectors were enabled
-if len(CoveredSectors) < 1:
-	f = open(OutputScript, 'w')
-	ErrorMessage = "Error: No sectors were enabled in the Python script.  Before running the script, you must enable at least one sector."
-	f.write(ErrorMessage)
-	f.close()
-	import sys
-	sys.exit(ErrorMessage)	
-		
-# Give error and exit if price ceiling is not greater than price floor
-if PriceCeiling <= PriceFloor:
-	f = open(OutputScript, 'w')
-	ErrorMessage = "Error: PriceCeiling must be greater than PriceFloor."
-	f.write(ErrorMessage)
-	f.close()
-	import sys
-	sys.exit(ErrorMessage)
+# Solve Mode
+# ----------
+# The carbon tax in each year is the lever setting multiplied by the carbon tax implementation
+# schedule for that year, and covered emissions fall as the lever setting rises.  For each year
+# in the CapTrajectory, we look for the lever setting at which covered emissions equal the cap.
+# Every run produces emissions for all years, so each run narrows the search in every year at
+# once.  For each year, we keep track of the highest lever setting tested that did not meet the
+# cap and the lowest one that did, and we pick the next setting to test by interpolating between
+# them (or by extrapolating, if the cap hasn't been bracketed yet).  The settings needed for all
+# years are then combined into one short batch of runs.
+
+# This reads the carbon tax row of the selected policy implementation schedule file, returning
+# a dictionary mapping each year to the fraction of the policy implemented in that year.
+def ReadCarbonTaxSchedule():
+	ScheduleFile = os.path.join("InputData", "plcy-schd", "FoPITY", "FoPITY-" + str(PolicySchedule) + ".csv")
+	with open(ScheduleFile, 'r', newline='') as ScheduleCSV:
+		Rows = list(csv.reader(ScheduleCSV))
+	Years = [int(float(Year)) for Year in Rows[0][1:] if Year.strip()]
+	for Row in Rows[1:]:
+		if Row and Row[0].strip() == "cross carbon tax":
+			return {Year: float(Value) for Year, Value in zip(Years, Row[1:]) if Value.strip()}
+	raise ValueError(ScheduleFile + " has no \"cross carbon tax\" row.")
+
+# PriceFloor and PriceCeiling may be a single price or a dictionary of prices by year.
+def PriceForYear(Price, Year):
+	if isinstance(Price, dict):
+		return Price[Year]
+	return Price
+
+def RoundLever(LeverSetting):
+	return round(round(LeverSetting / SolverLeverResolution) * SolverLeverResolution, 10)
+
+# The solver history records the covered emissions in each year of every solver run so far.
+# It is a dictionary mapping (Iteration, LeverSetting) to a dictionary of emissions by year.
+def ReadSolverHistory():
+	History = {}
+	if os.path.exists(SolverHistoryFile):
+		with open(SolverHistoryFile, 'r') as HistoryFile:
+			next(HistoryFile)
+			for Line in HistoryFile:
+				Iteration, LeverSetting, Year, Emissions = Line.rstrip("\n").split("\t")
+				History.setdefault((int(Iteration), float(LeverSetting)), {})[int(Year)] = float(Emissions)
+	return History
+
+def WriteSolverHistory(History):
+	with open(SolverHistoryFile, 'w') as HistoryFile:
+		HistoryFile.write("Iteration\tLever Setting\tYear\tCovered Emissions\n")
+		for Iteration, LeverSetting in sorted(History):
+			for Year in sorted(History[(Iteration, LeverSetting)]):
+				HistoryFile.write(str(Iteration) + "\t" + str(LeverSetting) + "\t" + str(Year) + "\t" + str(History[(Iteration, LeverSetting)][Year]) + "\n")
+
+# This adds the runs from the most recent iteration (found in the RunResultsFile) to the history.
+# Only solver runs for the CoveredSectors are used (the runs are labeled with CoveredSectorsText,
+# their names joined by ", "), and runs already in the history are skipped.
+def AddResultsToHistory(History, CoveredSectors, CoveredSectorsText):
+	if not os.path.exists(RunResultsFile):
+		return
+	CoveredVariables = [SectorEmissionsVariables[Sector] for Sector in CoveredSectors]
+	NewRuns = {}
+	for Years, Variable, Annotations, Values in IterateRunResults(RunResultsFile):
+		Iteration = AnnotationValue(Annotations, "SolverIteration")
+		if Iteration is None or AnnotationValue(Annotations, "Covered sectors") != CoveredSectorsText or Variable not in CoveredVariables:
+			continue
+		RunKey = (int(Iteration), float(AnnotationValue(Annotations, "CurrentPrice")))
+		if RunKey in History:
+			continue
+		NewRuns.setdefault(RunKey, {})[Variable] = dict(zip(Years, Values))
+	for RunKey in NewRuns:
+		MissingVariables = [Variable for Variable in CoveredVariables if Variable not in NewRuns[RunKey]]
+		if MissingVariables:
+			raise ValueError("The RunResultsFile is missing " + ", ".join(MissingVariables) + ".  Add the covered sectors' emissions variables to the OutputVarsFile.")
+		History[RunKey] = {Year: sum(NewRuns[RunKey][Variable][Year] for Variable in CoveredVariables) for Year in CapTrajectory}
+
+# This function examines all the runs so far for one year and returns the year's status, the
+# current estimate of the lever setting, the covered emissions in the run nearest that
+# estimate, and the lever setting to test next (None if no further runs are needed).
+def SolveYear(Year, Observations, LowLever, HighLever):
+
+	Cap = CapTrajectory[Year]
+	Closest = min(Observations, key=lambda Observation: abs(Observation[1] - Cap))
+	if abs(Closest[1] - Cap) <= SolverTolerance * Cap and LowLever <= Closest[0] <= HighLever:
+		return "solved", Closest[0], Closest[1], None
+
+	# Runs above the cap had too low a price, and runs at or below the cap had a high enough price.
+	NotMet = sorted(Observation for Observation in Observations if Observation[1] > Cap)
+	Met = sorted(Observation for Observation in Observations if Observation[1] <= Cap)
+
+	# If the cap is met at the price floor, the floor is the permit price.  If the cap is not met
+	# at the price ceiling, the ceiling is the permit price.
+	if Met and Met[0][0] <= LowLever + SolverLeverResolution / 2:
+		return "price floor", LowLever, Met[0][1], None
+	if NotMet and NotMet[-1][0] >= HighLever - SolverLeverResolution / 2:
+		return "price ceiling", HighLever, NotMet[-1][1], None
+
+	if NotMet and Met:
+		(LowSetting, LowEmissions), (HighSetting, HighEmissions) = NotMet[-1], Met[0]
+		if HighSetting - LowSetting <= SolverLeverResolution * 1.5:
+			return "solved", HighSetting, HighEmissions, None
+		NextSetting = LowSetting + (LowEmissions - Cap) * (HighSetting - LowSetting) / (LowEmissions - HighEmissions)
+		NextSetting = min(max(RoundLever(NextSetting), LowSetting + SolverLeverResolution), HighSetting - SolverLeverResolution)
+		return "searching", NextSetting, None, NextSetting
+
+	# The cap hasn't been bracketed yet, so we extrapolate from the two runs nearest the cap
+	# (or go straight to the floor or ceiling if that isn't possible).
+	Nearest = NotMet[-2:] if NotMet else Met[:2]
+	if len(Nearest) == 2 and Nearest[1][1] != Nearest[0][1]:
+		Slope = (Nearest[1][1] - Nearest[0][1]) / (Nearest[1][0] - Nearest[0][0])
+		NextSetting = Nearest[-1 if NotMet else 0][0] + (Cap - Nearest[-1 if NotMet else 0][1]) / Slope
+	else:
+		NextSetting = HighLever if NotMet else LowLever
+	NextSetting = min(max(NextSetting, LowLever), HighLever)
+	if NextSetting not in (LowLever, HighLever):
+		NextSetting = RoundLever(NextSetting)
+	return "searching", NextSetting, None, NextSetting
 
 
 # Generate Vensim Command Script
 # ------------------------------
-# We begin by creating a new file to serve as the Vensim command script (overwriting
-# any older version at that filename).  We then tell Vensim to load
-# the model file, and we give it a RUNNAME that will be used for all runs.  (It is
-# overwritten each run, and the Vensim command file generated by this script
-# always contains multiple runs.)
-f = open(OutputScript, 'w')
-f.write('SPECIAL>LOADMODEL|"' + ModelFile + '"\n')
-f.write("SIMULATE>RUNNAME|" + RunName + "\n")
-
-# The following options may be useful in certain cases, but they cause Vensim to
-# produce an output window for each simulation that acknowledges the completion of
-# the command.  These output windows accumulate over the course of many runs and
-# cause slow-downs (and potentially crashes).  Therefore, these lines are usually
-# best left commented out, unless you are doing only a few runs.
-# f.write("SPECIAL>NOINTERACTION\n")
-# f.write("SIMULATE>SAVELIST|" + OutputVarsFile + "\n")
-f.write("\n")
-
-
-# Only for the first entry in the TSV file, we wish to include the "Time" row and
-# overwrite any existing TSV file of that name.  Other entries append to the TSV file.
-FirstEntryDone = False
-
-
-# We start the price at the price floor, and we will increment by one
-# currency unit with each model run.
-CurrentPrice = PriceFloor
-
-while CurrentPrice <= PriceCeiling:
-
-	# We have to read in the .cin file for every simulation.
-	# Therefore, we have to override its policy implementation schedule setting
-	# and carbon tax policy settings for every simulation.
-	f.write("SIMULATE>READCIN|" + ComplementaryPoliciesFile + "\n")
-	f.write("SIMULATE>SETVAL|Policy Implementation Schedule Selector=" + str(PolicySchedule) + "\n")
-
-	# We check each sector.  If it is enabled, we write a SETVAL command to specify the current price.
-	# If it is not enabled, we write a SETVAL command to set it to zero.
+# The commands for each run are written by functions in EPSScriptGenerators.py, so other
+# Python programs can import them (or this script's settings and solver) without writing a
+# script.  RunSettings holds the settings those functions need for every run.
+if __name__ == "__main__":
+
+	# Building the Covered Sector List
+	# --------------------------------
+	CoveredSectors = []
 	for Sector in Sectors:
 		if Sectors[Sector]:
-			f.write("SIMULATE>SETVAL|Additional Carbon Tax Rate[" + Sector + "]=" + str(CurrentPrice) + "\n")
+			CoveredSectors.append(Sector)
+
+
+	# Building the Coverage Set List
+	# ------------------------------
+	# If CoverageSets is "All", we list every non-empty combination of sectors.  Otherwise, we
+	# drop any coverage option that repeats an earlier one (in any order).
+	if CoverageSets == "All":
+		CoverageSets = [list(Combination) for NumSectors in range(1, len(Sectors) + 1) for Combination in itertools.combinations(Sectors, NumSectors)]
+	UniqueCoverageSets = []
+	for CoverageSet in CoverageSets:
+		CoverageSet = [Sector for Sector in Sectors if Sector in CoverageSet]
+		if CoverageSet not in UniqueCoverageSets:
+			UniqueCoverageSets.append(CoverageSet)
+
+
+	# Error Checking
+	# --------------
+	# Give error and exit if a coverage set names a sector that isn't in the Sectors setting, or has no sectors
+	for CoverageSet in CoverageSets:
+		UnknownSectors = [Sector for Sector in CoverageSet if Sector not in Sectors]
+		if len(CoverageSet) < 1 or UnknownSectors:
+			f = open(OutputScript, 'w')
+			ErrorMessage = "Error: Each entry in CoverageSets must list at least one sector from the Sectors setting.  Unrecognized sectors: " + ", ".join(UnknownSectors)
+			f.write(ErrorMessage)
+			f.close()
+			import sys
+			sys.exit(ErrorMessage)
+	if CoverageSets and CapToTaxMode != "Scan":
+		f = open(OutputScript, 'w')
+		ErrorMessage = "Error: CoverageSets may only be used in Scan mode.  In Solve mode, enable the covered sectors in the Sectors setting."
+		f.write(ErrorMessage)
+		f.close()
+		import sys
+		sys.exit(ErrorMessage)
+
+	# Give error and exit if no sectors were enabled
+	if len(CoveredSectors) < 1 and not CoverageSets:
+		f = open(OutputScript, 'w')
+		ErrorMessage = "Error: No sectors were enabled in the Python script.  Before running the script, you must enable at least one sector."
+		f.write(ErrorMessage)
+		f.close()
+		import sys
+		sys.exit(ErrorMessage)	
+		
+	# Give error and exit if price ceiling is not greater than price floor
+	if CapToTaxMode == "Scan" and (isinstance(PriceFloor, dict) or isinstance(PriceCeiling, dict)):
+		f = open(OutputScript, 'w')
+		ErrorMessage = "Error: PriceFloor and PriceCeiling may only be dictionaries of yearly prices in Solve mode."
+		f.write(ErrorMessage)
+		f.close()
+		import sys
+		sys.exit(ErrorMessage)
+	if CapToTaxMode == "Scan" and PriceCeiling <= PriceFloor:
+		f = open(OutputScript, 'w')
+		ErrorMessage = "Error: PriceCeiling must be greater than PriceFloor."
+		f.write(ErrorMessage)
+		f.close()
+		import sys
+		sys.exit(ErrorMessage)
+
+	# Inlining the Complementary Policies
+	# -----------------------------------
+	# The runs override the carbon tax levers and the policy schedule, so those settings in the
+	# ComplementaryPoliciesFile are dropped, and the model's own values of the levers are looked up
+	# so that only the SETVALs each run needs are written.
+	ComplementaryPolicies = ComplementaryPoliciesFile
+	if InlineComplementaryPolicies:
+		import ScenarioLibrary
+		try:
+			ComplementaryPolicies = ScenarioLibrary.LoadScenario(ComplementaryPoliciesFile, ModelFile, ["Policy Implementation Schedule Selector"] + ["Additional Carbon Tax Rate[" + Sector + "]" for Sector in Sectors])
+		except ValueError as Problem:
+			f = open(OutputScript, 'w')
+			ErrorMessage = str(Problem) if str(Problem).startswith("Error: ") else "Error: " + str(Problem)
+			f.write(ErrorMessage)
+			f.close()
+			import sys
+			sys.exit(ErrorMessage)
+
+	RunSettings = (list(Sectors), ComplementaryPolicies, PolicySchedule, RunName, RunResultsFile, OutputVarsFile)
+
+	# This writes the parts of the command script.  With the preflight check (see ValidateBatch.py),
+	# the script is checked as it is written, and instead we give an error and exit if the script
+	# refers to anything missing from the model or the files, or the batch is over budget.
+	def WriteScript(ScriptParts):
+		if not PreflightCheck:
+			f = open(OutputScript, 'w')
+			f.writelines(ScriptParts)
+			f.close()
+			return
+		import ValidateBatch
+		try:
+			ValidateBatch.WriteCheckedScript(ScriptParts, OutputScript)
+		except ValueError as Problem:
+			f = open(OutputScript, 'w')
+			ErrorMessage = str(Problem)
+			f.write(ErrorMessage)
+			f.close()
+			import sys
+			sys.exit(ErrorMessage)
+
+	CoveredSectorsText = ", ".join(CoveredSectors)
+
+
+	# Scan Mode
+	# ---------
+	# We start the price at the price floor, and we will increment by one currency unit with each
+	# model run.  With several coverage options, runs needed by more than one option are only
+	# simulated once, and their results are exported once for each option that uses them.
+	if CapToTaxMode == "Scan":
+
+		ScriptParts = EPSScriptGenerators.CarbonCapScanScript(CoveredSectors, list(Sectors), PriceFloor, PriceCeiling, UniqueCoverageSets, ModelFile, *RunSettings[1:])
+		WriteScript(ScriptParts)
+
+		if CoverageSets:
+			with open(CoverageSetsFile, 'w') as CoverageFile:
+				CoverageFile.write("CoverageSet\tCovered sectors\n")
+				for CoverageSetNumber, CoverageSet in enumerate(UniqueCoverageSets, 1):
+					CoverageFile.write(str(CoverageSetNumber) + "\t" + ", ".join(CoverageSet) + "\n")
+			Runs = EPSScriptGenerators.CoverageSetRuns(UniqueCoverageSets, list(Sectors), PriceFloor, PriceCeiling)
+			print(str(len(Runs)) + " runs written to " + OutputScript + " for " + str(len(UniqueCoverageSets)) + " coverage options.")
+
+
+	# Solve Mode Iteration
+	# --------------------
+	if CapToTaxMode == "Solve":
+
+		Schedule = ReadCarbonTaxSchedule()
+		for Year in CapTrajectory:
+			if Year not in Schedule:
+				f = open(OutputScript, 'w')
+				ErrorMessage = "Error: " + str(Year) + " is in the CapTrajectory but not in the policy implementation schedule."
+				f.write(ErrorMessage)
+				f.close()
+				import sys
+				sys.exit(ErrorMessage)
+			if PriceForYear(PriceCeiling, Year) <= PriceForYear(PriceFloor, Year):
+				f = open(OutputScript, 'w')
+				ErrorMessage = "Error: PriceCeiling must be greater than PriceFloor (in " + str(Year) + ")."
+				f.write(ErrorMessage)
+				f.close()
+				import sys
+				sys.exit(ErrorMessage)
+
+		History = ReadSolverHistory()
+		AddResultsToHistory(History, CoveredSectors, CoveredSectorsText)
+		WriteSolverHistory(History)
+		Iteration = max([RunKey[0] for RunKey in History], default=0) + 1
+
+		# The floor and ceiling are permit prices, so we divide them by the implementation schedule
+		# to find the corresponding lever settings.  Years in which the carbon tax is not yet in
+		# effect cannot be solved.
+		Trajectory = {}
+		NextSettings = set()
+		for Year in sorted(CapTrajectory):
+			if Schedule[Year] <= 0:
+				Trajectory[Year] = ("carbon tax not in effect", None, None)
+				continue
+			LowLever = PriceForYear(PriceFloor, Year) / Schedule[Year]
+			HighLever = PriceForYear(PriceCeiling, Year) / Schedule[Year]
+			Observations = [(RunKey[1], History[RunKey][Year]) for RunKey in History]
+			if Observations:
+				Status, LeverSetting, Emissions, NextSetting = SolveYear(Year, Observations, LowLever, HighLever)
+				Trajectory[Year] = (Status, LeverSetting, Emissions)
+				if NextSetting is not None:
+					NextSettings.add(NextSetting)
+			else:
+				Trajectory[Year] = ("searching", None, None)
+				NextSettings.update([LowLever, HighLever])
+
+		# On the first iteration, we spread the runs evenly between the lowest and highest lever
+		# settings needed in any year.  Later, if more runs are needed than we allow in one iteration,
+		# we keep an evenly spaced subset (every run helps every year, so this costs little).
+		NextSettings = sorted(NextSettings)
+		if not History and len(NextSettings) > 1:
+			Lowest, Highest = NextSettings[0], NextSettings[-1]
+			NextSettings = [Lowest + (Highest - Lowest) * Run / (SolverMaxRunsPerIteration - 1) for Run in range(SolverMaxRunsPerIteration)]
+			NextSettings = [NextSettings[0]] + [RoundLever(Setting) for Setting in NextSettings[1:-1]] + [NextSettings[-1]]
+		elif len(NextSettings) > SolverMaxRunsPerIteration:
+			NextSettings = [NextSettings[round(Run * (len(NextSettings) - 1) / (SolverMaxRunsPerIteration - 1))] for Run in range(SolverMaxRunsPerIteration)]
+
+		with open(SolverTrajectoryFile, 'w') as TrajectoryFile:
+			TrajectoryFile.write("Year\tCap\tCarbon Tax Implementation Fraction\tLever Setting\tPermit Price\tCovered Emissions\tStatus\n")
+			for Year in sorted(Trajectory):
+				Status, LeverSetting, Emissions = Trajectory[Year]
+				TrajectoryFile.write(str(Year) + "\t" + str(CapTrajectory[Year]) + "\t" + str(Schedule[Year]) + "\t"
+					+ ("" if LeverSetting is None else str(LeverSetting)) + "\t"
+					+ ("" if LeverSetting is None else str(LeverSetting * Schedule[Year])) + "\t"
+					+ ("" if Emissions is None else str(Emissions)) + "\t" + Status + "\n")
+
+		if NextSettings:
+			ScriptParts = [EPSScriptGenerators.ScriptHeader(ModelFile, RunName)]
+			for Run, LeverSetting in enumerate(NextSettings):
+				ScriptParts.append(EPSScriptGenerators.CarbonTaxRun(LeverSetting, [(CoveredSectors, "\tSolverIteration=" + str(Iteration))], Run == 0, *RunSettings))
+			WriteScript(ScriptParts)
+			print("Iteration " + str(Iteration) + ": " + str(len(NextSettings)) + " runs written to " + OutputScript + ".")
 		else:
-			f.write("SIMULATE>SETVAL|Additional Carbon Tax Rate[" + Sector + "]=0\n")
-
-	# We add a RUN instruction now that we've added all the SETVAL instructions.
-	f.write("MENU>RUN|O\n")
-	
-	# Lastly, we copy the results from the .vdf file generated by Vensim to a TSV file.
-	# The complexity of this section is partly due to Vensim's required syntax for the
-	# VDF2TAB function.  Please see the page on that function in the Vensim reference
-	# manual for details.  But the general idea is that at the end (after the series of
-	# vertical bars), we can add columns for arbitrary text, and we use this functionality
-	# to add entries to the spreadsheet showing the current price and which sectors were
-	# enabled for this run.
-	if FirstEntryDone:
-		f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|+!||||:")
-	else:
-		f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|||||:")
-		FirstEntryDone = True
-
-	# Include a column for CurrentPrice in the output file, then increment CurrentPrice
-	f.write("CurrentPrice=\t" + str(CurrentPrice))
-	CurrentPrice += 1
-
-	# Adding a column specifying which sectors were enabled for this run
-	NumSectorsRemaining = len(CoveredSectors)
-	f.write("\tCovered sectors=")
-	for Sector in CoveredSectors:
-		f.write(Sector)
-		NumSectorsRemaining -= 1
-		if NumSectorsRemaining > 0:
-			f.write(", ")
-	f.write("\n")
-
-	# We instruct Vensim to delete the .vdf file, to prevent it from getting picked up by
-	# sync software, such as DropBox or Google Drive.  If sync software locks the file,
-	# Vensim won't be able to overwrite it on the next model run, ruining the batch.
-	f.write("FILE>DELETE|" + RunName + ".vdf")
-	f.write("\n\n")
-
-# We are done writing the Vensim command script and therefore close the file.
-f.close()
+			Message = "The solver has finished after " + str(Iteration - 1) + " iterations.  The permit prices are in " + SolverTrajectoryFile + ".  No further runs are needed."
+			f = open(OutputScript, 'w')
+			f.write(Message)
+			f.close()
+			print(Message)
@@ -29,6 +29,12 @@ MinPolicyCols = 0 # At least this many columns for policy settings will be added
 				  # easier to append various RunResultsFiles together, when they use different numbers of enabled policies,
 				  # and still have the columns line up correctly.
 PolicySchedule = 1 # The number of the policy implementation schedule file to be used (in InputData/plcy-schd/FoPITY)
+				   # May also be a list, such as [1, 2, 3], to repeat the runs for each schedule.  The results are then
+				   # labeled with a PolicySchedule column, and runs with no policies are simulated only once.
+DropUnreachablePolicies = False # If True, enabled policies that cannot affect any variable in the OutputVarsFile (according
+								# to the model's equations) are left out of the Vensim command script.  See LeverReachability.py.
+PreflightCheck = True # If True, the command script is checked against the model and the files it uses, and against the budgets
+					  # for runs, time, and disk space, before it is written.  See ValidateBatch.py.
 				  
 
 # Index definitions
@@ -317,163 +323,43 @@ PotentialPolicies = (
 	(False,"RnD Transportation Fuel Use Perc Reduction[nonroad vehicle]","Fuel Use Reduction - Vehicles: Non-road",[0,0.4],"RnD Fuel Use Reductions")
 )
 
-# Building the Policy List
-# ------------------------
-# Every policy, whether enabled or not, appears in a tuple called "PotentialPolicies" that was constructed above.
-# Now we construct the actual list of policies to be included (named "Policies") by
-# checking which of the policies have been enabled.
-
-Policies = []
-for PotentialPolicy in PotentialPolicies:
-	if PotentialPolicy[Enabled]:
-		Policies.append(PotentialPolicy)
-
-		
-# Next, we define two functions that build lists of policy settings.  One builds a list of all combinations
-# of settings.  The other builds a list of each setting of each enabled policy tested individually (plus
-# the BAU case).  Which function will be called is determined by the user's setting for the
-# "IndividualPoliciesOnly" variable above.
-
-def BuildPolicyCombinationsSettingsList():
-
-	# We need to use unusual syntax to generate our list of non-repeating policy setting combinations
-	# (see below).  To make a statement whose syntax works for an arbitrary number of policies, I
-	# found it clearest and easiest to build the required statement as a string (so that I can
-	# append to it using for loops), then execute the string as code at the end.  This next segment
-	# constructs the string we plan to execute.  An example of what it should look like when it's
-	# done appears in a comment below.
-	
-	ExpressionToBuildList = "PolicySettingCombinations = [ ("
-	for Policy in Policies:
-		ExpressionToBuildList += ("P" + str(Policies.index(Policy)) + ", ")
-	ExpressionToBuildList = ExpressionToBuildList[:-2]
-	ExpressionToBuildList += ") "
-	for Policy in Policies:
-		ExpressionToBuildList += ("for P" + str(Policies.index(Policy)) + " in range(len(Policies[" + str(Policies.index(Policy)) + "][Settings])) ")
-	ExpressionToBuildList += "]"
-	
-	# At this point, ExpressionToBuildList contains a command similar to the following example (which assumes
-	# only three policies are enabled):
-	# PolicySettingCombinations = [ (P0, P1, P2) for P0 in range(len(Policies[0][Settings])) for P1 in range(len(Policies[1][Settings])) for P2 in range(len(Policies[2][Settings])) ]
-
-
-	# Now we execute the expression, which generates a list containing non-repeating combinations of
-	# our policy settings for each enabled policy.  Since we are inside a function, we need to give the
-	# resulting variable global scope, so we pass globals() as the second argument to exec().  See the
-	# Python 3 documentation for more details.
-	exec(ExpressionToBuildList, globals())
-
-	# Now we have created a list called "PolicySettingCombinations" which contains values such as
-	# (if three policies, which each have three possible settings, are enabled):
-	# [(0, 0, 0), (0, 0, 1), (0, 0, 2), (0, 1, 0), (0, 1, 1), (0, 1, 2), (0, 2, 0)... (2, 2, 2)]
-	
-	return PolicySettingCombinations
-
-
-# We invoke the function that builds the list of policy setting combinations.
-# If fewer than two policies were enabled, we instead produce an error
-# and exit.  (We write the error to the text file, because many users won't
-# be using a console and won't see the message produced by sys.exit().
-# Note that the function BuildPolicyCombinationsSettingList() fails if there
-# is only one enabled policy, so we do not invoke it unless there are at
-# least two enabled policies.
-
-if len(Policies) < 1:
-	f = open(OutputScript, 'w')
-	ErrorMessage = "Error: No policies were enabled in the Python script.  Before running the script, you must enable at least two policies."
-	f.write(ErrorMessage)
-	f.close()
-	import sys
-	sys.exit(ErrorMessage)
-elif len(Policies) == 1:
-	f = open(OutputScript, 'w')
-	ErrorMessage = "Error: Only one policy was enabled in the Python script.  Before running the script, you must enable at least two policies."
-	f.write(ErrorMessage)
-	f.close()
-	import sys
-	sys.exit(ErrorMessage)
-else:
-	PolicySettingCombinations = BuildPolicyCombinationsSettingsList()
-
-
 # Generate Vensim Command Script
 # ------------------------------
-# We begin by creating a new file to serve as the Vensim command script (overwriting
-# any older version at that filename).  We then tell Vensim to load
-# the model file, and we give it a RUNNAME that will be used for all runs.  (It is
-# overwritten each run, and the Vensim command file generated by this script
-# always contains multiple runs, unless you only have one enabled policy and one
-# setting value for that policy.)
-f = open(OutputScript, 'w')
-f.write('SPECIAL>LOADMODEL|"' + ModelFile + '"\n')
-f.write("SIMULATE>RUNNAME|" + RunName + "\n")
-
-# The following options may be useful in certain cases, but they cause Vensim to
-# produce an output window for each simulation that acknowledges the completion of
-# the command.  These output windows accumulate over the course of many runs and
-# cause slow-downs (and potentially crashes).  Therefore, these lines are usually
-# best left commented out, unless you are doing only a few runs.
-# f.write("SPECIAL>NOINTERACTION\n")
-# f.write("SIMULATE>SAVELIST|" + OutputVarsFile + "\n")
-f.write("\n")
-
-# Only for the first entry in the TSV file, we wish to include the "Time" row and
-# overwrite any existing TSV file of that name.  Other entries append to the TSV file.
-FirstEntryDone = False
-
-# We track a run number, so that we can number the runs in the output file (because
-# each run will have multiple rows- one for each output variable).
-CurrentRunNumber = 1
-
-# We need a single run of Vensim for each PolicySettingCombination.  We start by clearing
-# any policy changes from old runs by reading the NoPolicies.cin file.
-# Then, each run must have one SIMULATE>SETVAL instruction for each enabled policy.
-# The most complex details here are the bits that look up the values of the settings
-# for each policy.  We next array references- for example, "Policies[ActivePolicy]"
-# refers to a single policy, which is itself a list.  Therefore, to reference an element
-# of that list, we add another bracketed clause to the right, such as "[LongName]" if
-# we want the long name text string for that policy.
-for PolicySettingCombination in PolicySettingCombinations:
-	
-	for ActivePolicy in range(len(Policies)):	
-		f.write("SIMULATE>SETVAL|" + Policies[ActivePolicy][LongName] + "=" + str(Policies[ActivePolicy][Settings][PolicySettingCombination[ActivePolicy]]) + "\n")
-	
-	# We include a SETVAL instruction to select the correct policy implementation schedule file
-	f.write("SIMULATE>SETVAL|Policy Implementation Schedule Selector=" + str(PolicySchedule) + "\n")
-	
-	# We add a RUN instruction now that we've added all the SETVAL instructions.
-	f.write("MENU>RUN|O\n")
-	
-	# Lastly, we copy the results from the .vdf file generated by Vensim to a TSV file.
-	# The complexity of this section is partly due to Vensim's required syntax for the
-	# VDF2TAB function.  Please see the page on that function in the Vensim reference
-	# manual for details.  But the general idea is that at the end (after the series of
-	# vertical bars), we can add columns for arbitrary text, and we use this functionality
-	# to add entries to the spreadsheet showing what policy settings were used for this run.
-	# Then we add blank columns if we haven't added enough policy columns to satisfy the
-	# MinPolicyCols setting.
-	if FirstEntryDone:
-		f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|+!||||:")
-	else:
-		f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|||||:")
-		FirstEntryDone = True
-	f.write(RunName)
-	f.write("\tCurrentRunNumber=" + str(CurrentRunNumber))
-	CurrentRunNumber += 1
-	PolicyCols = 0
-	for Policy in Policies:
-		f.write("\t" + Policy[ShortName] + "=" + str(Policy[Settings][PolicySettingCombination[Policies.index(Policy)]]))
-		PolicyCols += 1
-	ExtraCols = max(0, MinPolicyCols - PolicyCols)
-	for Cols in range(0, ExtraCols):
-		f.write("\t-")
-	f.write("\n")
-
-	# We instruct Vensim to delete the .vdf file, to prevent it from getting picked up by
-	# sync software, such as DropBox or Google Drive.  If sync software locks the file,
-	# Vensim won't be able to overwrite it on the next model run, ruining the batch.
-	f.write("FILE>DELETE|" + RunName + ".vdf")
-	f.write("\n\n")
-
-# We are done writing the Vensim command script and therefore close the file.
-f.close()
+# The work of writing the command script is done by functions in EPSScriptGenerators.py, so
+# other Python programs can import them (or this script's settings) without writing a script.
+# Those functions can also be used to generate many command scripts in one process.
+if __name__ == "__main__":
+	import EPSScriptGenerators
+
+	# Every policy, whether enabled or not, appears in a tuple called "PotentialPolicies" that was
+	# constructed above.  Now we construct the actual list of policies to be included (named
+	# "Policies") by checking which of the policies have been enabled.
+	Policies = EPSScriptGenerators.EnabledPolicies(PotentialPolicies)
+
+	# If requested, we drop enabled policies that cannot affect the variables in the OutputVarsFile,
+	# because runs that vary them would produce identical results.
+	if DropUnreachablePolicies:
+		from LeverReachability import DropPoliciesThatCannotReachOutputs
+		Policies = DropPoliciesThatCannotReachOutputs(Policies, LongName, ModelFile, OutputVarsFile)
+
+	# The command script has one run for every combination of settings of the enabled policies.
+	# If fewer than two policies were enabled, or the preflight check finds a problem with the
+	# script (such as a lever that isn't in the model, or a batch over budget), we instead
+	# produce an error and exit.  (We write the error to the text file, because many users won't
+	# be using a console and won't see the message produced by sys.exit().)
+	try:
+		ScriptParts = EPSScriptGenerators.CombinationsScript(Policies, ModelFile, RunName, RunResultsFile, OutputVarsFile, MinPolicyCols, PolicySchedule)
+		if PreflightCheck:
+			import ValidateBatch
+			ValidateBatch.WriteCheckedScript(ScriptParts, OutputScript)
+		else:
+			f = open(OutputScript, 'w')
+			f.writelines(ScriptParts)
+			f.close()
+	except ValueError as Error:
+		f = open(OutputScript, 'w')
+		ErrorMessage = str(Error)
+		f.write(ErrorMessage)
+		f.close()
+		import sys
+		sys.exit(ErrorMessage)
@@ -25,8 +25,16 @@ RunName = "MostRecentRun" # The desired name for all runs performed.  Used as th
 EnableOrDisableGroups = "Disable" # Should each group be enabled or disabled in turn?
 								 # Essentially, this is testing either the contribution of a group in the proximity of the
 								 # BAU case ("Enable") or in the proximity of a scenario defined in the non-zero values of
-								 # the policies listed below ("Disable").
+								 # the policies listed below ("Disable").  "Both" performs the runs of both modes in one
+								 # script, sharing the run with no policies and the run with every policy, so that
+								 # CreateCostCurves.py can report how each group's contribution depends on the others.
 PolicySchedule = 1 # The number of the policy implementation schedule file to be used (in InputData/plcy-schd/FoPITY)
+				   # May also be a list, such as [1, 2, 3], to repeat the runs for each schedule.  The results are then
+				   # labeled with a PolicySchedule column, and runs with no policies are simulated only once.
+DropUnreachablePolicies = False # If True, enabled policies that cannot affect any variable in the OutputVarsFile (according
+								# to the model's equations) are left out of the Vensim command script.  See LeverReachability.py.
+PreflightCheck = True # If True, the command script is checked against the model and the files it uses, and against the budgets
+					  # for runs, time, and disk space, before it is written.  See ValidateBatch.py.
 
 
 # Index definitions
@@ -313,163 +321,42 @@ PotentialPolicies = (
 	(False,"RnD Transportation Fuel Use Perc Reduction[nonroad vehicle]","Fuel Use Reduction - Vehicles: Non-road",[0,0.4],"RnD Fuel Use Reductions")
 )
 
-# Building the Policy List
-# ------------------------
-# Every policy, whether enabled or not, appears in a tuple called "PotentialPolicies" that was constructed above.
-# Now we construct the actual list of policies to be included (named "Policies") by
-# checking which of the policies have been enabled.
-
-Policies = []
-for PotentialPolicy in PotentialPolicies:
-	if PotentialPolicy[Enabled]:
-		Policies.append(PotentialPolicy)
-
-
-# Exit with an error if no policies were enabled in the script.  We write the error to the output
-# file because it's likely a user will run this without a console and won't be able to see the
-# message produced by sys.exit()
-if len(Policies) < 1:
-	f = open(OutputScript, 'w')
-	ErrorMessage = "Error: No policies were enabled in the Python script.  Before running the script, you must enable at least one policy."
-	f.write(ErrorMessage)
-	f.close()
-	import sys
-	sys.exit(ErrorMessage)
-
-
-# Building the Groups List
-# ------------------------
-# We create a list of all the unique groups that are used by enabled policies.
-Groups = []
-for Policy in Policies:
-	if Policy[Group] not in Groups:
-		Groups.append(Policy[Group])
-
-
 # Generate Vensim Command Script
 # ------------------------------
-# We begin by creating a new file to serve as the Vensim command script (overwriting
-# any older version at that filename).  We then tell Vensim to load
-# the model file, and we give it a RUNNAME that will be used for all runs.  (It is
-# overwritten each run.)
-f = open(OutputScript, 'w')
-f.write('SPECIAL>LOADMODEL|"' + ModelFile + '"\n')
-f.write("SIMULATE>RUNNAME|" + RunName + "\n")
-
-# The following options may be useful in certain cases, but they cause Vensim to
-# produce an output window for each simulation that acknowledges the completion of
-# the command.  These output windows accumulate over the course of many runs and
-# cause slow-downs (and potentially crashes).  Therefore, these lines are usually
-# best left commented out, unless you are doing only a few runs.
-# f.write("SPECIAL>NOINTERACTION\n")
-# f.write("SIMULATE>SAVELIST|" + OutputVarsFile + "\n")
-f.write("\n")
-
-def PerformRunsWithEnabledGroups():
-
-	# First, we do a run with all of the groups disabled
-	f.write("MENU>RUN|O\n")
-	f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|||||:")
-	f.write("\tEnabledPolicyGroup=None")
-	f.write("\tEnabledPolicies=None\n\n")
-
-	# Next, we do a run with each group enabled in turn
-	for EnabledGroup in Groups:
-
-		# We create an empty string that we'll use to track the policies enabled in each group
-		EnabledPolicies=""
-
-		# We activate policies if their group name matches the currently enabled group
-		for Policy in Policies:
-			if Policy[Group] == EnabledGroup:
-				f.write("SIMULATE>SETVAL|" + Policy[LongName] + "=" + str(Policy[Settings][1]) + "\n")
-				# We add the policy to the EnabledPolicies string
-				if len(EnabledPolicies) > 0:
-					EnabledPolicies += ", "
-				EnabledPolicies += Policy[ShortName]
-
-		# We include a SETVAL instruction to select the correct policy implementation schedule file
-		f.write("SIMULATE>SETVAL|Policy Implementation Schedule Selector=" + str(PolicySchedule) + "\n")
-		
-		# We perform our run and log the output
-		f.write("MENU>RUN|O\n")
-		f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|+!||||:")
-		f.write("\tEnabledPolicyGroup=" + str(EnabledGroup))
-		f.write("\tEnabledPolicies=" + EnabledPolicies + "\n\n")
-	
-	# Finally, we do a run with all of the policy groups enabled (a full policy case run)
-	
-	# We include a SETVAL instruction to select the correct policy implementation schedule file
-	f.write("SIMULATE>SETVAL|Policy Implementation Schedule Selector=" + str(PolicySchedule) + "\n")
-	
-	f.write("MENU>RUN|O\n")
-	f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|+!||||:")
-	f.write("\tEnabledPolicyGroup=All")
-	f.write("\tEnabledPolicies=All")
-	f.write("\n")
-
-	# We instruct Vensim to delete the .vdf file, to prevent it from getting picked up by
-	# sync software, such as DropBox or Google Drive.  If sync software locks the file,
-	# Vensim won't be able to overwrite it on the next model run, ruining the batch.
-	f.write("FILE>DELETE|" + RunName + ".vdf")
-	f.write("\n\n")
-	
-def PerformRunsWithDisabledGroups():
-
-	# First, we do a run with all of the groups enabled
-	for Policy in Policies:
-		f.write("SIMULATE>SETVAL|" + Policy[LongName] + "=" + str(Policy[Settings][1]) + "\n")
-	
-	# We include a SETVAL instruction to select the correct policy implementation schedule file
-	f.write("SIMULATE>SETVAL|Policy Implementation Schedule Selector=" + str(PolicySchedule) + "\n")
-	
-	f.write("MENU>RUN|O\n")
-	f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|||||:")
-	f.write("\tDisabledPolicyGroup=None")
-	f.write("\tDisabledPolicies=None\n\n")
-
-	# Next, we do a run with each group disabled in turn
-	for DisabledGroup in Groups:
-
-		# We create an empty string that we'll use to track the policies disabled in each group
-		DisabledPolicies=""
-
-		# We activate policies if their group name does not match the currently disabled group
-		for Policy in Policies:
-			if Policy[Group] != DisabledGroup:
-				f.write("SIMULATE>SETVAL|" + Policy[LongName] + "=" + str(Policy[Settings][1]) + "\n")
-			# Otherwise, we add the policy to the DisabledPolicies string
-			else:
-				if len(DisabledPolicies) > 0:
-					DisabledPolicies += ", "
-				DisabledPolicies += Policy[ShortName]
-		
-		# We include a SETVAL instruction to select the correct policy implementation schedule file
-		f.write("SIMULATE>SETVAL|Policy Implementation Schedule Selector=" + str(PolicySchedule) + "\n")
-		
-		# We perform our run and log the output
-		f.write("MENU>RUN|O\n")
-		f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|+!||||:")
-		f.write("\tDisabledPolicyGroup=" + str(DisabledGroup))
-		f.write("\tDisabledPolicies=" + DisabledPolicies + "\n\n")
-	
-	# Finally, we do a run with all of the groups disabled (a BAU case run)
-	f.write("MENU>RUN|O\n")
-	f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|+!||||:")
-	f.write("\tDisabledPolicyGroup=All")
-	f.write("\tDisabledPolicies=All")
-	f.write("\n")
-
-	# We instruct Vensim to delete the .vdf file, to prevent it from getting picked up by
-	# sync software, such as DropBox or Google Drive.  If sync software locks the file,
-	# Vensim won't be able to overwrite it on the next model run, ruining the batch.
-	f.write("FILE>DELETE|" + RunName + ".vdf")
-	f.write("\n\n")
-	
-if EnableOrDisableGroups == "Enable":
-	PerformRunsWithEnabledGroups()
-else:
-	PerformRunsWithDisabledGroups()
-
-# We are done writing the Vensim command script and therefore close the file.
-f.close()
\ No newline at end of file
+# The work of writing the command script is done by functions in EPSScriptGenerators.py, so
+# other Python programs can import them (or this script's settings) without writing a script.
+# Those functions can also be used to generate many command scripts in one process.
+if __name__ == "__main__":
+	import EPSScriptGenerators
+
+	# Every policy, whether enabled or not, appears in a tuple called "PotentialPolicies" that was
+	# constructed above.  Now we construct the actual list of policies to be included (named
+	# "Policies") by checking which of the policies have been enabled.
+	Policies = EPSScriptGenerators.EnabledPolicies(PotentialPolicies)
+
+	# If requested, we drop enabled policies that cannot affect the variables in the OutputVarsFile,
+	# because runs that vary them would produce identical results.
+	if DropUnreachablePolicies:
+		from LeverReachability import DropPoliciesThatCannotReachOutputs
+		Policies = DropPoliciesThatCannotReachOutputs(Policies, LongName, ModelFile, OutputVarsFile)
+
+	# The command script has a run for each group of enabled policies, plus runs with none and all
+	# of the groups.  If no policies were enabled, or the preflight check finds a problem with the
+	# script, we exit with an error.  We write the error to the output file because it's likely a
+	# user will run this without a console and won't be able to see the message produced by sys.exit()
+	try:
+		ScriptParts = EPSScriptGenerators.ContributionTestScript(Policies, EnableOrDisableGroups, ModelFile, RunName, RunResultsFile, OutputVarsFile, PolicySchedule)
+		if PreflightCheck:
+			import ValidateBatch
+			ValidateBatch.WriteCheckedScript(ScriptParts, OutputScript)
+		else:
+			f = open(OutputScript, 'w')
+			f.writelines(ScriptParts)
+			f.close()
+	except ValueError as Error:
+		f = open(OutputScript, 'w')
+		ErrorMessage = str(Error)
+		f.write(ErrorMessage)
+		f.close()
+		import sys
+		sys.exit(ErrorMessage)
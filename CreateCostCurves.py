@@ -0,0 +1,268 @@
+# CreateCostCurves.py
+#
+# This is a Python script that builds marginal abatement cost curves from the results
+# of a contribution test (produced by running the Vensim command script generated by
+# CreateContributionTestScript-CostCurve.py or CreateContributionTestScript.py).
+# It performs the same calculations as the "Calculations" tab of Cost Curve Generator.xlsx,
+# but it reads the results files directly, so many scenarios and years can be processed in
+# one pass without copying data into Excel.
+#
+# For each policy group, the abatement attributable to the group is the change in
+# cumulative emissions when the group is disabled (or enabled), and the cost is the
+# corresponding change in the NPV of capital and operating expenditures.  Abatement is
+# scaled so that the groups' abatement sums to the abatement of the full policy package,
+# and it is expressed as an annual average, which is the width of each box on the cost
+# curve.  The height of each box is the cost or savings per ton abated.
+#
+# A group's contribution depends on which other policies are in place, so the two modes give
+# different answers when policies interact.  For scenarios that include both modes (such as
+# a contribution test run in "Both" mode), the InteractionTableFile lists, for each group,
+# the abatement and cost when the group is enabled alone, when it is disabled from the full
+# package, and the difference between the two (the interaction residual).  A positive
+# residual means the group achieves more alongside the other policies than on its own.
+#
+# The OutputVarsFile used for the contribution test must include both the AbatementVariable
+# and the CostVariable specified below.
+
+
+# File Names
+# ----------
+# Each results file is treated as a separate scenario, named after the file (without the .tsv
+# extension), or as one scenario per policy schedule if it covers several schedules (named
+# "File - Schedule N").  List as many files as you wish to process.
+ContributionResultsFiles = ["ContributionTestResults.tsv"]
+CostCurveTableFile = "CostCurves.tsv" # The desired filename of the TSV file containing the cost curve data for all scenarios and years
+InteractionTableFile = "ContributionInteractions.tsv" # The desired filename of the TSV file comparing the two modes, for scenarios with both
+
+
+# Cost Curve Settings
+# -------------------
+CostCurveYears = [2030, 2050] # A cost curve is built for each of these years, covering abatement and costs from the first simulated year through that year
+AbatementVariable = "Output Cumulative Total CO2e Emissions" # Cumulative emissions, in million metric tons CO2e
+CostVariable = "Output First Year NPV of CapEx and OpEx through This Year with Revenue Neutral Taxes and Subsidies"
+MinAbatementThreshold = 0.003 # Policy groups contributing less than this share of the total abatement are excluded from the cost curve
+TonsPerEmissionsUnit = 10**6 # The AbatementVariable is in million metric tons
+
+
+# Plot Settings
+# -------------
+# Plots require the matplotlib package.  Set PlotFileFormat to "" if you only want the data table.
+PlotFileFormat = "png" # "png", "svg", or "pdf"
+PlotFilePrefix = "CostCurve" # Plots are named PlotFilePrefix - Scenario - Mode - Year
+
+
+import os
+from RunResultsReader import IterateRunResults, AnnotationValue, YearPositions
+
+
+# Contribution tests label each run with the group that was enabled or disabled, using the
+# annotation names below.  The "None" and "All" runs are the reference runs for each mode.
+GroupAnnotations = {
+	"Disable": "DisabledPolicyGroup",
+	"Enable": "EnabledPolicyGroup"
+}
+
+# Contribution tests covering several policy implementation schedules label each run with its
+# schedule.  Each schedule in a results file is treated as a separate scenario.
+ScheduleAnnotation = "PolicySchedule"
+
+
+# Reading the Results
+# -------------------
+# This function reads one results file and returns a dictionary that maps each policy
+# schedule found in the file (None if the runs aren't labeled with one) to a dictionary that
+# maps each mode ("Enable" and/or "Disable") to a dictionary of groups, which in turn map
+# each variable we need to its list of yearly values.  It also returns the simulated years.
+def ReadContributionResults(FileName):
+
+	Results = {}
+	FileYears = None
+	for Years, Variable, Annotations, Values in IterateRunResults(FileName):
+		if Variable != AbatementVariable and Variable != CostVariable:
+			continue
+		FileYears = Years
+		Schedule = AnnotationValue(Annotations, ScheduleAnnotation)
+		for Mode in GroupAnnotations:
+			GroupName = AnnotationValue(Annotations, GroupAnnotations[Mode])
+			if GroupName is not None:
+				Results.setdefault(Schedule, {}).setdefault(Mode, {}).setdefault(GroupName, {})[Variable] = Values
+
+	return Results, FileYears
+
+
+# Calculating Contributions
+# -------------------------
+# This function takes the groups for one mode and returns the names of the groups (other than
+# the reference runs), the abatement of all of the policies, and each group's abatement and
+# cost, for every simulated year at once.
+def GroupContributions(Mode, Groups):
+
+	for ReferenceGroup in ["None", "All"]:
+		if ReferenceGroup not in Groups:
+			raise ValueError("The results have no run with " + GroupAnnotations[Mode] + "=" + ReferenceGroup + ".")
+		for Variable in [AbatementVariable, CostVariable]:
+			if Variable not in Groups[ReferenceGroup]:
+				raise ValueError("The results do not include " + Variable + ".  Add it to the OutputVarsFile for the contribution test.")
+
+	# In "Disable" mode, the "None" run has every policy enabled, and disabling a group increases
+	# emissions.  In "Enable" mode, the "None" run is the BAU case, and enabling a group decreases
+	# emissions.  We flip the sign in "Enable" mode so abatement is positive in both modes.
+	Sign = 1 if Mode == "Disable" else -1
+	ReferenceEmissions = Groups["None"][AbatementVariable]
+	ReferenceCost = Groups["None"][CostVariable]
+	TotalAbatement = [Sign * (AllValue - NoneValue) for AllValue, NoneValue in zip(Groups["All"][AbatementVariable], ReferenceEmissions)]
+
+	GroupNames = [GroupName for GroupName in Groups if GroupName not in ("None", "All")]
+	Abatement = {}
+	Cost = {}
+	for GroupName in GroupNames:
+		Abatement[GroupName] = [Sign * (Value - NoneValue) for Value, NoneValue in zip(Groups[GroupName][AbatementVariable], ReferenceEmissions)]
+		Cost[GroupName] = [-Sign * (Value - NoneValue) for Value, NoneValue in zip(Groups[GroupName][CostVariable], ReferenceCost)]
+
+	return GroupNames, TotalAbatement, Abatement, Cost
+
+
+# Calculating the Cost Curve
+# --------------------------
+# This function takes the groups for one mode and computes abatement and cost for every
+# simulated year at once (each quantity is a list with one entry per year), then picks out
+# the requested years.  It returns a list of cost curve rows for each requested year,
+# sorted from the lowest to the highest cost per ton.
+def CalculateCostCurves(Mode, Groups, Years, RequestedYears):
+
+	GroupNames, TotalAbatement, Abatement, Cost = GroupContributions(Mode, Groups)
+
+	CostCurves = {}
+	for Year, Position in zip(RequestedYears, YearPositions(Years, RequestedYears)):
+		NumYears = Year - Years[0] + 1
+
+		# Groups contributing less than the threshold share of the summed abatement are excluded,
+		# and the remaining groups' abatement is scaled to sum to the abatement of all policies.
+		SumOfAbatement = sum(Abatement[GroupName][Position] for GroupName in GroupNames)
+		Included = [GroupName for GroupName in GroupNames if Abatement[GroupName][Position] >= MinAbatementThreshold * SumOfAbatement]
+		SumOfIncludedAbatement = sum(Abatement[GroupName][Position] for GroupName in Included)
+
+		Rows = []
+		for GroupName in GroupNames:
+			GroupAbatement = Abatement[GroupName][Position]
+			GroupCost = Cost[GroupName][Position]
+			if GroupName in Included and SumOfIncludedAbatement != 0:
+				ScaledAbatement = GroupAbatement / SumOfIncludedAbatement * TotalAbatement[Position]
+				AnnualAbatement = ScaledAbatement / NumYears
+				CostPerTon = GroupCost / (ScaledAbatement * TonsPerEmissionsUnit) if ScaledAbatement != 0 else float("nan")
+			else:
+				ScaledAbatement = AnnualAbatement = CostPerTon = float("nan")
+			Rows.append([GroupName, GroupName in Included, GroupAbatement, ScaledAbatement, AnnualAbatement, GroupCost, CostPerTon])
+
+		# Sort included groups by cost per ton, with excluded groups at the end, then compute
+		# where each box starts along the horizontal axis.
+		Rows.sort(key=lambda Row: (not Row[1], Row[6] if Row[1] else 0))
+		CumulativeWidth = 0
+		for Row in Rows:
+			Row.append(CumulativeWidth if Row[1] else float("nan"))
+			if Row[1]:
+				CumulativeWidth += Row[4]
+		CostCurves[Year] = Rows
+
+	return CostCurves
+
+
+# Interactions
+# ------------
+# This function takes the groups for both modes and returns a list of rows for each requested
+# year, one per group found in both modes, with the group's abatement and cost in "Enable" mode,
+# in "Disable" mode, and the difference ("Disable" minus "Enable").
+def CalculateInteractions(EnableGroups, DisableGroups, Years, RequestedYears):
+
+	EnableNames, EnableTotal, EnableAbatement, EnableCost = GroupContributions("Enable", EnableGroups)
+	DisableNames, DisableTotal, DisableAbatement, DisableCost = GroupContributions("Disable", DisableGroups)
+	GroupNames = [GroupName for GroupName in EnableNames if GroupName in DisableNames]
+
+	Interactions = {}
+	for Year, Position in zip(RequestedYears, YearPositions(Years, RequestedYears)):
+		Rows = []
+		for GroupName in GroupNames:
+			EnabledAbatement, DisabledAbatement = EnableAbatement[GroupName][Position], DisableAbatement[GroupName][Position]
+			EnabledCost, DisabledCost = EnableCost[GroupName][Position], DisableCost[GroupName][Position]
+			Rows.append([GroupName, EnabledAbatement, DisabledAbatement, DisabledAbatement - EnabledAbatement, EnabledCost, DisabledCost, DisabledCost - EnabledCost])
+		Interactions[Year] = Rows
+
+	return Interactions
+
+
+# Plotting
+# --------
+# Each group is drawn as a box whose width is its annual average abatement and whose height
+# is its cost or savings per ton abated.
+def PlotCostCurve(FileName, Title, Rows):
+
+	import matplotlib
+	matplotlib.use("Agg")
+	import matplotlib.pyplot as plt
+
+	IncludedRows = [Row for Row in Rows if Row[1]]
+	Figure, Axes = plt.subplots(figsize=(12, 6))
+	Axes.bar([Row[7] for Row in IncludedRows], [Row[6] for Row in IncludedRows], width=[Row[4] for Row in IncludedRows],
+		align="edge", edgecolor="white", color=["#2a9d8f" if Row[6] < 0 else "#e76f51" for Row in IncludedRows])
+	for Row in IncludedRows:
+		Axes.annotate(Row[0], (Row[7] + Row[4] / 2, Row[6]), rotation=90, ha="center", va="bottom" if Row[6] >= 0 else "top", fontsize=7)
+	Axes.axhline(0, color="black", linewidth=0.8)
+	Axes.set_xlabel("Annual Average Abatement (million metric tons CO2e)")
+	Axes.set_ylabel("Cost or Savings per Ton Abated (currency/metric ton)")
+	Axes.set_title(Title)
+	Figure.tight_layout()
+	Figure.savefig(FileName)
+	plt.close(Figure)
+
+
+if __name__ == "__main__":
+
+	Plotting = PlotFileFormat != ""
+	if Plotting:
+		try:
+			import matplotlib
+		except ImportError:
+			print("The matplotlib package is not installed, so no plots will be created.  The data table will still be written.")
+			Plotting = False
+
+	Interactions = []
+	with open(CostCurveTableFile, 'w') as f:
+		f.write("Scenario\tMode\tYear\tPolicy Group\tIncluded\tCumulative Abatement\tScaled Cumulative Abatement\tAnnual Average Abatement"
+			"\tCost or Savings\tCost per Ton\tCumulative Width\n")
+
+		for ResultsFile in ContributionResultsFiles:
+			Results, Years = ReadContributionResults(ResultsFile)
+			if not Results:
+				print("Skipping " + ResultsFile + ": it contains no contribution test runs with the AbatementVariable or CostVariable.")
+				continue
+
+			for Schedule in Results:
+				Scenario = os.path.splitext(os.path.basename(ResultsFile))[0]
+				if Schedule is not None:
+					Scenario += " - Schedule " + Schedule
+				if "Enable" in Results[Schedule] and "Disable" in Results[Schedule]:
+					Interactions.append((Scenario, CalculateInteractions(Results[Schedule]["Enable"], Results[Schedule]["Disable"], Years, CostCurveYears)))
+				for Mode in Results[Schedule]:
+					CostCurves = CalculateCostCurves(Mode, Results[Schedule][Mode], Years, CostCurveYears)
+					for Year in CostCurveYears:
+						for Row in CostCurves[Year]:
+							f.write(Scenario + "\t" + Mode + "\t" + str(Year) + "\t" + Row[0] + "\t" + str(Row[1]))
+							for Value in Row[2:]:
+								f.write("\t" + str(Value))
+							f.write("\n")
+						if Plotting:
+							PlotCostCurve(PlotFilePrefix + " - " + Scenario + " - " + Mode + " - " + str(Year) + "." + PlotFileFormat,
+								Scenario + " (" + Mode + " Groups), " + str(Years[0]) + "-" + str(Year), CostCurves[Year])
+
+	# Scenarios that include both modes are compared in the InteractionTableFile
+	if Interactions:
+		with open(InteractionTableFile, 'w') as f:
+			f.write("Scenario\tYear\tPolicy Group\tEnabled Alone Abatement\tDisabled from All Abatement\tInteraction Abatement"
+				"\tEnabled Alone Cost\tDisabled from All Cost\tInteraction Cost\n")
+			for Scenario, ScenarioInteractions in Interactions:
+				for Year in CostCurveYears:
+					for Row in ScenarioInteractions[Year]:
+						f.write(Scenario + "\t" + str(Year) + "\t" + Row[0])
+						for Value in Row[1:]:
+							f.write("\t" + str(Value))
+						f.write("\n")
@@ -21,38 +21,13 @@ SettingsFiles = ["","Scenario_Example.cin","Scenario_MEIMTarget.cin"]
 	
 # Generate Vensim Command Script
 # ------------------------------
-# We use a SAVELIST to reduce the size of the output files, since we are generating one per run.
-f = open(OutputScript, 'w')
-f.write('SPECIAL>LOADMODEL|"' + ModelFile + '"\n\n')
-f.write("SIMULATE>SAVELIST|" + OutputVarsFile + "\n")
-
-for SettingsFile in SettingsFiles:
-
-	# The RunName is the name of the SettingsFile without the .cin extension.  It is used as the filename for the VDF file
-	# that Vensim creates (or "NoSettings"), and it is included in a column in the RunResultsFile.
-	SettingsFileNameLen = len(SettingsFile)
-	if SettingsFileNameLen < 5:
-		RunName = "NoSettings"
-	else:
-		RunName = SettingsFile[:SettingsFileNameLen - 4]
-	RunResultsFile = RunName + ".tsv" # The desired filename for the file containing model run results
-	
-	f.write("SIMULATE>RUNNAME|" + RunName + "\n")
-	f.write("SIMULATE>READCIN|" + SettingsFile + "\n")
-	f.write("MENU>RUN|O\n")
-	f.write("MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|||||:")
-	f.write(RunName)
-	f.write("\n")
-
-	# We instruct Vensim to delete the .vdf file, to prevent it from getting picked up by
-	# sync software, such as DropBox or Google Drive.  If sync software locks the file,
-	# Vensim won't be able to overwrite it on the next model run, ruining the batch.
-	f.write("FILE>DELETE|" + RunName + ".vdf")
-	f.write("\n\n")
-
-# Since Vensim fails to clear the savelist entry in the program after script execution, we need to do it here
-# before the script exits.
-f.write("SIMULATE>SAVELIST|\n")
-
-# We are done writing the Vensim command script and therefore close the file.
-f.close()
\ No newline at end of file
+# Each run's RunName is the name of its SettingsFile without the .cin extension (or
+# "NoSettings").  It is used as the filename for the VDF file that Vensim creates and for the
+# run's results file, and it is included in a column in the results file.  We use a SAVELIST
+# to reduce the size of the output files, since we are generating one per run.  The work of
+# writing the command script is done by functions in EPSScriptGenerators.py.
+if __name__ == "__main__":
+	import EPSScriptGenerators
+	f = open(OutputScript, 'w')
+	f.writelines(EPSScriptGenerators.DataLoggingScript(SettingsFiles, ModelFile, OutputVarsFile))
+	f.close()
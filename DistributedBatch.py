@@ -0,0 +1,424 @@
+# DistributedBatch.py
+#
+# This is a Python script that spreads the runs of a generated Vensim command script (such as
+# GeneratedCombinationsScript.cmd) across several computers ("nodes") that share a folder on a
+# network drive.  No other software is needed to coordinate the nodes: they coordinate only
+# through files in the JobFolder.  The script has five modes, chosen with the Mode setting:
+#	- "publish" divides the command script into blocks of RunsPerBlock runs and writes each
+#	  block to a job file in the JobFolder.  Do this once, on any computer.
+#	- "work" performs blocks until none are left.  Do this on every node, in the folder that
+#	  contains the model (it may be the same shared folder for all nodes).  LocalWorkers sets
+#	  how many blocks a node works on at once; each worker process acts as a separate node,
+#	  so several worker processes on one computer can also be used to try out a batch.
+#	- "status" reports how many blocks are waiting, claimed, and finished.
+#	- "merge" combines the results of all blocks into the results file(s) named in the
+#	  command script, in the same order as if the command script had been run by Vensim.
+#	- "check" tries out all of the above on the command script with the stand-in for Vensim,
+#	  in a temporary folder (see Checking the Batch Tools, below).
+#
+# Claiming Blocks
+# ---------------
+# A node claims a block by creating its lease file, which only one node can do (the file is
+# created with an operation that fails if the file already exists).  While performing the
+# block, the node updates the lease file's modification time every HeartbeatSeconds.  If
+# another node sees that a lease hasn't been updated for LeaseSeconds (measured with its own
+# clock, so the nodes' clocks don't need to agree), it assumes the node holding the lease has
+# stopped and takes the lease over, by renaming the stale lease file (only one node can
+# succeed) and creating a new one.  A node finishes a block by moving its results into the
+# shards folder and creating the block's done file, which again only one node can do, so if
+# two nodes perform the same block, the results of only one of them are used.
+#
+# Each node uses its own RunName (the RunName in the command script followed by the node's
+# name), so nodes don't overwrite each other's .vdf files, and writes the results of a block
+# to its own files, which are then moved into the JobFolder as that block's shards.  The
+# first results written to each file in a block start a new file, with a "Time" row; when
+# merging, the "Time" rows of the later shards are left out, unless the command script
+# itself started a new file at that point.  Each node also writes its timing measurements
+# (see RunVensimBatch.py) to its own log in the timings folder.
+#
+# JobFolder Layout
+# ----------------
+#	Manifest.json			the number of blocks and runs, and the results files
+#	Preamble.cmd, Postamble.cmd	the commands before the first run and after the last run
+#	jobs/Block-000001.cmd		the runs of each block
+#	leases/Block-000001.lease	the lease of a claimed block
+#	done/Block-000001.json		written when a block is finished, listing its shards
+#	shards/				the results of each block
+#	timings/			the timing log of each node
+
+
+# File Names
+# ----------
+CommandScript = "GeneratedCombinationsScript.cmd" # The Vensim command script to divide into blocks
+JobFolder = "DistributedBatch" # The folder holding the blocks and their results.  It must be on a drive shared by all nodes.
+
+
+# Other Settings
+# --------------
+Mode = "publish" # "publish", "work", "status", "merge", or "check" (see above)
+RunsPerBlock = 50 # The number of runs in each block
+LocalWorkers = 1 # In "work" mode, the number of worker processes to start on this computer (each acts as a separate node)
+Executor = "VensimDLL" # "VensimDLL" to run the model in Vensim, or "StandIn" to try out a batch without Vensim
+HeartbeatSeconds = 30 # How often a node renews its lease while working on a block
+LeaseSeconds = 300 # A lease that isn't renewed for this long is taken over by another node.  It must be
+				   # several times HeartbeatSeconds, allowing for delays in the shared drive.
+
+
+import json
+import multiprocessing
+import os
+import platform
+import re
+import shutil
+import tempfile
+import threading
+import time
+from RunVensimBatch import ReadCommandScript, CommandName, PerformCommands, PerformBatch
+from VensimWorkerPool import MakeExecutor
+
+
+def FolderPath(*Parts):
+	return os.path.join(JobFolder, *Parts)
+
+def BlockName(Block):
+	return "Block-" + str(Block).zfill(6)
+
+def ReadManifest():
+	with open(FolderPath("Manifest.json"), 'r') as ManifestFile:
+		return json.load(ManifestFile)
+
+# This creates a file containing Text, or returns False if the file already exists (or was
+# created by another node at the same moment).
+def CreateExclusively(FileName, Text):
+	try:
+		Handle = os.open(FileName, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+	except FileExistsError:
+		return False
+	with os.fdopen(Handle, 'w') as NewFile:
+		NewFile.write(Text)
+	return True
+
+
+# Publishing
+# ----------
+# The results files are listed in the order the command script first writes to them.
+def ResultsFileOf(Line):
+	return Line.split("|", 1)[1].split(":", 1)[0].split("|")[1]
+
+def Publish():
+	if os.path.exists(FolderPath("Manifest.json")):
+		raise ValueError(JobFolder + " already holds a batch.  Delete it (or choose another JobFolder) before publishing a new batch.")
+	Preamble, Runs, Postamble = ReadCommandScript(CommandScript)
+	if not Runs:
+		raise ValueError(CommandScript + " contains no runs.")
+	for Folder in ("jobs", "leases", "done", "shards", "timings", "expired"):
+		os.makedirs(FolderPath(Folder), exist_ok=True)
+
+	# Some command scripts (such as contribution tests) only delete the .vdf file after their last
+	# run, which only the node performing the last block would do.  Those deletions are moved to the
+	# postamble, which every node performs, so every node deletes its own .vdf file.
+	while Runs[-1] and CommandName(Runs[-1][-1]) == "FILE>DELETE":
+		Postamble.insert(0, Runs[-1].pop())
+
+	ResultsFiles = []
+	for Commands in Runs:
+		for Line in Commands:
+			if CommandName(Line) == "MENU>VDF2TAB" and ResultsFileOf(Line) not in ResultsFiles:
+				ResultsFiles.append(ResultsFileOf(Line))
+	for Name, Commands in (("Preamble.cmd", Preamble), ("Postamble.cmd", Postamble)):
+		with open(FolderPath(Name), 'w') as f:
+			f.write("\n".join(Commands) + "\n")
+
+	# A RUNNAME command starts a run (see RunVensimBatch.py), so the RunName set in the script's
+	# header belongs to the first run, and only the node performing the first block would see it.
+	# Each block therefore begins by setting the RunName in effect at its start, so every node
+	# uses its own RunName (and .vdf file) from its first block on.
+	Blocks = (len(Runs) + RunsPerBlock - 1) // RunsPerBlock
+	RunName = None
+	for Block in range(1, Blocks + 1):
+		with open(FolderPath("jobs", BlockName(Block) + ".cmd"), 'w') as f:
+			for Commands in Runs[(Block - 1) * RunsPerBlock:Block * RunsPerBlock]:
+				if RunName is not None and f.tell() == 0 and CommandName(Commands[0]) != "SIMULATE>RUNNAME":
+					f.write("SIMULATE>RUNNAME|" + RunName + "\n")
+				for Line in Commands:
+					if CommandName(Line) == "SIMULATE>RUNNAME":
+						RunName = Line.split("|", 1)[1].strip()
+				f.write("\n".join(Commands) + "\n\n")
+
+	# The manifest is written last, so nodes never see a partly published batch.
+	with open(FolderPath("Manifest.json.tmp"), 'w') as f:
+		json.dump({"CommandScript": CommandScript, "Runs": len(Runs), "RunsPerBlock": RunsPerBlock, "Blocks": Blocks, "ResultsFiles": ResultsFiles}, f, indent="\t")
+	os.replace(FolderPath("Manifest.json.tmp"), FolderPath("Manifest.json"))
+	return Blocks, len(Runs)
+
+
+# Performing Blocks
+# -----------------
+# The commands of a block are changed to use the node's RunName (and .vdf file name) and to
+# write the results to the node's own files.  State records, for each results file, whether
+# the block has written to it yet and whether the command script started a new file.
+def LocalizeCommands(Commands, Node, ResultsFiles, State):
+	Localized = []
+	for Line in Commands:
+		Name = CommandName(Line)
+		Arguments = Line.split("|", 1)[1] if "|" in Line else ""
+		if Name == "SIMULATE>RUNNAME":
+			Line = "SIMULATE>RUNNAME|" + Arguments.strip() + "-" + Node
+		elif Name == "FILE>DELETE" and Arguments.strip().endswith(".vdf"):
+			Line = "FILE>DELETE|" + Arguments.strip()[:-4] + "-" + Node + ".vdf"
+		elif Name == "MENU>VDF2TAB":
+			Head, Separator, Annotations = Arguments.partition(":")
+			Fields = Head.split("|")
+			if Fields[0].endswith(".vdf"):
+				Fields[0] = Fields[0][:-4] + "-" + Node + ".vdf"
+			ResultsFile = Fields[1]
+			Fields[1] = NodeResultsFile(Node, ResultsFiles.index(ResultsFile))
+			Appending = len(Fields) > 3 and "+" in Fields[3]
+			if not Appending:
+				State[ResultsFile] = "new file"
+			elif ResultsFile not in State:
+				State[ResultsFile] = "appended"
+				Fields[3] = ""
+			Line = "MENU>VDF2TAB|" + "|".join(Fields) + Separator + Annotations
+		Localized.append(Line)
+	return Localized
+
+def NodeResultsFile(Node, Number):
+	return "DistributedResults-" + Node + "-" + str(Number) + ".tsv"
+
+# The heartbeat renews the lease from a separate thread, so it continues while Vensim is
+# performing a run.
+class Heartbeat:
+
+	def __init__(self, LeaseFile):
+		self.LeaseFile = LeaseFile
+		self.Stopped = threading.Event()
+		self.Thread = threading.Thread(target=self.Beat, daemon=True)
+		self.Thread.start()
+
+	def Beat(self):
+		while not self.Stopped.wait(HeartbeatSeconds):
+			try:
+				os.utime(self.LeaseFile)
+			except OSError:
+				pass # The lease was taken over, so the block will probably be finished by another node.
+
+	def Stop(self):
+		self.Stopped.set()
+		self.Thread.join()
+
+# This claims the first block that is neither finished nor held under a current lease, and
+# returns its number (or None if there isn't one).  LeaseObservations records when this node
+# first saw each lease's current modification time.
+def ClaimBlock(Node, Manifest, LeaseObservations):
+	Done = set(os.listdir(FolderPath("done")))
+	Leases = set(os.listdir(FolderPath("leases")))
+	for Block in range(1, Manifest["Blocks"] + 1):
+		if BlockName(Block) + ".json" in Done:
+			continue
+		LeaseFile = FolderPath("leases", BlockName(Block) + ".lease")
+		if BlockName(Block) + ".lease" in Leases:
+			try:
+				ModificationTime = os.stat(LeaseFile).st_mtime
+			except FileNotFoundError:
+				continue
+			Observation = LeaseObservations.get(Block)
+			if Observation is None or Observation[0] != ModificationTime:
+				LeaseObservations[Block] = (ModificationTime, time.monotonic())
+				continue
+			if time.monotonic() - Observation[1] < LeaseSeconds:
+				continue
+			try:
+				os.rename(LeaseFile, FolderPath("expired", BlockName(Block) + "." + Node + "." + str(time.time()) + ".lease"))
+			except OSError:
+				continue # Another node took over the lease first.
+			print("Node " + Node + " is taking over the expired lease of " + BlockName(Block) + ".")
+		if CreateExclusively(LeaseFile, json.dumps({"Node": Node, "Claimed": time.time()})):
+			return Block
+	return None
+
+def PerformBlock(Vensim, Node, Manifest, Block, RunName, TimingLog):
+	JobFile = FolderPath("jobs", BlockName(Block) + ".cmd")
+	Preamble, Runs, Postamble = ReadCommandScript(JobFile)
+	Runs[-1].extend(Postamble)
+	State = {}
+	for Number, Commands in enumerate(Runs, start=(Block - 1) * Manifest["RunsPerBlock"] + 1):
+		Record = PerformCommands(Vensim, LocalizeCommands(Commands, Node, Manifest["ResultsFiles"], State), RunName)
+		Record.update({"Part": "run", "Run": Number, "Block": Block, "Node": Node})
+		TimingLog.write(json.dumps(Record) + "\n")
+		TimingLog.flush()
+
+	# The block is finished by moving its results into the shards folder and writing its done
+	# file.  If another node finished the block first, our results are discarded.
+	Shards = {}
+	for ResultsFile, Kind in State.items():
+		Number = Manifest["ResultsFiles"].index(ResultsFile)
+		Shard = BlockName(Block) + "." + Node + "." + str(Number) + ".tsv"
+		shutil.move(NodeResultsFile(Node, Number), FolderPath("shards", Shard))
+		Shards[ResultsFile] = {"Shard": Shard, "Kind": Kind}
+	if not CreateExclusively(FolderPath("done", BlockName(Block) + ".json"), json.dumps({"Node": Node, "Shards": Shards})):
+		for Entry in Shards.values():
+			os.remove(FolderPath("shards", Entry["Shard"]))
+		return False
+	os.remove(FolderPath("leases", BlockName(Block) + ".lease"))
+	return True
+
+def Work(Node, WorkExecutor):
+	Manifest = ReadManifest()
+	Vensim = MakeExecutor(WorkExecutor, {})
+	RunName = ["Current"]
+	with open(FolderPath("Preamble.cmd"), 'r') as f:
+		Preamble = [Line.rstrip("\n") for Line in f if Line.strip()]
+	with open(FolderPath("Postamble.cmd"), 'r') as f:
+		Postamble = [Line.rstrip("\n") for Line in f if Line.strip()]
+
+	LeaseObservations = {}
+	Performed = 0
+	with open(FolderPath("timings", Node + ".jsonl"), 'a') as TimingLog:
+		PerformCommands(Vensim, LocalizeCommands(Preamble, Node, Manifest["ResultsFiles"], {}), RunName)
+		while True:
+			Block = ClaimBlock(Node, Manifest, LeaseObservations)
+			if Block is None:
+				if len(os.listdir(FolderPath("done"))) >= Manifest["Blocks"]:
+					break
+				time.sleep(min(HeartbeatSeconds, LeaseSeconds / 10)) # Other nodes hold the remaining blocks, but their leases may expire.
+				continue
+			Beating = Heartbeat(FolderPath("leases", BlockName(Block) + ".lease"))
+			try:
+				Finished = PerformBlock(Vensim, Node, Manifest, Block, RunName, TimingLog)
+			finally:
+				Beating.Stop()
+			if Finished:
+				Performed += 1
+				print("Node " + Node + " finished " + BlockName(Block) + ".")
+		# A node that performed no blocks, or that already deleted its .vdf file after each run, has
+		# no .vdf file for the postamble to delete.
+		Postamble = [Line for Line in LocalizeCommands(Postamble, Node, Manifest["ResultsFiles"], {})
+			if CommandName(Line) != "FILE>DELETE" or os.path.exists(Line.split("|", 1)[1].strip())]
+		PerformCommands(Vensim, Postamble, RunName)
+	return Performed
+
+# Node names are used in file names, so only letters, digits, and hyphens are kept.
+def LocalNodeName():
+	return re.sub(r'[^A-Za-z0-9]+', "-", platform.node() or "node").strip("-") + "-" + str(os.getpid())
+
+def LocalWorker(WorkExecutor):
+	Node = LocalNodeName()
+	print("Node " + Node + " performed " + str(Work(Node, WorkExecutor)) + " blocks.")
+
+def StartLocalWorkers(WorkExecutor):
+	Processes = [multiprocessing.Process(target=LocalWorker, args=(WorkExecutor,)) for Worker in range(LocalWorkers)]
+	for Process in Processes:
+		Process.start()
+	for Process in Processes:
+		Process.join()
+
+
+# Status and Merging
+# ------------------
+def Status():
+	Manifest = ReadManifest()
+	Done = set(os.listdir(FolderPath("done")))
+	Claimed = len([Name for Name in os.listdir(FolderPath("leases")) if Name[:-6] + ".json" not in Done])
+	Nodes = [Name[:-6] for Name in os.listdir(FolderPath("timings"))]
+	return ["Blocks: " + str(Manifest["Blocks"]) + " (" + str(Manifest["Runs"]) + " runs)",
+		"Finished: " + str(len(Done)), "Claimed: " + str(Claimed), "Waiting: " + str(Manifest["Blocks"] - len(Done) - Claimed),
+		"Nodes that have worked on the batch: " + str(len(Nodes))]
+
+# Each results file starts from the last block in which the command script started a new file.
+def Merge():
+	Manifest = ReadManifest()
+	Markers = []
+	Missing = []
+	for Block in range(1, Manifest["Blocks"] + 1):
+		try:
+			with open(FolderPath("done", BlockName(Block) + ".json"), 'r') as f:
+				Markers.append(json.load(f))
+		except FileNotFoundError:
+			Missing.append(BlockName(Block))
+	if Missing:
+		raise ValueError(str(len(Missing)) + " blocks are not finished yet (the first is " + Missing[0] + ").  Wait for the nodes to finish them, then merge again.")
+
+	for ResultsFile in Manifest["ResultsFiles"]:
+		Entries = [Marker["Shards"][ResultsFile] for Marker in Markers if ResultsFile in Marker["Shards"]]
+		Start = max([Position for Position, Entry in enumerate(Entries) if Entry["Kind"] == "new file"] + [0])
+		with open(ResultsFile, 'w') as Merged:
+			for Position, Entry in enumerate(Entries[Start:]):
+				with open(FolderPath("shards", Entry["Shard"]), 'r') as Shard:
+					for Line in Shard:
+						if Position > 0 and Entry["Kind"] != "new file" and Line.startswith("Time\t"):
+							continue
+						Merged.write(Line)
+	return Manifest["ResultsFiles"]
+
+
+# Checking the Batch Tools
+# ------------------------
+# The "check" mode tries out the whole process on the CommandScript with the stand-in for
+# Vensim (see VensimExecutors.py), in a temporary folder: it runs the command script directly,
+# then publishes it, performs it with LocalWorkers nodes, and merges the results.  It returns a
+# list of problems: results that differ from the direct run, and .vdf files left behind (a
+# node that used a RunName other than its own, such as the stand-in's default "Current", or
+# that never performed the script's last deletion, would leave one).  Try it on both a
+# combinations script and a contribution test script, which delete their .vdf files differently.  Use LocalWorkers of 2 or more and a RunsPerBlock that gives several blocks
+# per node, so that some nodes never perform the first block.
+def VDFFiles():
+	return sorted(Name for Name in os.listdir(".") if Name.endswith(".vdf"))
+
+def Check():
+
+	# The files the command script reads are copied to the temporary folder.
+	import ValidateBatch
+	Start = os.getcwd()
+	with open(CommandScript, 'r') as Script:
+		Batch = ValidateBatch.ReadBatch(Script.read().splitlines())
+	InputFiles = [CommandScript] + Batch["VariableLists"] + Batch["SettingsFiles"] + [os.path.join("InputData", "plcy-schd", Folder, Folder + ".csv") for Folder in ("IT", "FT")]
+	global JobFolder
+	SharedJobFolder = JobFolder
+	CheckFolder = tempfile.mkdtemp(prefix="DistributedBatchCheck")
+	try:
+		for InputFile in InputFiles:
+			os.makedirs(os.path.join(CheckFolder, os.path.dirname(InputFile)), exist_ok=True)
+			shutil.copy(InputFile, os.path.join(CheckFolder, InputFile))
+		os.chdir(CheckFolder)
+		JobFolder = "DistributedBatch"
+
+		PerformBatch(MakeExecutor("StandIn", {}), CommandScript, "DirectTimings.jsonl")
+		ResultsFiles = list(dict.fromkeys(Batch["ResultsFiles"]))
+		for ResultsFile in ResultsFiles:
+			os.replace(ResultsFile, ResultsFile + ".direct")
+		Problems = []
+		if VDFFiles():
+			Problems.append(".vdf files were left behind by the direct run: " + ", ".join(VDFFiles()))
+
+		Publish()
+		StartLocalWorkers("StandIn")
+		Merge()
+		for ResultsFile in ResultsFiles:
+			with open(ResultsFile, 'r') as Merged, open(ResultsFile + ".direct", 'r') as Direct:
+				if Merged.read() != Direct.read():
+					Problems.append("The merged " + ResultsFile + " differs from the results of running " + CommandScript + " directly.")
+		if VDFFiles():
+			Problems.append(".vdf files were left behind by the nodes: " + ", ".join(VDFFiles()))
+		return Problems
+	finally:
+		os.chdir(Start)
+		JobFolder = SharedJobFolder
+		shutil.rmtree(CheckFolder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+	if Mode == "publish":
+		Blocks, Runs = Publish()
+		print("Published " + str(Runs) + " runs from " + CommandScript + " as " + str(Blocks) + " blocks in " + JobFolder + ".")
+	elif Mode == "work":
+		StartLocalWorkers(Executor)
+	elif Mode == "status":
+		print("\n".join(Status()))
+	elif Mode == "merge":
+		print("Wrote " + ", ".join(Merge()) + ".")
+	elif Mode == "check":
+		Problems = Check()
+		print("\n".join(Problems) if Problems else "The distributed results match the results of running " + CommandScript + " directly, and no .vdf files were left behind.")
+	else:
+		raise ValueError("Unknown Mode setting: " + Mode + ".  Use \"publish\", \"work\", \"status\", \"merge\", or \"check\".")
@@ -0,0 +1,332 @@
+# EPSScriptGenerators.py
+#
+# This is a Python module containing the functions that write Vensim command scripts.  The
+# Create...Script.py scripts hold the settings (such as which policies are enabled) and use
+# these functions to write their command scripts.  Other Python programs can import this
+# module to generate many command scripts in one process, for example, one for each of
+# several policy packages, without editing and running the Create...Script.py scripts.
+#
+# Nothing is done when this module is imported.  Each function takes the policies and
+# settings it needs as arguments (with the same names and defaults as in the scripts) and
+# returns the text of the command script, or an iterator over its parts (one part per run),
+# so very large scripts can be written without holding them in memory.  To save a script:
+#
+#	with open("GeneratedCombinationsScript.cmd", 'w') as f:
+#		f.writelines(EPSScriptGenerators.CombinationsScript(Policies))
+#
+# The functions raise a ValueError, with a message explaining the problem, when the policies
+# or settings can't produce a useful command script.
+
+
+import itertools
+
+
+# Index Definitions
+# -----------------
+# Policies are given in the format used by the scripts: each policy is a list (or tuple)
+# whose entries are, in order:
+Enabled = 0 # True or False
+LongName = 1 # The name of the policy lever in the model
+ShortName = 2 # The name used for the policy in the results file
+Settings = 3 # A list of setting values
+Group = 4 # The name of the group the policy belongs to (used in contribution tests)
+
+
+# Policy Lists
+# ------------
+def EnabledPolicies(PotentialPolicies):
+	return [Policy for Policy in PotentialPolicies if Policy[Enabled]]
+
+# This returns the unique groups used by the policies, in the order they first appear.
+def PolicyGroups(Policies):
+	Groups = []
+	for Policy in Policies:
+		if Policy[Group] not in Groups:
+			Groups.append(Policy[Group])
+	return Groups
+
+# This returns every combination of settings of the policies, as tuples of the positions of
+# the settings in each policy's list of settings, such as (0, 0, 1).  The last policy's
+# setting changes fastest.
+def PolicySettingCombinations(Policies):
+	return itertools.product(*[range(len(Policy[Settings])) for Policy in Policies])
+
+
+# Commands Shared by the Scripts
+# ------------------------------
+# Each script begins by loading the model and giving a RUNNAME that is used for all runs
+# (it is overwritten each run).  The NOINTERACTION and SAVELIST options may be useful in
+# certain cases, but they cause Vensim to produce an output window for each simulation that
+# acknowledges the completion of the command.  These output windows accumulate over the
+# course of many runs and cause slow-downs (and potentially crashes), so they are left out.
+def ScriptHeader(ModelFile, RunName):
+	return 'SPECIAL>LOADMODEL|"' + ModelFile + '"\n' + "SIMULATE>RUNNAME|" + RunName + "\n" + "\n"
+
+# This copies the results of a run from the .vdf file generated by Vensim to the results
+# file.  For the first entry in the results file, we include the "Time" row and overwrite
+# any existing file of that name; other entries are appended.  Any text that follows (up to
+# the end of the line) is added to the results file as extra columns.  Please see the page
+# on the VDF2TAB function in the Vensim reference manual for details.
+def VDF2TABCommand(RunName, RunResultsFile, OutputVarsFile, FirstEntry):
+	if FirstEntry:
+		return "MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|||||:"
+	return "MENU>VDF2TAB|" + RunName + ".vdf|" + RunResultsFile + "|" + OutputVarsFile + "|+!||||:"
+
+# We instruct Vensim to delete the .vdf file, to prevent it from getting picked up by sync
+# software, such as DropBox or Google Drive.  If sync software locks the file, Vensim won't be
+# able to overwrite it on the next model run, ruining the batch.
+def DeleteCommand(RunName):
+	return "FILE>DELETE|" + RunName + ".vdf" + "\n\n"
+
+def SetValCommand(Lever, Value):
+	return "SIMULATE>SETVAL|" + Lever + "=" + str(Value) + "\n"
+
+def PolicyScheduleCommand(PolicySchedule):
+	return SetValCommand("Policy Implementation Schedule Selector", PolicySchedule)
+
+
+# Policy Schedule Sweeps
+# ----------------------
+# The combinations and contribution test scripts accept either one policy implementation
+# schedule number or a list of them.  With a list, the runs are repeated for each schedule,
+# and the results of each run are labeled with a "PolicySchedule=" column.  A run in which
+# every policy lever is zero (a BAU run) gives the same results with any schedule, so it is
+# simulated once and its results are copied to the results file once for each schedule.
+# With a single number, no column is added, so the scripts are the same as they have always
+# been.  This returns a list of (Schedule, ScheduleColumn) pairs.
+def PolicyScheduleSweep(PolicySchedule):
+	if not isinstance(PolicySchedule, (list, tuple)):
+		return [(PolicySchedule, "")]
+	if len(PolicySchedule) < 1:
+		raise ValueError("Error: The list of policy implementation schedules is empty.  Give at least one schedule number.")
+	if len(set(str(Schedule) for Schedule in PolicySchedule)) < len(PolicySchedule):
+		raise ValueError("Error: The list of policy implementation schedules (" + ", ".join(str(Schedule) for Schedule in PolicySchedule) + ") contains a schedule more than once.")
+	return [(Schedule, "\tPolicySchedule=" + str(Schedule)) for Schedule in PolicySchedule]
+
+
+# Combinations Script
+# -------------------
+# One run for every combination of settings of the policies (see CreateCombinationsScript.py)
+# and, if several are given, every policy schedule.  The results of each run are labeled with
+# the RunName, a run number, the schedule (when several are given), and the setting of each
+# policy, followed by "-" columns if needed to make MinPolicyCols policy columns.  Each copy
+# of a shared BAU run gets its own run number.
+def CombinationsScript(Policies, ModelFile="EPS.mdl", RunName="MostRecentRun", RunResultsFile="RunResults.tsv", OutputVarsFile="OutputVarsToExport.lst", MinPolicyCols=0, PolicySchedule=1):
+	if len(Policies) < 1:
+		raise ValueError("Error: No policies were enabled in the Python script.  Before running the script, you must enable at least two policies.")
+	elif len(Policies) == 1:
+		raise ValueError("Error: Only one policy was enabled in the Python script.  Before running the script, you must enable at least two policies.")
+	return CombinationsScriptParts(Policies, ModelFile, RunName, RunResultsFile, OutputVarsFile, MinPolicyCols, PolicyScheduleSweep(PolicySchedule))
+
+def CombinationsScriptParts(Policies, ModelFile, RunName, RunResultsFile, OutputVarsFile, MinPolicyCols, Schedules):
+	yield ScriptHeader(ModelFile, RunName)
+	ExtraColumns = "\t-" * max(0, MinPolicyCols - len(Policies))
+	RunNumber = 0
+	for Combination in PolicySettingCombinations(Policies):
+		Values = [str(Policy[Settings][Setting]) for Policy, Setting in zip(Policies, Combination)]
+		PolicyColumns = "".join("\t" + Policy[ShortName] + "=" + Value for Policy, Value in zip(Policies, Values)) + ExtraColumns + "\n"
+		if len(Schedules) > 1 and all(Policy[Settings][Setting] == 0 for Policy, Setting in zip(Policies, Combination)):
+			Runs = [Schedules]
+		else:
+			Runs = [[Schedule] for Schedule in Schedules]
+		for Exports in Runs:
+			Text = ("".join("SIMULATE>SETVAL|" + Policy[LongName] + "=" + Value + "\n" for Policy, Value in zip(Policies, Values))
+				+ PolicyScheduleCommand(Exports[0][0])
+				+ "MENU>RUN|O\n")
+			for Schedule, ScheduleColumn in Exports:
+				RunNumber += 1
+				Text += (VDF2TABCommand(RunName, RunResultsFile, OutputVarsFile, RunNumber == 1)
+					+ RunName + "\tCurrentRunNumber=" + str(RunNumber) + ScheduleColumn + PolicyColumns)
+			yield Text + DeleteCommand(RunName)
+
+
+# Contribution Test Script
+# ------------------------
+# In "Enable" mode, there is a run with no policies, a run with each group of policies
+# enabled in turn, and a run with every group enabled.  In "Disable" mode, there is a run
+# with every group enabled, a run with each group disabled in turn, and a run with no
+# policies.  "Both" mode performs the runs of both modes, but the run with no policies and the
+# run with every group enabled are only performed once, and their results are copied to the
+# results file with the labels of both modes ("EnabledPolicyGroup=None" and
+# "DisabledPolicyGroup=All" for the run with no policies, "EnabledPolicyGroup=All" and
+# "DisabledPolicyGroup=None" for the run with every group enabled).  Each enabled policy uses
+# the second entry in its list of settings.  Vensim clears SETVAL changes after each run, so
+# each run only needs SETVAL commands for the policies it enables.  When several policy
+# schedules are given, the runs are repeated for each schedule, except the run with no
+# policies, which is shared.  See CreateContributionTestScript.py.
+def ContributionTestScript(Policies, EnableOrDisableGroups="Disable", ModelFile="EPS.mdl", RunName="MostRecentRun", RunResultsFile="ContributionTestResults.tsv", OutputVarsFile="OutputVarsToExport.lst", PolicySchedule=1):
+	if len(Policies) < 1:
+		raise ValueError("Error: No policies were enabled in the Python script.  Before running the script, you must enable at least one policy.")
+	Runs = ContributionTestRuns(Policies, EnableOrDisableGroups, PolicyScheduleSweep(PolicySchedule))
+	return itertools.chain([ScriptHeader(ModelFile, RunName)], ContributionTestScriptParts(Runs, RunName, RunResultsFile, OutputVarsFile))
+
+def ContributionTestScriptParts(Runs, RunName, RunResultsFile, OutputVarsFile):
+	for RunNumber, (Commands, Labels) in enumerate(Runs):
+		Text = Commands + "MENU>RUN|O\n"
+		for LabelNumber, Label in enumerate(Labels):
+			Text += VDF2TABCommand(RunName, RunResultsFile, OutputVarsFile, RunNumber == 0 and LabelNumber == 0) + Label + "\n"
+		yield Text + (DeleteCommand(RunName) if RunNumber == len(Runs) - 1 else "\n")
+
+# This returns the annotations for one copy of a contribution test run's results.
+def ContributionTestLabel(Mode, GroupName, PolicyNames, ScheduleColumn):
+	Prefix = "Enabled" if Mode == "Enable" else "Disabled"
+	return ScheduleColumn + "\t" + Prefix + "PolicyGroup=" + str(GroupName) + "\t" + Prefix + "Policies=" + PolicyNames
+
+# This returns the runs of a contribution test, in order, as a list of (Commands, Labels)
+# entries, where Commands are the SETVAL commands for the run and Labels are the annotations
+# for each copy of its results.
+def ContributionTestRuns(Policies, EnableOrDisableGroups, Schedules):
+	Modes = ["Enable", "Disable"] if EnableOrDisableGroups == "Both" else ["Enable"] if EnableOrDisableGroups == "Enable" else ["Disable"]
+
+	# The run with no policies (a BAU case run) is the same for every schedule
+	BAURun = ("", [ContributionTestLabel(Mode, GroupName, GroupName, ScheduleColumn)
+		for PolicySchedule, ScheduleColumn in Schedules for Mode, GroupName in [("Enable", "None"), ("Disable", "All")] if Mode in Modes])
+
+	Runs = [] if Modes == ["Disable"] else [BAURun]
+	for PolicySchedule, ScheduleColumn in Schedules:
+
+		# A run with each group enabled in turn
+		if "Enable" in Modes:
+			for EnabledGroup in PolicyGroups(Policies):
+				GroupPolicies = [Policy for Policy in Policies if Policy[Group] == EnabledGroup]
+				Runs.append(("".join(SetValCommand(Policy[LongName], Policy[Settings][1]) for Policy in GroupPolicies) + PolicyScheduleCommand(PolicySchedule),
+					[ContributionTestLabel("Enable", EnabledGroup, ", ".join(Policy[ShortName] for Policy in GroupPolicies), ScheduleColumn)]))
+
+		# A run with all of the groups enabled (a full policy case run)
+		Runs.append(("".join(SetValCommand(Policy[LongName], Policy[Settings][1]) for Policy in Policies) + PolicyScheduleCommand(PolicySchedule),
+			[ContributionTestLabel(Mode, GroupName, GroupName, ScheduleColumn) for Mode, GroupName in [("Disable", "None"), ("Enable", "All")] if Mode in Modes]))
+
+		# A run with each group disabled in turn
+		if "Disable" in Modes:
+			for DisabledGroup in PolicyGroups(Policies):
+				Runs.append(("".join(SetValCommand(Policy[LongName], Policy[Settings][1]) for Policy in Policies if Policy[Group] != DisabledGroup) + PolicyScheduleCommand(PolicySchedule),
+					[ContributionTestLabel("Disable", DisabledGroup, ", ".join(Policy[ShortName] for Policy in Policies if Policy[Group] == DisabledGroup), ScheduleColumn)]))
+
+	if Modes == ["Disable"]:
+		Runs.append(BAURun)
+	return Runs
+
+
+# Data Logging Script
+# -------------------
+# One run for each settings file (.cin), with its results in a separate file named after the
+# settings file ("NoSettings.tsv" for a blank entry).  We use a SAVELIST to reduce the size of
+# the output files, and clear it at the end, since Vensim fails to clear the savelist entry
+# in the program after script execution.  See CreateDataLoggingScript.py.
+def DataLoggingRunName(SettingsFile):
+	if len(SettingsFile) < 5:
+		return "NoSettings"
+	return SettingsFile[:len(SettingsFile) - 4]
+
+def DataLoggingScript(SettingsFiles, ModelFile="EPS.mdl", OutputVarsFile="OutputVarsToExport.lst"):
+	yield 'SPECIAL>LOADMODEL|"' + ModelFile + '"\n\n' + "SIMULATE>SAVELIST|" + OutputVarsFile + "\n"
+	for SettingsFile in SettingsFiles:
+		RunName = DataLoggingRunName(SettingsFile)
+		yield ("SIMULATE>RUNNAME|" + RunName + "\n"
+			+ "SIMULATE>READCIN|" + SettingsFile + "\n"
+			+ "MENU>RUN|O\n"
+			+ VDF2TABCommand(RunName, RunName + ".tsv", OutputVarsFile, True) + RunName + "\n"
+			+ DeleteCommand(RunName))
+	yield "SIMULATE>SAVELIST|\n"
+
+
+# Carbon Cap to Tax Script
+# ------------------------
+# These write the runs used to find the carbon tax equivalent to a carbon cap (see
+# CreateCarbonCapToTaxScript.py).  Sectors lists every sector with a carbon tax lever.
+#
+# CarbonTaxRun returns the commands for one run with the carbon tax lever of every covered
+# sector set to LeverSetting.  We read the complementary policies file for every simulation,
+# so we override its policy implementation schedule and carbon tax settings every time.  The
+# ComplementaryPoliciesFile may instead be a scenario read by ScenarioLibrary.LoadScenario, in
+# which case its settings are written as SETVALs (only those that differ from the model's own
+# values), so no file is read during the runs.
+# Exports is a list of (CoveredSectorList, ExtraColumns) entries: the run taxes the sectors in
+# the first entry's CoveredSectorList, and its results are copied to the RunResultsFile once
+# for each entry, labeled with the price, that entry's covered sectors, and any ExtraColumns
+# (which must begin with a tab).  Several entries are only useful when the run is the same for
+# each of them, as it is for a price of zero.
+def CarbonTaxRun(LeverSetting, Exports, FirstEntry, Sectors, ComplementaryPoliciesFile="", PolicySchedule=1, RunName="MostRecentRun", RunResultsFile="RunResults.tsv", OutputVarsFile="OutputVarsForCarbonCapToTaxScript.lst"):
+	if isinstance(ComplementaryPoliciesFile, dict):
+		import ScenarioLibrary
+		Overrides = [("Policy Implementation Schedule Selector", PolicySchedule)] + [("Additional Carbon Tax Rate[" + Sector + "]", LeverSetting if Sector in Exports[0][0] else 0) for Sector in Sectors]
+		Text = ScenarioLibrary.SettingCommands(ComplementaryPoliciesFile, Overrides)
+	else:
+		Text = "SIMULATE>READCIN|" + ComplementaryPoliciesFile + "\n" + PolicyScheduleCommand(PolicySchedule)
+		for Sector in Sectors:
+			Text += SetValCommand("Additional Carbon Tax Rate[" + Sector + "]", LeverSetting if Sector in Exports[0][0] else 0)
+	Text += "MENU>RUN|O\n"
+	for CoveredSectorList, ExtraColumns in Exports:
+		Text += VDF2TABCommand(RunName, RunResultsFile, OutputVarsFile, FirstEntry)
+		FirstEntry = False
+		Text += "CurrentPrice=\t" + str(LeverSetting) + "\tCovered sectors=" + ", ".join(CoveredSectorList) + ExtraColumns + "\n"
+	return Text + DeleteCommand(RunName)
+
+# Coverage options can share runs: we list every run each option needs, keyed by the carbon
+# tax lever setting of each sector, so runs needed by more than one option are only simulated
+# once.  This returns a dictionary mapping each run's key to (LeverSetting, Exports), in the
+# order the runs are first needed.
+def CoverageSetRuns(CoverageSets, Sectors, PriceFloor, PriceCeiling):
+	Runs = {}
+	for CoverageSetNumber, CoverageSet in enumerate(CoverageSets, 1):
+		CurrentPrice = PriceFloor
+		while CurrentPrice <= PriceCeiling:
+			RunKey = tuple(CurrentPrice if Sector in CoverageSet else 0 for Sector in Sectors)
+			Runs.setdefault(RunKey, (CurrentPrice, []))[1].append((CoverageSet, "\tCoverageSet=" + str(CoverageSetNumber)))
+			CurrentPrice += 1
+	return Runs
+
+# In Scan mode, there is one run for every whole-currency-unit price from PriceFloor to
+# PriceCeiling, either for the CoveredSectors or for each of several CoverageSets.
+def CarbonCapScanScript(CoveredSectors, Sectors, PriceFloor, PriceCeiling, CoverageSets=(), ModelFile="EPS.mdl", ComplementaryPoliciesFile="", PolicySchedule=1, RunName="MostRecentRun", RunResultsFile="RunResults.tsv", OutputVarsFile="OutputVarsForCarbonCapToTaxScript.lst"):
+	if PriceCeiling <= PriceFloor:
+		raise ValueError("Error: PriceCeiling must be greater than PriceFloor.")
+	return CarbonCapScanScriptParts(CoveredSectors, Sectors, PriceFloor, PriceCeiling, CoverageSets, ModelFile, (Sectors, ComplementaryPoliciesFile, PolicySchedule, RunName, RunResultsFile, OutputVarsFile))
+
+def CarbonCapScanScriptParts(CoveredSectors, Sectors, PriceFloor, PriceCeiling, CoverageSets, ModelFile, RunSettings):
+	yield ScriptHeader(ModelFile, RunSettings[3])
+	if not CoverageSets:
+		CurrentPrice = PriceFloor
+		while CurrentPrice <= PriceCeiling:
+			yield CarbonTaxRun(CurrentPrice, [(CoveredSectors, "")], CurrentPrice == PriceFloor, *RunSettings)
+			CurrentPrice += 1
+	else:
+		Runs = CoverageSetRuns(CoverageSets, Sectors, PriceFloor, PriceCeiling)
+		for RunNumber, (LeverSetting, Exports) in enumerate(Runs.values()):
+			yield CarbonTaxRun(LeverSetting, Exports, RunNumber == 0, *RunSettings)
+
+
+# Adaptive Sweep Script
+# ---------------------
+# One run for each (Policy, Setting) pair in Runs, with only that policy enabled (see
+# CreateAdaptiveSweepScript.py).  The results of each run are labeled with the Round, the
+# policy's ShortName, and its setting.  A setting of zero gives the same results for every
+# policy, so one run with no policies enabled is copied to the results once for each policy
+# that needs a zero setting.
+def AdaptiveSweepScript(Runs, Round, ModelFile="EPS.mdl", RunName="MostRecentRun", RunResultsFile="AdaptiveSweepResults.tsv", OutputVarsFile="OutputVarsToExport.lst", PolicySchedule=1):
+	if len(Runs) < 1:
+		raise ValueError("Error: No runs are needed for the adaptive sweep.")
+	return AdaptiveSweepScriptParts(Runs, Round, ModelFile, RunName, RunResultsFile, OutputVarsFile, PolicySchedule)
+
+def SweepLabels(Round, Policy, Setting):
+	return "\tSweepRound=" + str(Round) + "\tSweptPolicy=" + Policy[ShortName] + "\tSetting=" + str(Setting) + "\n"
+
+def AdaptiveSweepScriptParts(Runs, Round, ModelFile, RunName, RunResultsFile, OutputVarsFile, PolicySchedule):
+	yield ScriptHeader(ModelFile, RunName)
+	ZeroRuns = [(Policy, Setting) for Policy, Setting in Runs if Setting == 0]
+	FirstEntry = True
+	if ZeroRuns:
+		Text = PolicyScheduleCommand(PolicySchedule) + "MENU>RUN|O\n"
+		for Policy, Setting in ZeroRuns:
+			Text += VDF2TABCommand(RunName, RunResultsFile, OutputVarsFile, FirstEntry) + SweepLabels(Round, Policy, Setting)
+			FirstEntry = False
+		yield Text + DeleteCommand(RunName)
+	for Policy, Setting in Runs:
+		if Setting == 0:
+			continue
+		yield (SetValCommand(Policy[LongName], Setting)
+			+ PolicyScheduleCommand(PolicySchedule)
+			+ "MENU>RUN|O\n"
+			+ VDF2TABCommand(RunName, RunResultsFile, OutputVarsFile, FirstEntry) + SweepLabels(Round, Policy, Setting)
+			+ DeleteCommand(RunName))
+		FirstEntry = False
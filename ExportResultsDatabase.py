@@ -0,0 +1,230 @@
+# ExportResultsDatabase.py
+#
+# This is a Python script that copies results files produced by the generated Vensim command
+# scripts into a SQLite database, in which each run's labels are stored once rather than on
+# every row.  In a results file, every row repeats the labels of its run (the run number, the
+# setting of each policy, and so on), and files from batches with different sets of policies
+# can only be appended if their label columns line up (which is what MinPolicyCols is for).
+# In the database, results from any number of files, with any labels, sit side by side, and
+# finding the runs with a given policy setting is an indexed lookup.
+#
+# Importing a file that is already in the database replaces its runs, so the script can be
+# rerun after a batch is rerun.  Files of any type can be imported, including pruned files
+# (see PruneRunResults.py), whose rows that refer to the baseline run are stored with the
+# baseline values.
+#
+# Tables
+# ------
+#	files			file_id, path
+#	runs			run_id, file_id, position (the run's order in its file), labels (all of its
+#					labels, as written in the file)
+#	run_labels		run_id, name, value: each label that is not a policy setting, such as
+#					CurrentRunNumber, PolicySchedule, or EnabledPolicyGroup (bare labels, such as
+#					the RunName, have an empty name)
+#	levers			run_id, lever (the policy's LongName), short_name, value: each policy setting
+#	variables		variable_id, variable, subscript (such as "electricity sector", or "" if none)
+#	yearly_values	run_id, variable_id, year, value (NULL where Vensim wrote ":NA:")
+# The view "results" joins these into one row per run, variable, and year.  For example, the
+# 2050 emissions of every run in which the carbon tax lever is 100:
+#
+#	SELECT runs.labels, yearly_values.value FROM levers
+#		JOIN runs USING (run_id) JOIN yearly_values USING (run_id) JOIN variables USING (variable_id)
+#		WHERE levers.lever = 'Additional Carbon Tax Rate[electricity sector]' AND levers.value = 100
+#		AND variables.variable = 'Output Total CO2e Emissions' AND yearly_values.year = 2050;
+#
+# Parquet Files
+# -------------
+# Some analysis tools read Parquet files more easily than SQLite.  If ParquetFolder is set, each
+# table is also written to a Parquet file in that folder after the import.  This requires the
+# pyarrow package.
+
+
+# File Names
+# ----------
+RunResultsFiles = ["RunResults.tsv"] # The results files to import
+DatabaseFile = "RunResults.sqlite" # The SQLite database to create or add to
+ParquetFolder = "" # If not blank, the folder in which to write a Parquet file for each table
+
+
+# Policy Names
+# ------------
+# The results files label each policy setting with the policy's ShortName.  The ShortNames are
+# matched with the LongNames (lever names) of the policies in these scripts.  Annotations that
+# are not the ShortName of a policy are stored as labels.
+PolicyScripts = ["CreateCombinationsScript.py", "CreateContributionTestScript.py", "CreateContributionTestScript-CostCurve.py"]
+
+
+import ast
+import os
+import re
+import sqlite3
+import time
+from RunResultsReader import IterateRunResults
+
+RowsPerInsert = 100000 # The number of yearly values inserted at a time
+
+Schema = """
+CREATE TABLE IF NOT EXISTS files (file_id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL REFERENCES files, position INTEGER NOT NULL, labels TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS run_labels (run_id INTEGER NOT NULL REFERENCES runs, name TEXT NOT NULL, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS levers (run_id INTEGER NOT NULL REFERENCES runs, lever TEXT NOT NULL, short_name TEXT NOT NULL, value REAL);
+CREATE TABLE IF NOT EXISTS variables (variable_id INTEGER PRIMARY KEY, variable TEXT NOT NULL, subscript TEXT NOT NULL, UNIQUE (variable, subscript));
+CREATE TABLE IF NOT EXISTS yearly_values (run_id INTEGER NOT NULL REFERENCES runs, variable_id INTEGER NOT NULL REFERENCES variables, year INTEGER NOT NULL, value REAL,
+	PRIMARY KEY (run_id, variable_id, year)) WITHOUT ROWID;
+CREATE VIEW IF NOT EXISTS results AS SELECT files.path, runs.run_id, runs.position, runs.labels, variables.variable, variables.subscript, yearly_values.year, yearly_values.value
+	FROM yearly_values JOIN runs USING (run_id) JOIN files USING (file_id) JOIN variables USING (variable_id);
+"""
+
+# The indexes are created after the rows are inserted, which is faster than updating them
+# with every row.
+Indexes = """
+CREATE INDEX IF NOT EXISTS runs_by_file ON runs (file_id);
+CREATE INDEX IF NOT EXISTS run_labels_by_run ON run_labels (run_id);
+CREATE INDEX IF NOT EXISTS run_labels_by_value ON run_labels (name, value);
+CREATE INDEX IF NOT EXISTS levers_by_run ON levers (run_id);
+CREATE INDEX IF NOT EXISTS levers_by_value ON levers (lever, value);
+CREATE INDEX IF NOT EXISTS yearly_values_by_variable ON yearly_values (variable_id, year);
+"""
+
+
+# Reading the Policy Names
+# ------------------------
+# We read the policy lists from the scripts as text (as LeverReachability.py does), so the
+# scripts' own settings aren't affected.  This returns a dictionary mapping each ShortName to
+# its LongName.
+def PolicyLongNames(ScriptFiles):
+	LongNames = {}
+	for ScriptFile in ScriptFiles:
+		if not os.path.exists(ScriptFile):
+			continue
+		with open(ScriptFile, 'r') as Script:
+			for LongName, ShortName in re.findall(r'^\s*\((?:True|False),\s*("(?:[^"\\]|\\.)*"),\s*("(?:[^"\\]|\\.)*")', Script.read(), re.M):
+				LongNames.setdefault(ast.literal_eval(ShortName), ast.literal_eval(LongName))
+	return LongNames
+
+
+# Importing a Results File
+# ------------------------
+# Variables are written with their subscripts, such as "Output Total CO2e Emissions by
+# Sector[electricity sector]".  This returns the name and the subscript separately.
+def SplitSubscript(Variable):
+	if Variable.endswith("]") and "[" in Variable:
+		Start = Variable.index("[")
+		return Variable[:Start].strip(), Variable[Start + 1:-1].strip()
+	return Variable, ""
+
+def LeverValue(Value):
+	try:
+		return float(Value)
+	except ValueError:
+		return None
+
+def RemoveFile(Connection, FileName):
+	Found = Connection.execute("SELECT file_id FROM files WHERE path = ?", (FileName,)).fetchone()
+	if Found is None:
+		return
+	Runs = "(SELECT run_id FROM runs WHERE file_id = " + str(Found[0]) + ")"
+	for Table in ("yearly_values", "levers", "run_labels"):
+		Connection.execute("DELETE FROM " + Table + " WHERE run_id IN " + Runs)
+	Connection.execute("DELETE FROM runs WHERE file_id = ?", Found)
+	Connection.execute("DELETE FROM files WHERE file_id = ?", Found)
+
+# This imports one results file and returns the number of runs and yearly values it added.
+def ImportFile(Connection, FileName, LongNames):
+
+	RemoveFile(Connection, FileName)
+	FileID = Connection.execute("INSERT INTO files (path) VALUES (?)", (FileName,)).lastrowid
+	VariableIDs = {(Variable, Subscript): VariableID for VariableID, Variable, Subscript in Connection.execute("SELECT variable_id, variable, subscript FROM variables")}
+	RowVariableIDs = {}
+
+	Current = None
+	RunID = None
+	Position = 0
+	Values = []
+	NumValues = 0
+	for Years, Variable, Annotations, RowValues in IterateRunResults(FileName):
+		if Years is None:
+			raise ValueError(FileName + " has no \"Time\" row, so the years of its values are unknown.")
+
+		# A new run begins when the annotations change
+		if Annotations != Current:
+			Current = Annotations
+			Position += 1
+			Labels = "\t".join((Name + "=" if Name else "") + Value for Name, Value in Annotations)
+			RunID = Connection.execute("INSERT INTO runs (file_id, position, labels) VALUES (?, ?, ?)", (FileID, Position, Labels)).lastrowid
+			Connection.executemany("INSERT INTO levers (run_id, lever, short_name, value) VALUES (?, ?, ?, ?)",
+				[(RunID, LongNames[Name], Name, LeverValue(Value)) for Name, Value in Annotations if Name in LongNames])
+			Connection.executemany("INSERT INTO run_labels (run_id, name, value) VALUES (?, ?, ?)",
+				[(RunID, Name, Value) for Name, Value in Annotations if Name not in LongNames])
+
+		VariableID = RowVariableIDs.get(Variable)
+		if VariableID is None:
+			Key = SplitSubscript(Variable)
+			if Key not in VariableIDs:
+				VariableIDs[Key] = Connection.execute("INSERT INTO variables (variable, subscript) VALUES (?, ?)", Key).lastrowid
+			VariableID = RowVariableIDs[Variable] = VariableIDs[Key]
+
+		# A run can't have two rows for the same variable, so a repeated row replaces the first
+		Values.extend((RunID, VariableID, Year, Value if Value == Value else None) for Year, Value in zip(Years, RowValues))
+		if len(Values) >= RowsPerInsert:
+			Connection.executemany("INSERT OR REPLACE INTO yearly_values (run_id, variable_id, year, value) VALUES (?, ?, ?, ?)", Values)
+			NumValues += len(Values)
+			Values = []
+
+	Connection.executemany("INSERT OR REPLACE INTO yearly_values (run_id, variable_id, year, value) VALUES (?, ?, ?, ?)", Values)
+	return Position, NumValues + len(Values)
+
+
+# Writing Parquet Files
+# ---------------------
+# Each table is read from the database and written in pieces, so large tables don't need to
+# fit in memory.
+def WriteParquetFiles(Connection, Folder):
+
+	import pyarrow
+	import pyarrow.parquet
+
+	os.makedirs(Folder, exist_ok=True)
+	for Table in ("files", "runs", "run_labels", "levers", "variables", "yearly_values"):
+		Cursor = Connection.execute("SELECT * FROM " + Table)
+		Columns = [Description[0] for Description in Cursor.description]
+		Writer = None
+		while True:
+			Rows = Cursor.fetchmany(RowsPerInsert)
+			if not Rows:
+				break
+			Piece = pyarrow.table({Column: [Row[Number] for Row in Rows] for Number, Column in enumerate(Columns)})
+			if Writer is None:
+				Writer = pyarrow.parquet.ParquetWriter(os.path.join(Folder, Table + ".parquet"), Piece.schema)
+			Writer.write_table(Piece.cast(Writer.schema))
+		if Writer is not None:
+			Writer.close()
+
+
+if __name__ == "__main__":
+
+	if ParquetFolder:
+		try:
+			import pyarrow
+		except ImportError:
+			import sys
+			sys.exit("The pyarrow package is needed to write Parquet files.  Install it, or set ParquetFolder to \"\".")
+
+	LongNames = PolicyLongNames(PolicyScripts)
+	Connection = sqlite3.connect(DatabaseFile)
+	try:
+		# The database can be rebuilt from the results files, so we don't wait for each write to
+		# reach the disk, and a large page cache keeps the tables' newest pages in memory.
+		Connection.execute("PRAGMA synchronous = OFF")
+		Connection.execute("PRAGMA cache_size = -256000")
+		Connection.executescript(Schema)
+		for FileName in RunResultsFiles:
+			Start = time.perf_counter()
+			with Connection:
+				NumRuns, NumValues = ImportFile(Connection, FileName, LongNames)
+			print("Imported " + str(NumRuns) + " runs (" + str(NumValues) + " values) from " + FileName + " in " + format(time.perf_counter() - Start, ".1f") + " seconds.")
+		Connection.executescript(Indexes)
+		if ParquetFolder:
+			WriteParquetFiles(Connection, ParquetFolder)
+	finally:
+		Connection.close()
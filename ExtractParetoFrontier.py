@@ -0,0 +1,219 @@
+# ExtractParetoFrontier.py
+#
+# This is a Python script that finds the Pareto frontier (the "non-dominated" runs) in the
+# results of a large batch, such as one produced by the Vensim command script generated by
+# CreateCombinationsScript.py.  A run is on the frontier if no other run is at least as good
+# in every objective and better in at least one.  For example, with cost and cumulative
+# emissions as the objectives, the frontier is the set of policy packages for which no other
+# package both costs less and emits less.  For each year in FrontierYears, the script writes
+# the frontier runs with their objective values and the setting of each policy (labeled by
+# its ShortName, as in the results file).
+#
+# The results are read one row at a time, and the frontier is updated as each run is read,
+# so only the runs on the frontier are held in memory.  Batches of millions of runs can be
+# processed this way, and the frontier is usually a small fraction of the runs.
+#
+# Algorithms
+# ----------
+# With two objectives, the frontier is kept sorted by the first objective, which means it is
+# also sorted (in the opposite order) by the second.  Each new run is compared only with its
+# neighbors in that order, found by binary search, so adding a run takes O(log n) comparisons
+# plus the removal of any frontier runs it dominates.  With more than two objectives, there is
+# no such ordering, so each new run is compared with every run on the frontier (the "block
+# nested loop" method).  This is still fast, since the frontier is small compared to the batch.
+#
+# Runs whose objective values are identical to those of a run already on the frontier are
+# left out, so each point on the frontier is represented by the first run that reached it.
+# Runs missing an objective variable, or with an objective value that is not a number
+# (":NA:"), are skipped and counted.
+
+
+# File Names
+# ----------
+# The results files are treated as one batch, so a batch split across several files (see
+# DistributedBatch.py) can be processed at once.
+RunResultsFiles = ["RunResults.tsv"] # The results files to search
+FrontierFile = "ParetoFrontier.tsv" # The desired filename of the TSV file containing the frontier runs
+
+
+# Objectives
+# ----------
+# Each objective is a variable (which must be in the OutputVarsFile used for the batch) and
+# whether lower ("min") or higher ("max") values are better.  The objectives are compared using
+# each variable's value in each of the FrontierYears.
+Objectives = [
+	("Output First Year NPV of CapEx and OpEx through This Year with Revenue Neutral Taxes and Subsidies", "min"),
+	("Output Cumulative Total CO2e Emissions", "min")
+]
+FrontierYears = [2030, 2050] # A separate frontier is found for each of these years
+
+
+# Annotations
+# -----------
+# Every annotation of a run other than the ones named below is treated as a policy setting
+# (ShortName=Value) and written to the FrontierFile.  Bare labels, such as the RunName, are
+# never written.  The run number is written in its own column.
+RunNumberAnnotation = "CurrentRunNumber"
+IgnoredAnnotations = []
+
+
+import bisect
+import time
+from RunResultsReader import IterateRunResults, AnnotationValue, YearPositions
+
+
+# Frontiers
+# ---------
+# Both kinds of frontier store, for each run, its objective values (as a tuple in which every
+# objective is to be minimized) and an "Entry" describing the run.  Add returns True if the
+# run joined the frontier.
+class TwoObjectiveFrontier:
+
+	def __init__(self):
+		self.Firsts = [] # Ascending
+		self.NegatedSeconds = [] # Ascending, so the second objective is descending
+		self.Entries = []
+
+	def Add(self, Point, Entry):
+		First, Second = Point
+
+		# A run is dominated by the frontier run with the largest first objective that is no
+		# larger than its own, if that run's second objective is no larger either.
+		Position = bisect.bisect_right(self.Firsts, First)
+		if Position > 0 and -self.NegatedSeconds[Position - 1] <= Second:
+			return False
+
+		# The new run dominates the runs after it whose second objective is no smaller.  (A run
+		# just before it with an equal first objective has a larger second objective, so the new
+		# run dominates that run too.)
+		Start = Position
+		if Start > 0 and self.Firsts[Start - 1] == First:
+			Start -= 1
+		End = bisect.bisect_right(self.NegatedSeconds, -Second, Start)
+		self.Firsts[Start:End] = [First]
+		self.NegatedSeconds[Start:End] = [-Second]
+		self.Entries[Start:End] = [Entry]
+		return True
+
+	def Runs(self):
+		return [((First, -NegatedSecond), Entry) for First, NegatedSecond, Entry in zip(self.Firsts, self.NegatedSeconds, self.Entries)]
+
+	def __len__(self):
+		return len(self.Entries)
+
+
+class BlockNestedLoopFrontier:
+
+	def __init__(self):
+		self.Points = []
+		self.Entries = []
+
+	def Add(self, Point, Entry):
+		Kept = []
+		for Position, Other in enumerate(self.Points):
+			if all(OtherValue <= Value for OtherValue, Value in zip(Other, Point)):
+				return False
+			if not all(Value <= OtherValue for Value, OtherValue in zip(Point, Other)):
+				Kept.append(Position)
+		if len(Kept) < len(self.Points):
+			self.Points = [self.Points[Position] for Position in Kept]
+			self.Entries = [self.Entries[Position] for Position in Kept]
+		self.Points.append(Point)
+		self.Entries.append(Entry)
+		return True
+
+	def Runs(self):
+		return sorted(zip(self.Points, self.Entries), key=lambda Run: Run[0])
+
+	def __len__(self):
+		return len(self.Entries)
+
+
+def NewFrontier(NumObjectives):
+	if NumObjectives == 2:
+		return TwoObjectiveFrontier()
+	return BlockNestedLoopFrontier()
+
+
+# Reading Runs
+# ------------
+# VDF2TAB writes all the rows of a run together, so a run ends when the annotations change.
+# This yields (FileName, RunPosition, Annotations, Values) for every run, where Values maps
+# each objective variable to its list of values in the FrontierYears (or is missing it).
+def IterateRuns(FileNames, Variables, RequestedYears):
+
+	RunPosition = 0
+	for FileName in FileNames:
+		Current = None
+		Values = {}
+		Positions = None
+		for Years, Variable, Annotations, RowValues in IterateRunResults(FileName):
+			if Annotations != Current:
+				if Current is not None:
+					yield FileName, RunPosition, Current, Values
+				Current = Annotations
+				Values = {}
+				RunPosition += 1
+			if Variable in Variables:
+				if Positions is None:
+					Positions = YearPositions(Years, RequestedYears)
+				Values[Variable] = [RowValues[Position] for Position in Positions]
+		if Current is not None:
+			yield FileName, RunPosition, Current, Values
+
+
+def PolicySettings(Annotations):
+	return [(Name, Value) for Name, Value in Annotations if Name and Name != RunNumberAnnotation and Name not in IgnoredAnnotations]
+
+
+if __name__ == "__main__":
+
+	if len(Objectives) < 2:
+		raise ValueError("At least two Objectives are needed to find a Pareto frontier.")
+	for Variable, Direction in Objectives:
+		if Direction not in ("min", "max"):
+			raise ValueError("The direction of " + Variable + " must be \"min\" or \"max\", not \"" + str(Direction) + "\".")
+	Variables = set(Variable for Variable, Direction in Objectives)
+	Signs = [1 if Direction == "min" else -1 for Variable, Direction in Objectives]
+
+	Start = time.perf_counter()
+	Frontiers = [NewFrontier(len(Objectives)) for Year in FrontierYears]
+	NumRuns = 0
+	Skipped = 0
+	for FileName, RunPosition, Annotations, Values in IterateRuns(RunResultsFiles, Variables, FrontierYears):
+		NumRuns += 1
+		if len(Values) < len(Variables):
+			Skipped += 1
+			continue
+		Points = [tuple(Sign * Values[Variable][YearNumber] for Sign, (Variable, Direction) in zip(Signs, Objectives)) for YearNumber in range(len(FrontierYears))]
+		if any(Value != Value for Point in Points for Value in Point):
+			Skipped += 1
+			continue
+		Entry = (FileName, AnnotationValue(Annotations, RunNumberAnnotation, str(RunPosition)), PolicySettings(Annotations))
+		for Frontier, Point in zip(Frontiers, Points):
+			Frontier.Add(Point, Entry)
+
+	if NumRuns == 0:
+		raise ValueError("No runs were found in the RunResultsFiles.")
+
+	# Every policy setting found on any frontier gets a column, in the order first seen.
+	SettingNames = []
+	for Frontier in Frontiers:
+		for Point, (FileName, RunNumber, Settings) in Frontier.Runs():
+			for Name, Value in Settings:
+				if Name not in SettingNames:
+					SettingNames.append(Name)
+
+	with open(FrontierFile, 'w') as f:
+		f.write("Year\tResults File\tRun Number\t" + "\t".join(Variable for Variable, Direction in Objectives))
+		f.write("".join("\t" + Name for Name in SettingNames) + "\n")
+		for Year, Frontier in zip(FrontierYears, Frontiers):
+			for Point, (FileName, RunNumber, Settings) in Frontier.Runs():
+				Settings = dict(Settings)
+				f.write(str(Year) + "\t" + FileName + "\t" + RunNumber)
+				f.write("".join("\t" + str(Sign * Value) for Sign, Value in zip(Signs, Point)))
+				f.write("".join("\t" + Settings.get(Name, "") for Name in SettingNames) + "\n")
+
+	print("Read " + str(NumRuns) + " runs in " + format(time.perf_counter() - Start, ".1f") + " seconds (" + str(Skipped) + " skipped for missing values).")
+	for Year, Frontier in zip(FrontierYears, Frontiers):
+		print(str(Year) + ": " + str(len(Frontier)) + " runs on the frontier.")
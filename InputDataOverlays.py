@@ -0,0 +1,187 @@
+# InputDataOverlays.py
+#
+# This is a Python script, and a module used by other scripts, that creates "overlays": folders
+# that look like the model folder (with the model file and the whole InputData folder) but in
+# which a few input data files are replaced.  The model reads its input data from fixed paths
+# relative to the model file (such as InputData/elec/BCpUC/BCpUC.csv), so to run the model
+# with different input data, it must be loaded from a folder containing the changed files.
+# Copying the whole InputData folder for every variant of the input data takes a long time and
+# a lot of disk space.  An overlay instead links to the original model file and to every input
+# data folder and file that is unchanged, and only holds real copies of the replaced files
+# (and of the folders leading to them), so it takes milliseconds to create and to delete.
+#
+# Variants
+# --------
+# A variant of the input data is described by a manifest: a text file listing, on each line,
+# the path of an input data file to replace (relative to the InputData folder) and the file
+# to replace it with (relative to the manifest), separated by a tab:
+#
+#	# High natural gas prices
+#	fuels/BFCpUEbS/BFCpUEbS-natural-gas.csv	HighGasPrices/BFCpUEbS-natural-gas.csv
+#
+# Lines beginning with "#" are comments.  Other scripts can also create overlays directly from
+# the text of the replacement files (see CreateOverlay).  Each replaced file must be one the
+# model reads, so a mistyped path is reported instead of silently having no effect.
+#
+# Links
+# -----
+# Unchanged files and folders are linked with symbolic links.  Where symbolic links aren't
+# available (on Windows, creating them requires Developer Mode or administrator rights), each
+# unchanged file is linked with a hard link instead, and where that isn't possible either (for
+# example, if the overlay is on a different drive from the model), it is copied.  Either kind
+# of link gives the model the original file without copying it.  Nothing writes to the linked
+# files: deleting an overlay removes only the links, never the files they link to.
+#
+# Run as a Script
+# ---------------
+# When run by itself, this script creates an overlay for each of the VariantManifests in the
+# OverlayFolder (each named after its manifest), or deletes them if RemoveOverlays is True.
+# The model can then be opened from each overlay's folder in Vensim.  VensimWorkerPool.py can
+# also create an overlay for each run (see the "InputDataOverlay" entry of its runs).
+
+
+# File Names
+# ----------
+ModelFile = "EPS.mdl" # The name of the Vensim model file
+VariantManifests = [] # The manifests of the variants for which to create overlays
+OverlayFolder = "Overlays" # The folder in which to create the overlays
+
+
+# Other Settings
+# --------------
+RemoveOverlays = False # If True, delete the overlays of the VariantManifests instead of creating them
+
+
+import os
+import re
+import shutil
+import time
+import ModelIndex
+
+
+InputFolderName = "InputData"
+
+
+# Reading Manifests
+# -----------------
+# Paths in a manifest may also begin with "InputData/", and use either kind of slash.
+def InputDataPath(Path):
+	Path = Path.strip().replace("\\", "/").strip("/")
+	if Path.startswith(InputFolderName + "/"):
+		Path = Path[len(InputFolderName) + 1:]
+	return Path
+
+# This returns a dictionary mapping each replaced path (relative to the InputData folder) to
+# the text of its replacement.
+def ReadVariantManifest(FileName):
+	Replacements = {}
+	with open(FileName, 'r') as Manifest:
+		for LineNumber, Line in enumerate(Manifest, start=1):
+			if not Line.strip() or Line.startswith("#"):
+				continue
+			Fields = Line.rstrip("\r\n").split("\t")
+			if len(Fields) != 2:
+				raise ValueError("Line " + str(LineNumber) + " of " + FileName + " should contain an input data path and a replacement file, separated by a tab.")
+			with open(os.path.join(os.path.dirname(FileName), Fields[1].strip()), 'r', newline='') as Replacement:
+				Replacements[InputDataPath(Fields[0])] = Replacement.read()
+	return Replacements
+
+def VariantName(ManifestFile):
+	return os.path.splitext(os.path.basename(ManifestFile))[0]
+
+# The input data files read by the model are the quoted paths in its GET DIRECT functions.
+# They are found once for each version of the model file, since reading the model takes
+# longer than creating an overlay.
+ModelInputFileCache = {}
+
+def ModelInputFiles(ModelFile):
+	Key = (os.path.abspath(ModelFile), os.path.getmtime(ModelFile))
+	if Key not in ModelInputFileCache:
+		Quoted = re.findall(r"'(" + InputFolderName + r"[/\\][^'\n]*)'", ModelIndex.ReadModelText(ModelFile))
+		ModelInputFileCache[Key] = set(InputDataPath(Path) for Path in Quoted)
+	return ModelInputFileCache[Key]
+
+
+# Creating and Removing Overlays
+# ------------------------------
+# Whether symbolic links can be created is found out the first time one is needed.
+SymbolicLinksWork = None
+
+def LinkEntry(Source, Destination, IsFolder):
+	global SymbolicLinksWork
+	if SymbolicLinksWork is not False:
+		try:
+			os.symlink(os.path.abspath(Source), Destination, target_is_directory=IsFolder)
+			SymbolicLinksWork = True
+			return
+		except (OSError, NotImplementedError):
+			if SymbolicLinksWork:
+				raise
+			SymbolicLinksWork = False
+	if IsFolder:
+		os.mkdir(Destination)
+		for Entry in os.scandir(Source):
+			LinkEntry(Entry.path, os.path.join(Destination, Entry.name), Entry.is_dir())
+		return
+	try:
+		os.link(Source, Destination)
+	except OSError:
+		shutil.copy2(Source, Destination)
+
+# This creates an overlay in OverlayPath, which must not exist yet, and returns the path of
+# the model file in it.  Replacements maps each path to replace (relative to the InputData
+# folder) to the text (or bytes) of its replacement.
+def CreateOverlay(OverlayPath, Replacements, ModelFile=ModelFile):
+	Replacements = dict((InputDataPath(Path), Contents) for Path, Contents in Replacements.items())
+	ModelFolder = os.path.dirname(os.path.abspath(ModelFile))
+	ModelInputs = ModelInputFiles(ModelFile)
+	for Path in Replacements:
+		if Path not in ModelInputs:
+			raise ValueError(InputFolderName + "/" + Path + " is not an input data file read by " + ModelFile + ", so replacing it would have no effect.")
+
+	# Folders leading to replaced files are created in the overlay; everything else is linked.
+	Folders = set([""])
+	for Path in Replacements:
+		Parts = Path.split("/")
+		for Depth in range(1, len(Parts)):
+			Folders.add("/".join(Parts[:Depth]))
+
+	os.makedirs(OverlayPath)
+	LinkEntry(os.path.abspath(ModelFile), os.path.join(OverlayPath, os.path.basename(ModelFile)), False)
+	def Build(Folder):
+		os.mkdir(os.path.join(OverlayPath, InputFolderName, Folder))
+		for Entry in os.scandir(os.path.join(ModelFolder, InputFolderName, Folder)):
+			Path = Entry.name if not Folder else Folder + "/" + Entry.name
+			Destination = os.path.join(OverlayPath, InputFolderName, Path)
+			if Path in Folders:
+				Build(Path)
+			elif Path in Replacements:
+				if isinstance(Replacements[Path], bytes):
+					Replacement = open(Destination, 'wb')
+				else:
+					Replacement = open(Destination, 'w', newline='')
+				with Replacement:
+					Replacement.write(Replacements[Path])
+			else:
+				LinkEntry(Entry.path, Destination, Entry.is_dir())
+	Build("")
+	return os.path.join(OverlayPath, os.path.basename(ModelFile))
+
+# Deleting an overlay removes its links and replaced files, not the files the links point to.
+def RemoveOverlay(OverlayPath):
+	if os.path.exists(OverlayPath):
+		shutil.rmtree(OverlayPath)
+
+
+if __name__ == "__main__":
+	for ManifestFile in VariantManifests:
+		OverlayPath = os.path.join(OverlayFolder, VariantName(ManifestFile))
+		Start = time.perf_counter()
+		if RemoveOverlays:
+			RemoveOverlay(OverlayPath)
+			print("Removed " + OverlayPath + " in " + format((time.perf_counter() - Start) * 1000, ".0f") + " ms.")
+		else:
+			Replacements = ReadVariantManifest(ManifestFile)
+			RemoveOverlay(OverlayPath)
+			CreateOverlay(OverlayPath, Replacements, ModelFile)
+			print("Created " + OverlayPath + " (" + str(len(Replacements)) + " replaced files) in " + format((time.perf_counter() - Start) * 1000, ".0f") + " ms.")
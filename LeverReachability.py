@@ -0,0 +1,296 @@
+# LeverReachability.py
+#
+# This is a Python script that determines which model variables each policy lever can
+# possibly affect, by following the dependencies between the model's equations (as read
+# by ModelIndex.py).  If no chain of equations leads from a lever to an output variable,
+# changing the lever cannot change that output, so runs that only vary the lever are
+# wasted when only that output is of interest.
+#
+# The generator scripts (CreateCombinationsScript.py and the contribution test scripts) use
+# this when their DropUnreachablePolicies setting is enabled.  Run this script by itself to
+# list which enabled and disabled policies in CreateCombinationsScript.py can reach the
+# variables in the OutputVarsFile.
+#
+# Dependencies are followed separately for each element of a variable's first subscript, so
+# a lever for one sector can be found unable to reach another sector's outputs.  For example, "Percentage Reduction of Separately Regulated Pollutants[LDVs,NOx]"
+# reaches "Output Total CO2e Emissions by Sector[transportation sector]", but not the
+# electricity sector's element, and "Fraction of Afforestation and Reforestation Achieved"
+# only reaches the LULUCF sector's element.  Other subscripts are ignored, and references
+# that can't be matched to one element (such as sums over a range, or the allocation
+# functions) are treated as references to every element.  This can only overstate what a
+# lever reaches, never understate it, so a lever reported as unable to reach an output truly
+# cannot affect it.  Levers often reach far beyond their own sector through prices and
+# shared totals, so few levers are dropped when the outputs are model-wide totals.
+# The index covers every lever (every variable defined by typed-in numbers) and every
+# variable, and it is cached by a hash of the model file, so after the first use, answering
+# a question takes no time.
+
+
+# File Names
+# ----------
+ModelFile = "EPS.mdl" # The name of the Vensim model file
+OutputVarsFile = "OutputVarsToExport.lst" # The variables of interest, one per line
+
+
+import re
+import ModelIndex
+
+
+# Elements
+# --------
+# Dependencies are followed separately for each element of a variable's first subscript, so
+# "Output Total CO2e Emissions by Sector[transportation sector]" depends only on the
+# transportation parts of the model.  Each element of a subscripted variable's first
+# subscript is a node, named like "variable[element]" (with the canonical names); a variable
+# without subscripts is a single node, named like the variable.  Other subscripts are ignored
+# (all of their elements share a node).
+ReachabilityVersion = 2 # Increase this when the format of the reachability index changes, so older caches are rebuilt
+
+def FirstDimensionElements(Index, Subscript):
+	Range = Index["Subscripts"].get(ModelIndex.CanonicalName(Subscript.rstrip("!")))
+	if Range is None:
+		return [ModelIndex.CanonicalName(Subscript)]
+	return [ModelIndex.CanonicalName(Element) for Element in Range["Elements"]]
+
+def VariableElements(Index, Variable):
+	Elements = {}
+	for Equation in Variable["Equations"]:
+		if not Equation["Subscripts"]:
+			return []
+		for Element in FirstDimensionElements(Index, Equation["Subscripts"][0]):
+			Elements[Element] = True
+	return list(Elements)
+
+def NodeName(Name, Element):
+	return Name if Element is None else Name + "[" + Element + "]"
+
+# This returns the variable names referred to in an equation, each with the list of its
+# subscripts as written (or None if it has none), such as ("fuel price", ["natural gas", "Sector!"]).
+# Anything that isn't a variable (function names, numbers) is returned too, and ignored later.
+def ExpressionReferences(Expression):
+	Expression = re.sub(r"'[^']*'", " ", Expression)
+	Expression = re.sub(r'\{[^}]*\}', " ", Expression)
+	References = []
+	End = None
+	for Token in re.finditer(r'"([^"]*)"|\[([^\]]*)\]|([^()+\-*/^,=<>:;!&|\n\t"\[\]]+)', Expression):
+		if Token.group(2) is not None:
+			if References and End == Token.start() and References[-1][1] is None:
+				References[-1][1] = [Subscript.strip() for Subscript in Token.group(2).split(",")]
+		else:
+			Name = ModelIndex.CanonicalName(Token.group(1) if Token.group(1) is not None else Token.group(3))
+			if Name:
+				References.append([Name, None])
+		End = Token.end()
+	return References
+
+# These functions combine the values of several elements of the variables passed to them (the
+# "!" that marks a SUM is not needed), so a reference inside them is treated as a reference to
+# every element.
+ArrayFunctions = re.compile(r'ALLOCATE|VECTOR|MARKET|AT PRICE|ELM', re.I)
+
+# This returns the elements of the referenced variable's first subscript that one element of
+# an equation depends on, or None for all of them.  A reference follows the equation's element
+# only if its first subscript is the same range as the equation's first subscript (as in
+# "Total[Sector] = A[Sector] + B[Sector]"); a reference to one element depends on that
+# element; and a reference to another range, or to a range marked with "!", depends on the
+# elements of that range.
+def ReferencedElements(Index, Arguments, EquationRange, EquationElement, ElementWise):
+	if not Arguments:
+		return None
+	First = Arguments[0]
+	Canonical = ModelIndex.CanonicalName(First.rstrip("!"))
+	if ElementWise and "!" not in First and EquationRange is not None and Canonical == EquationRange:
+		return [EquationElement]
+	if Canonical in Index["Subscripts"]:
+		return FirstDimensionElements(Index, First)
+	return [Canonical]
+
+def BuildDependencyGraph(Index):
+	Variables = Index["Variables"]
+	Elements = {Name: VariableElements(Index, Variable) for Name, Variable in Variables.items()}
+	ElementSets = {Name: set(Elements[Name]) for Name in Variables}
+	Dependencies = {NodeName(Name, Element): set() for Name in Variables for Element in (Elements[Name] or [None])}
+	for Name, Variable in Variables.items():
+		for Equation in Variable["Equations"]:
+			if Equation["Subscripts"] and Elements[Name]:
+				EquationRange = ModelIndex.CanonicalName(Equation["Subscripts"][0])
+				EquationElements = FirstDimensionElements(Index, Equation["Subscripts"][0])
+			else:
+				EquationRange = None
+				EquationElements = Elements[Name] or [None]
+			ElementWise = not ArrayFunctions.search(Equation["Expression"])
+			References = [(Reference, Arguments) for Reference, Arguments in ExpressionReferences(Equation["Expression"]) if Reference in Variables]
+			for EquationElement in EquationElements:
+				Node = Dependencies[NodeName(Name, EquationElement)]
+				for Reference, Arguments in References:
+					if not Elements[Reference]:
+						Node.add(Reference)
+						continue
+					# Elements the variable doesn't have (such as those of a range mapped to its own) are
+					# treated as a reference to every element.
+					Referenced = ReferencedElements(Index, Arguments, EquationRange, EquationElement, ElementWise)
+					Referenced = [Element for Element in Referenced or [] if Element in ElementSets[Reference]] or Elements[Reference]
+					Node.update(NodeName(Reference, Element) for Element in Referenced)
+	return Dependencies
+
+
+# Building the Index
+# ------------------
+# Every node is given a number (its position in the sorted list of node names), and the set
+# of nodes reachable from a lever's node is stored as an integer whose bits are set for each
+# reachable node.  We find the set for every node at once: first we group the nodes into
+# strongly connected components (sets of nodes that all depend on one another, which
+# feedback loops create), then we visit the components so that every component's successors
+# are visited before it, combining their sets.
+def BuildReachabilityIndex(Index):
+
+	Dependencies = BuildDependencyGraph(Index)
+	Names = sorted(Dependencies)
+	Numbers = {Name: Number for Number, Name in enumerate(Names)}
+	Successors = [[] for Name in Names]
+	for Name in Names:
+		for Dependency in Dependencies[Name]:
+			Successors[Numbers[Dependency]].append(Numbers[Name])
+
+	# Tarjan's algorithm (written without recursion, since chains of equations are long).
+	# It finishes each component only after every component reachable from it, so we can
+	# compute each component's reachable set as soon as it is finished.
+	Order = [None] * len(Names)
+	LowLink = [0] * len(Names)
+	OnStack = [False] * len(Names)
+	Stack = []
+	Component = [None] * len(Names)
+	Reachable = []
+	Counter = 0
+	for Start in range(len(Names)):
+		if Order[Start] is not None:
+			continue
+		Work = [(Start, 0)]
+		while Work:
+			Node, Position = Work.pop()
+			if Position == 0:
+				Order[Node] = LowLink[Node] = Counter
+				Counter += 1
+				Stack.append(Node)
+				OnStack[Node] = True
+			Descended = False
+			while Position < len(Successors[Node]):
+				Successor = Successors[Node][Position]
+				Position += 1
+				if Order[Successor] is None:
+					Work.append((Node, Position))
+					Work.append((Successor, 0))
+					Descended = True
+					break
+				elif OnStack[Successor]:
+					LowLink[Node] = min(LowLink[Node], Order[Successor])
+			if Descended:
+				continue
+			if Work and Work[-1][0] != Node:
+				Parent = Work[-1][0]
+				LowLink[Parent] = min(LowLink[Parent], LowLink[Node])
+			if LowLink[Node] == Order[Node]:
+				Members = []
+				while True:
+					Member = Stack.pop()
+					OnStack[Member] = False
+					Component[Member] = len(Reachable)
+					Members.append(Member)
+					if Member == Node:
+						break
+				Bits = 0
+				for Member in Members:
+					Bits |= 1 << Member
+				for Member in Members:
+					for Successor in Successors[Member]:
+						if Component[Successor] is not None and Component[Successor] != len(Reachable):
+							Bits |= Reachable[Component[Successor]]
+				Reachable.append(Bits)
+
+	Levers = {Name: format(Reachable[Component[Numbers[Name]]], "x") for Name in Names if Index["Variables"][Name.split("[")[0]]["Kind"] == "constant"}
+	return {"ModelHash": Index["ModelHash"], "ReachabilityVersion": ReachabilityVersion, "Nodes": Names, "Levers": Levers}
+
+
+# This loads the reachability index for a model, building and caching it if needed.
+def LoadReachabilityIndex(ModelFile="EPS.mdl"):
+	Index = ModelIndex.LoadModelIndex(ModelFile)
+	CacheFile = ModelIndex.CacheFileName(ModelFile, Index["ModelHash"], "reachability")
+	Reachability = ModelIndex.LoadCache(CacheFile)
+	if Reachability is None or Reachability.get("ModelHash") != Index["ModelHash"] or Reachability.get("ReachabilityVersion") != ReachabilityVersion:
+		Reachability = BuildReachabilityIndex(Index)
+		ModelIndex.SaveCache(CacheFile, Reachability)
+	return Reachability
+
+
+# Queries
+# -------
+# Levers and outputs are given as they are written in the scripts, such as
+# "Fuel Price Deregulation[natural gas]".  A reference with subscripts is the node of its first
+# subscript's element; a reference without them (or whose first subscript is a range) covers
+# every node of the variable.  A lever that isn't in the index (because it isn't a typed-in
+# constant in the model) is treated as reaching everything, so it is never dropped by mistake.
+def ReferenceNodes(Reachability, Reference):
+	Numbers = Reachability.get("Numbers")
+	if Numbers is None:
+		Numbers = Reachability["Numbers"] = {Name: Number for Number, Name in enumerate(Reachability["Nodes"])}
+		VariableNodes = Reachability["VariableNodes"] = {}
+		for Name, Number in Numbers.items():
+			VariableNodes.setdefault(Name.split("[")[0], []).append(Number)
+	Name, Subscripts = ModelIndex.SplitSubscripts(Reference)
+	Name = ModelIndex.CanonicalName(Name)
+	if Subscripts and NodeName(Name, ModelIndex.CanonicalName(Subscripts[0])) in Numbers:
+		return [Numbers[NodeName(Name, ModelIndex.CanonicalName(Subscripts[0]))]]
+	return Reachability["VariableNodes"].get(Name)
+
+def LeverReaches(Reachability, Lever, Output):
+	LeverNodes = ReferenceNodes(Reachability, Lever)
+	OutputNodes = ReferenceNodes(Reachability, Output)
+	if LeverNodes is None or OutputNodes is None:
+		return True
+	Bits = Reachability.setdefault("Bits", {})
+	OutputBits = 0
+	for Number in OutputNodes:
+		OutputBits |= 1 << Number
+	for Number in LeverNodes:
+		Node = Reachability["Nodes"][Number]
+		if Node not in Reachability["Levers"]:
+			return True
+		if Node not in Bits:
+			Bits[Node] = int(Reachability["Levers"][Node], 16)
+		if Bits[Node] & OutputBits:
+			return True
+	return False
+
+def ReachableOutputs(Reachability, Lever, Outputs):
+	return [Output for Output in Outputs if LeverReaches(Reachability, Lever, Output)]
+
+
+# This is used by the generator scripts.  It returns the policies (in the generators' list
+# format, with the long name at position LongNameIndex) that can affect at least one variable
+# in the OutputVarsFile, and prints the names of any policies that were dropped.
+def DropPoliciesThatCannotReachOutputs(Policies, LongNameIndex, ModelFile, OutputVarsFile):
+	Reachability = LoadReachabilityIndex(ModelFile)
+	Outputs = ModelIndex.ReadVariableList(OutputVarsFile)
+	Kept = []
+	for Policy in Policies:
+		if ReachableOutputs(Reachability, Policy[LongNameIndex], Outputs):
+			Kept.append(Policy)
+		else:
+			print("Dropping " + Policy[LongNameIndex] + ": it cannot affect any variable in " + OutputVarsFile + ".")
+	return Kept
+
+
+if __name__ == "__main__":
+	import ast
+	import re
+
+	# We read the policy list from CreateCombinationsScript.py as text, so that the script's
+	# own settings (and the command script it writes) aren't affected.
+	with open("CreateCombinationsScript.py", 'r') as GeneratorScript:
+		PolicyNames = re.findall(r'^\s*\((?:True|False),\s*("(?:[^"\\]|\\.)*")', GeneratorScript.read(), re.M)
+	Reachability = LoadReachabilityIndex(ModelFile)
+	Outputs = ModelIndex.ReadVariableList(OutputVarsFile)
+	for PolicyName in PolicyNames:
+		PolicyName = ast.literal_eval(PolicyName)
+		Reached = ReachableOutputs(Reachability, PolicyName, Outputs)
+		print(PolicyName + "\t" + (", ".join(Reached) if Reached else "(no effect on the listed outputs)"))
@@ -0,0 +1,307 @@
+# ModelIndex.py
+#
+# This is a Python module that reads the equations in the Vensim model file (EPS.mdl) and
+# builds an index of the model's variables and subscripts.  Other scripts use the index to
+# check variable names, follow dependencies between variables, and estimate the size of
+# model outputs, without needing Vensim.  It is not meant to be run by itself.
+#
+# The index is saved to a cache file named after a hash of the model file.  Later requests
+# for the index of an unchanged model load the cache instead, and editing the model
+# automatically produces a new index.
+#
+# The Index
+# ---------
+# The index is a dictionary (which can be saved as JSON) with the following entries:
+#	"ModelHash": the SHA-256 hash of the model file
+#	"Variables": a dictionary mapping each variable's canonical name (see CanonicalName below)
+#		to a dictionary describing the variable:
+#			"Name": the name as written in the model
+#			"Kind": "constant" (numbers typed into the model, such as policy levers),
+#				"input data" (constants read from InputData with GET DIRECT CONSTANTS),
+#				"data" (time series read from InputData), "lookup", "level" (stocks,
+#				defined with INTEG), "initial" (computed once, with INITIAL), or "auxiliary"
+#			"Equations": a list with one entry for each equation defining the variable (a
+#				variable may have several, for different subscripts), each a dictionary with
+#				"Subscripts" (the subscripts on the left side) and "Expression" (the right side)
+#			"Dependencies": the canonical names of the variables its equations refer to
+#			"Units": the units of measure given in the model
+#			"View": the name of the model view (sketch) where the variable is defined
+#	"Subscripts": a dictionary mapping each subscript range's canonical name to a dictionary
+#		with "Name" and "Elements" (the list of element names, with sub-ranges expanded)
+#	"Elements": a dictionary mapping each subscript element's canonical name to the list of
+#		canonical names of the ranges that contain it
+
+import hashlib
+import json
+import os
+import re
+
+
+ModelIndexCacheFolder = "ModelIndexCache" # Cached indexes are saved in this folder (next to the model file)
+ModelIndexVersion = 2 # Increase this when the index format changes, so older caches are rebuilt
+
+
+# Names
+# -----
+# Vensim treats variable names as case-insensitive, and treats underscores and spaces (and
+# runs of whitespace) as equivalent.  We use the following canonical form as the key for
+# every name in the index.
+def CanonicalName(Name):
+	Name = Name.strip()
+	if len(Name) >= 2 and Name[0] == '"' and Name[-1] == '"':
+		Name = Name[1:-1]
+	return " ".join(Name.replace("_", " ").split()).lower()
+
+
+# This splits a variable reference such as "Fuel Price Deregulation[natural gas]" into the
+# name and a list of its subscripts (an empty list if it has none).
+def SplitSubscripts(Reference):
+	Match = re.match(r'\s*(.*?)\s*(?:\[(.*)\])?\s*$', Reference, re.S)
+	Name, SubscriptText = Match.group(1), Match.group(2)
+	if SubscriptText is None:
+		return Name, []
+	return Name, [Subscript.strip() for Subscript in SubscriptText.split(",")]
+
+
+# Reading the Model File
+# ----------------------
+# Each entry in the equations section of a .mdl file ends with a "|" at the end of a line,
+# and is divided by "~" into the definition, the units, and a comment.  Long lines are
+# continued with a backslash.  The sketch (diagram) information follows the equations.
+SketchMarker = "\\\\\\---///"
+
+def ReadModelText(ModelFile):
+	with open(ModelFile, 'r', encoding='utf-8', errors='replace') as ModelText:
+		return ModelText.read()
+
+def JoinContinuedLines(Text):
+	return re.sub(r'\\[ \t]*\r?\n[ \t]*', '', Text)
+
+
+# Subscript ranges list their elements, which may include other ranges (to be expanded) or
+# numbered sequences such as "(Schedule1-Schedule9)".  A mapping to another range may follow "->",
+# and {comments} describing the elements may appear anywhere in the list.
+def ParseSubscriptElements(Text):
+	Text = re.sub(r'\{[^}]*\}', " ", Text.split("->")[0])
+	Elements = []
+	for Element in Text.split(","):
+		Element = Element.strip()
+		Sequence = re.match(r'\(\s*(.*?)(\d+)\s*-\s*(.*?)(\d+)\s*\)$', Element)
+		if Sequence:
+			Elements.extend(Sequence.group(1) + str(Number) for Number in range(int(Sequence.group(2)), int(Sequence.group(4)) + 1))
+		elif Element:
+			Elements.append(Element)
+	return Elements
+
+
+# Dependencies
+# ------------
+# To find the variables an equation refers to, we remove everything that can't be part of a
+# variable name (strings, comments, and subscripts), split what remains at operators and
+# punctuation, and keep the pieces that match a variable name.  Function names (like SUM or
+# IF THEN ELSE) and numbers don't match any variable, so they are ignored.
+def ExpressionNames(Expression):
+	Expression = re.sub(r"'[^']*'", " ", Expression)
+	Expression = re.sub(r'\{[^}]*\}', " ", Expression)
+	QuotedNames = re.findall(r'"([^"]*)"', Expression)
+	Expression = re.sub(r'"[^"]*"', " ", Expression)
+	Expression = re.sub(r'\[[^\]]*\]', " ", Expression)
+	Names = [CanonicalName(Piece) for Piece in re.split(r'[()+\-*/^,=<>:;!&|\n\t]', Expression)]
+	return set(Name for Name in Names + [CanonicalName(Name) for Name in QuotedNames] if Name)
+
+
+def ClassifyEquation(Operator, Expression):
+	Expression = re.sub(r'\{[^}]*\}', " ", Expression)
+	Upper = Expression.upper()
+	if Operator == "(" or "GET DIRECT LOOKUPS" in Upper or "GET XLS LOOKUPS" in Upper:
+		return "lookup"
+	if Operator == ":=" or "GET DIRECT DATA" in Upper or "GET XLS DATA" in Upper:
+		return "data"
+	if "GET DIRECT CONSTANTS" in Upper or "GET XLS CONSTANTS" in Upper:
+		return "input data"
+	if re.match(r'[\s\d.eE+\-,;]*$', Expression) and re.search(r'\d', Expression):
+		return "constant"
+	if "INTEG" in Upper:
+		return "level"
+	if re.match(r'\s*INITIAL\s*\(', Upper):
+		return "initial"
+	return "auxiliary"
+
+
+# Sketch Views
+# ------------
+# Each view in the sketch section begins with a line "*View Name".  Variables appear on lines
+# beginning with "10,"; the third field is the name, and an odd value in the ninth field marks
+# the variable's home view (other appearances are shadow copies).
+def ReadVariableViews(SketchText):
+	Views = {}
+	CurrentView = None
+	for Line in SketchText.splitlines():
+		if Line.startswith("*"):
+			CurrentView = Line[1:].strip()
+		elif Line.startswith("10,") and CurrentView is not None:
+			Fields = Line.split(",")
+			if len(Fields) > 8 and Fields[8].isdigit() and int(Fields[8]) % 2 == 1:
+				Views.setdefault(CanonicalName(Fields[2]), CurrentView)
+	return Views
+
+
+# Building the Index
+# ------------------
+def BuildModelIndex(ModelFile):
+
+	ModelText = ReadModelText(ModelFile)
+	if SketchMarker in ModelText:
+		EquationText, SketchText = ModelText.split(SketchMarker, 1)
+	else:
+		EquationText, SketchText = ModelText, ""
+
+	Variables = {}
+	Subscripts = {}
+	Equivalences = []
+	for Entry in re.split(r'\|[ \t]*\r?\n', EquationText):
+		Parts = Entry.split("~")
+		Definition = JoinContinuedLines(Parts[0]).replace("{UTF-8}", "").strip()
+		if not Definition or Definition.startswith("*") or len(Parts) < 2:
+			continue
+		Units = " ".join(JoinContinuedLines(Parts[1]).split())
+
+		Match = re.match(r'("[^"]*"|[^\[\]=:(<]+)\s*(\[[^\]]*\])?\s*(.*)$', Definition, re.S)
+		if not Match:
+			continue
+		Name = " ".join(Match.group(1).split())
+		SubscriptList = SplitSubscripts("x" + (Match.group(2) or ""))[1]
+		Rest = Match.group(3).strip()
+
+		# Subscript ranges and equivalences
+		if Rest.startswith("<->"):
+			Equivalences.append((Name, Rest[3:].strip()))
+			continue
+		Rest = re.sub(r'^:EXCEPT:\s*\[[^\]]*\](\s*,\s*\[[^\]]*\])*\s*', '', Rest)
+		Rest = re.sub(r'^(:(?:INTERPOLATE|RAW|HOLD BACKWARD|LOOK FORWARD|INTEGER):\s*)+', '', Rest)
+		if Rest.startswith(":") and not Rest.startswith(":="):
+			Subscripts[CanonicalName(Name)] = {"Name": Name, "Elements": ParseSubscriptElements(Rest[1:])}
+			continue
+
+		# Equations
+		if Rest.startswith(":="):
+			Operator, Expression = ":=", Rest[2:]
+		elif Rest.startswith("=="):
+			Operator, Expression = "=", Rest[2:]
+		elif Rest.startswith("="):
+			Operator, Expression = "=", Rest[1:]
+		elif Rest.startswith("("):
+			Operator, Expression = "(", Rest
+		else:
+			Operator, Expression = "", ""
+		Expression = " ".join(Expression.split())
+
+		Variable = Variables.setdefault(CanonicalName(Name), {"Name": Name, "Kind": None, "Equations": [], "Dependencies": [], "Units": Units, "View": None})
+		Variable["Equations"].append({"Subscripts": SubscriptList, "Expression": Expression})
+		Kind = ClassifyEquation(Operator, Expression) if Operator else "data"
+		# A variable with several equations takes the most dynamic kind among them.
+		KindOrder = ["constant", "input data", "data", "lookup", "initial", "auxiliary", "level"]
+		if Variable["Kind"] is None or KindOrder.index(Kind) > KindOrder.index(Variable["Kind"]):
+			Variable["Kind"] = Kind
+
+	# Expanding subscript ranges that include other ranges, and equivalent ranges
+	for SourceName, TargetName in Equivalences:
+		if CanonicalName(TargetName) in Subscripts:
+			Subscripts[CanonicalName(SourceName)] = {"Name": SourceName, "Elements": list(Subscripts[CanonicalName(TargetName)]["Elements"])}
+	def ExpandElements(RangeName, Visiting):
+		Expanded = []
+		for Element in Subscripts[RangeName]["Elements"]:
+			if CanonicalName(Element) in Subscripts and CanonicalName(Element) not in Visiting:
+				Expanded.extend(ExpandElements(CanonicalName(Element), Visiting | {CanonicalName(Element)}))
+			else:
+				Expanded.append(Element)
+		return Expanded
+	for RangeName in Subscripts:
+		Subscripts[RangeName]["Elements"] = ExpandElements(RangeName, {RangeName})
+	Elements = {}
+	for RangeName in Subscripts:
+		for Element in Subscripts[RangeName]["Elements"]:
+			Elements.setdefault(CanonicalName(Element), []).append(RangeName)
+
+	# Dependencies and views
+	Views = ReadVariableViews(SketchText)
+	for VariableName, Variable in Variables.items():
+		Names = set()
+		for Equation in Variable["Equations"]:
+			Names |= ExpressionNames(Equation["Expression"])
+		Variable["Dependencies"] = sorted(Name for Name in Names if Name in Variables and Name != VariableName)
+		Variable["View"] = Views.get(VariableName)
+
+	return {"ModelHash": HashFile(ModelFile), "IndexVersion": ModelIndexVersion, "Variables": Variables, "Subscripts": Subscripts, "Elements": Elements}
+
+
+# Caching
+# -------
+def HashFile(FileName):
+	Hash = hashlib.sha256()
+	with open(FileName, 'rb') as HashedFile:
+		for Block in iter(lambda: HashedFile.read(1 << 20), b""):
+			Hash.update(Block)
+	return Hash.hexdigest()
+
+# This returns the path of a cache file for the given model file hash.  Other modules use it
+# to cache their own results that depend only on the model (with a different Suffix).
+def CacheFileName(ModelFile, ModelHash, Suffix):
+	return os.path.join(os.path.dirname(os.path.abspath(ModelFile)), ModelIndexCacheFolder, ModelHash[:16] + "-" + Suffix + ".json")
+
+def LoadCache(CacheFile):
+	try:
+		with open(CacheFile, 'r') as Cache:
+			return json.load(Cache)
+	except (OSError, ValueError):
+		return None
+
+def SaveCache(CacheFile, Data):
+	os.makedirs(os.path.dirname(CacheFile), exist_ok=True)
+	TemporaryFile = CacheFile + "." + str(os.getpid()) + ".tmp"
+	with open(TemporaryFile, 'w') as Cache:
+		json.dump(Data, Cache)
+	os.replace(TemporaryFile, CacheFile)
+
+# This is the function other scripts should use to get the index of a model.
+def LoadModelIndex(ModelFile="EPS.mdl"):
+	ModelHash = HashFile(ModelFile)
+	CacheFile = CacheFileName(ModelFile, ModelHash, "index")
+	Index = LoadCache(CacheFile)
+	if Index is None or Index.get("IndexVersion") != ModelIndexVersion:
+		Index = BuildModelIndex(ModelFile)
+		SaveCache(CacheFile, Index)
+	return Index
+
+
+# Looking Up Variables
+# --------------------
+# This returns the index entry for a variable reference such as "Fuel Price Deregulation[natural gas]"
+# (the subscripts are ignored), or None if the model has no such variable.
+def FindVariable(Index, Reference):
+	return Index["Variables"].get(CanonicalName(SplitSubscripts(Reference)[0]))
+
+# Sizes
+# -----
+# The number of values an equation defines is the product of the sizes of the subscripts on
+# its left side, where a range counts its elements and a single element counts as one.  A
+# variable with several equations defines the total of its equations' values.  (Equations
+# with :EXCEPT: are counted as if they covered the whole range, so this can slightly
+# overstate the size of a few variables.)
+def SubscriptSize(Index, Subscript):
+	Range = Index["Subscripts"].get(CanonicalName(Subscript.rstrip("!")))
+	return len(Range["Elements"]) if Range is not None else 1
+
+def EquationSize(Index, Equation):
+	Size = 1
+	for Subscript in Equation["Subscripts"]:
+		Size *= SubscriptSize(Index, Subscript)
+	return Size
+
+def VariableSize(Index, Variable):
+	return sum(EquationSize(Index, Equation) for Equation in Variable["Equations"])
+
+# Reading a list of variables (such as OutputVarsToExport.lst), one per line.
+def ReadVariableList(ListFile):
+	with open(ListFile, 'r', encoding='utf-8', errors='replace') as VariableList:
+		return [Line.strip() for Line in VariableList if Line.strip()]
@@ -0,0 +1,318 @@
+# MonteCarloInputs.py
+#
+# This is a Python script that runs the model many times with uncertain input data, and
+# summarizes the distribution of the results.  Each uncertain input is one or more files in
+# the InputData folder whose values are multiplied by a scaling factor drawn from a
+# probability distribution.  The script has three modes, chosen with the Mode setting:
+#	- "generate" draws the scaling factors for each of the Draws, writes the scaled input data
+#	  files for each draw (with a manifest listing them, as used by InputDataOverlays.py) in
+#	  the MonteCarloFolder, and writes the run plan: one run per draw.
+#	- "run" performs the runs in the run plan with VensimWorkerPool.py (which loads the model
+#	  from an overlay of each draw's input data), writes their results to the RunResultsFile,
+#	  and summarizes them.
+#	- "ingest" summarizes the results already in the RunResultsFile (for example, after
+#	  changing the Percentiles).
+#
+# The summary is written to the PercentilesFile, which has the layout of a results file (see
+# RunResultsReader.py) with one row per variable and statistic (such as "Statistic=P50"), and
+# shown in a fan chart for each variable.  The statistics are calculated as the results
+# arrive, with the estimators in StreamingStatistics.py, so thousands of draws can be
+# summarized without holding their results in memory.
+#
+# Uncertain Inputs
+# ----------------
+# Each entry in UncertainInputs gives the InputData files to scale (a path relative to the
+# InputData folder, which may contain wildcards such as "*" to match several files the
+# model reads), the distribution of the scaling factor and its parameters, and a group name.
+# The distributions are:
+#	("normal", Mean, StandardDeviation)
+#	("lognormal", Median, Sigma) - the natural logarithm of the factor has standard deviation Sigma
+#	("uniform", Low, High)
+#	("triangular", Low, Mode, High)
+# Every cell that holds a number is scaled, except in the first row and first column, which
+# hold the labels and years in the EPS input data files.
+#
+# Correlated Draws
+# ----------------
+# Inputs in the same group are perfectly correlated: they use the same random draw, so each
+# is at the same percentile of its own distribution (for example, prices of related fuels
+# that rise and fall together).  Draws for different groups are independent, unless
+# GroupCorrelations gives the correlation between two groups.  Correlations are applied to
+# normally distributed draws, which are then converted to each input's distribution (a
+# "Gaussian copula"), so each input keeps the distribution it was given.
+
+
+# File Names
+# ----------
+ModelFile = "EPS.mdl" # The name of the Vensim model file
+OutputVarsFile = "OutputVarsToExport.lst" # The name of the file containing a list of variables to be included in the RunResultsFile
+MonteCarloFolder = "MonteCarlo" # The folder in which to write the input data of each draw and the run plan
+RunResultsFile = "MonteCarloResults.tsv" # The desired filename for the results of every draw
+PercentilesFile = "MonteCarloPercentiles.tsv" # The desired filename for the percentiles and mean of the results
+SettingsFile = "" # A settings file (.cin) with the policies to use in every run, or "" for the BAU case
+
+
+# Uncertain Inputs
+# ----------------
+UncertainInputs = [
+	("fuels/BFCpUEbS/BFCpUEbS-natural-gas.csv", ("lognormal", 1, 0.25), "Fossil Fuel Prices"),
+	("fuels/BFCpUEbS/BFCpUEbS-coal.csv", ("lognormal", 1, 0.2), "Fossil Fuel Prices"),
+	("fuels/BFCpUEbS/BFCpUEbS-petroleum-*.csv", ("lognormal", 1, 0.3), "Fossil Fuel Prices"),
+	("elec/BCpUC/BCpUC.csv", ("triangular", 0.7, 1, 1.2), "Battery Costs"),
+]
+GroupCorrelations = {
+	# ("Fossil Fuel Prices", "Battery Costs"): 0.2,
+}
+
+
+# Other Settings
+# --------------
+Mode = "generate" # "generate", "run", or "ingest" (see above)
+Draws = 1000 # The number of sets of inputs to draw (each is one model run)
+Seed = 1 # The seed of the random number generator, so the same draws can be generated again
+Percentiles = [5, 25, 50, 75, 95] # The percentiles of the results to report.  Fan charts shade the range between
+								  # each pair of percentiles (such as the 5th and 95th) and draw the median as a line.
+Workers = 0 # The number of model runs to perform at once (0 to use one per processor)
+Executor = "VensimDLL" # "VensimDLL" to run the model in Vensim, or "StandIn" to try out the script without Vensim
+PolicySchedule = 1 # The number of the policy implementation schedule file to be used (in InputData/plcy-schd/FoPITY)
+PlotFileFormat = "png" # "png", "svg", "pdf", or "" for no fan charts
+PlotFilePrefix = "FanChart" # Fan charts are named PlotFilePrefix - Variable
+
+
+import csv
+import fnmatch
+import io
+import json
+import math
+import os
+import random
+import re
+import InputDataOverlays
+from RunResultsReader import IterateRunResults
+from StreamingStatistics import SeriesSummary
+
+
+# Drawing the Scaling Factors
+# ---------------------------
+def NormalCDF(Value):
+	return 0.5 * (1 + math.erf(Value / math.sqrt(2)))
+
+# This converts a draw from the standard normal distribution into the scaling factor at the
+# same percentile of the input's distribution.
+def ScalingFactor(Distribution, NormalDraw):
+	Kind = Distribution[0]
+	if Kind == "normal":
+		return Distribution[1] + Distribution[2] * NormalDraw
+	elif Kind == "lognormal":
+		return Distribution[1] * math.exp(Distribution[2] * NormalDraw)
+	elif Kind == "uniform":
+		return Distribution[1] + (Distribution[2] - Distribution[1]) * NormalCDF(NormalDraw)
+	elif Kind == "triangular":
+		Low, Mode, High = Distribution[1:4]
+		Share = NormalCDF(NormalDraw)
+		if Share < (Mode - Low) / (High - Low):
+			return Low + math.sqrt(Share * (High - Low) * (Mode - Low))
+		return High - math.sqrt((1 - Share) * (High - Low) * (High - Mode))
+	raise ValueError("Unknown distribution: " + str(Kind) + ".  Use \"normal\", \"lognormal\", \"uniform\", or \"triangular\".")
+
+# The correlation matrix of the groups is factored (Cholesky decomposition) so that
+# multiplying independent normal draws by the factor gives correlated draws.
+def CorrelationFactor(Groups, Correlations):
+	Matrix = [[1.0 if Row == Column else 0.0 for Column in Groups] for Row in Groups]
+	for (First, Second), Correlation in Correlations.items():
+		for Group in (First, Second):
+			if Group not in Groups:
+				raise ValueError("GroupCorrelations refers to " + Group + ", which is not a group in UncertainInputs.")
+		Matrix[Groups.index(First)][Groups.index(Second)] = Matrix[Groups.index(Second)][Groups.index(First)] = Correlation
+	Factor = [[0.0] * len(Groups) for Group in Groups]
+	for Row in range(len(Groups)):
+		for Column in range(Row + 1):
+			Sum = Matrix[Row][Column] - sum(Factor[Row][Position] * Factor[Column][Position] for Position in range(Column))
+			if Row == Column:
+				if Sum <= 0:
+					raise ValueError("The GroupCorrelations are not consistent with one another (the correlation matrix is not positive definite).")
+				Factor[Row][Row] = math.sqrt(Sum)
+			else:
+				Factor[Row][Column] = Sum / Factor[Column][Column]
+	return Factor
+
+# This returns the list of (file, distribution, group) for every InputData file to scale.
+def ResolveInputs(UncertainInputs, ModelFile):
+	ModelInputs = sorted(InputDataOverlays.ModelInputFiles(ModelFile))
+	Inputs = []
+	for Pattern, Distribution, Group in UncertainInputs:
+		Matches = fnmatch.filter(ModelInputs, InputDataOverlays.InputDataPath(Pattern))
+		if not Matches:
+			raise ValueError(Pattern + " (in UncertainInputs) does not match any input data file read by " + ModelFile + ".")
+		ScalingFactor(Distribution, 0) # Checks the distribution
+		for Path in Matches:
+			if any(Path == Input[0] for Input in Inputs):
+				raise ValueError(Path + " is matched by more than one entry in UncertainInputs.")
+			Inputs.append((Path, Distribution, Group))
+	return Inputs
+
+
+# Scaling the Input Data
+# ----------------------
+def ScaleCSV(Text, Factor):
+	LineEnding = "\r\n" if "\r\n" in Text else "\n"
+	Output = io.StringIO()
+	Writer = csv.writer(Output, lineterminator=LineEnding)
+	for RowNumber, Row in enumerate(csv.reader(io.StringIO(Text))):
+		if RowNumber > 0:
+			for Column in range(1, len(Row)):
+				try:
+					Row[Column] = format(float(Row[Column]) * Factor, ".8g")
+				except ValueError:
+					pass
+		Writer.writerow(Row)
+	return Output.getvalue()
+
+def DrawFolder(Draw):
+	return "Draw-" + str(Draw).zfill(len(str(Draws)))
+
+def RunPlanFile():
+	return os.path.join(MonteCarloFolder, "RunPlan.json")
+
+def Generate():
+	Inputs = ResolveInputs(UncertainInputs, ModelFile)
+	Groups = []
+	for Path, Distribution, Group in Inputs:
+		if Group not in Groups:
+			Groups.append(Group)
+	Factor = CorrelationFactor(Groups, GroupCorrelations)
+	Originals = {}
+	for Path, Distribution, Group in Inputs:
+		with open(os.path.join(os.path.dirname(os.path.abspath(ModelFile)), InputDataOverlays.InputFolderName, Path), 'r', newline='') as Original:
+			Originals[Path] = Original.read()
+
+	Generator = random.Random(Seed)
+	Runs = []
+	os.makedirs(MonteCarloFolder, exist_ok=True)
+	with open(os.path.join(MonteCarloFolder, "Draws.tsv"), 'w') as DrawsFile:
+		DrawsFile.write("Draw\t" + "\t".join(Path for Path, Distribution, Group in Inputs) + "\n")
+		for Draw in range(1, Draws + 1):
+			Independent = [Generator.gauss(0, 1) for Group in Groups]
+			Correlated = [sum(Factor[Row][Column] * Independent[Column] for Column in range(Row + 1)) for Row in range(len(Groups))]
+			Folder = os.path.join(MonteCarloFolder, DrawFolder(Draw))
+			Factors = []
+			with open(Folder + ".txt", 'w') as Manifest:
+				for Path, Distribution, Group in Inputs:
+					Factors.append(ScalingFactor(Distribution, Correlated[Groups.index(Group)]))
+					os.makedirs(os.path.dirname(os.path.join(Folder, Path)), exist_ok=True)
+					with open(os.path.join(Folder, Path), 'w', newline='') as Scaled:
+						Scaled.write(ScaleCSV(Originals[Path], Factors[-1]))
+					Manifest.write(Path + "\t" + DrawFolder(Draw) + "/" + Path + "\n")
+			DrawsFile.write(str(Draw) + "\t" + "\t".join(format(Value, ".6g") for Value in Factors) + "\n")
+			Runs.append({"InputDataOverlay": os.path.join(MonteCarloFolder, DrawFolder(Draw) + ".txt"), "SettingsFile": SettingsFile, "PolicySchedule": PolicySchedule})
+
+	with open(RunPlanFile(), 'w') as Plan:
+		json.dump({"Draws": Draws, "Runs": Runs}, Plan, indent="\t")
+	return Inputs, Groups
+
+
+# Summarizing the Results
+# -----------------------
+def AddToSummaries(Summaries, Variable, Values):
+	if Variable not in Summaries:
+		Summaries[Variable] = SeriesSummary(len(Values), Percentiles)
+	Summaries[Variable].Add(Values)
+
+def Run():
+	from VensimWorkerPool import VensimWorkerPool
+	with open(RunPlanFile(), 'r') as Plan:
+		Runs = json.load(Plan)["Runs"]
+	Summaries = {}
+	Years = None
+	Failed = 0
+	with open(RunResultsFile, 'w') as Results, VensimWorkerPool(Workers, Executor, ModelFile=ModelFile, OutputVarsFile=OutputVarsFile) as Pool:
+		Draw = {}
+		for Number, Run in enumerate(Runs, start=1):
+			Draw[Pool.Submit(dict((Entry, Value) for Entry, Value in Run.items() if Value != ""))] = Number
+		for Finished, (RunNumber, Result) in enumerate(Pool.Completed(), start=1):
+			if "Error" in Result:
+				Failed += 1
+				print("Draw " + str(Draw[RunNumber]) + " failed: " + Result["Error"])
+				continue
+			Annotation = "\tDraw=" + str(Draw[RunNumber]) + "\t"
+			if Years is None:
+				Years = Result["Years"]
+				Results.write("Time" + Annotation + "\t".join(str(Year) for Year in Years) + "\n")
+			for Variable, Values in Result["Values"].items():
+				Results.write(Variable + Annotation + "\t".join("%.6g" % Value for Value in Values) + "\n")
+				AddToSummaries(Summaries, Variable, Values)
+			if Finished % 100 == 0:
+				print("Finished " + str(Finished) + " of " + str(len(Runs)) + " draws.")
+	return Summaries, Years, Failed
+
+def Ingest():
+	Summaries = {}
+	Years = None
+	for Years, Variable, Annotations, Values in IterateRunResults(RunResultsFile):
+		AddToSummaries(Summaries, Variable, Values)
+	return Summaries, Years
+
+def WritePercentiles(Summaries, Years):
+	with open(PercentilesFile, 'w') as f:
+		f.write("Time\tStatistic=Mean\t" + "\t".join(str(Year) for Year in Years) + "\n")
+		for Variable, Summary in Summaries.items():
+			Rows = [("P" + format(Percent, "g"), Summary.Percentile(Percent)) for Percent in Percentiles] + [("Mean", Summary.Mean())]
+			for Statistic, Values in Rows:
+				f.write(Variable + "\tStatistic=" + Statistic + "\t" + "\t".join("%.6g" % Value for Value in Values) + "\n")
+
+# The range between each pair of percentiles (the lowest and highest, the next lowest and
+# next highest, and so on) is shaded, darker toward the middle.
+def PlotFanChart(FileName, Variable, Years, Summary):
+
+	import matplotlib
+	matplotlib.use("Agg")
+	import matplotlib.pyplot as plt
+
+	Sorted = sorted(Percentiles)
+	Pairs = [(Sorted[Position], Sorted[-Position - 1]) for Position in range(len(Sorted) // 2)]
+	Figure, Axes = plt.subplots(figsize=(10, 6))
+	for Position, (Low, High) in enumerate(Pairs):
+		Axes.fill_between(Years, Summary.Percentile(Low), Summary.Percentile(High), color="#2a9d8f", alpha=0.2 + 0.5 * Position / max(len(Pairs), 1),
+			linewidth=0, label="P" + format(Low, "g") + "-P" + format(High, "g"))
+	if 50 in Percentiles:
+		Axes.plot(Years, Summary.Percentile(50), color="#264653", label="Median")
+	Axes.plot(Years, Summary.Mean(), color="#e76f51", linestyle="--", label="Mean")
+	Axes.set_title(Variable)
+	Axes.set_xlabel("Year")
+	Axes.legend()
+	Figure.tight_layout()
+	Figure.savefig(FileName)
+	plt.close(Figure)
+
+def PlotFileName(Variable):
+	return PlotFilePrefix + " - " + re.sub(r'[\\/:*?"<>|]', "-", Variable) + "." + PlotFileFormat
+
+
+if __name__ == "__main__":
+	if Mode == "generate":
+		Inputs, Groups = Generate()
+		print("Wrote " + str(Draws) + " draws of " + str(len(Inputs)) + " input data files (in " + str(len(Groups)) + " groups) and the run plan to " + MonteCarloFolder + ".")
+	elif Mode in ("run", "ingest"):
+		if Mode == "run":
+			Summaries, Years, Failed = Run()
+			if Failed:
+				print(str(Failed) + " draws failed and are left out of the summary.")
+		else:
+			Summaries, Years = Ingest()
+		if not Summaries:
+			raise ValueError("There are no results to summarize.")
+		WritePercentiles(Summaries, Years)
+		print("Wrote the percentiles of " + str(len(Summaries)) + " variables to " + PercentilesFile + ".")
+
+		Plotting = PlotFileFormat != ""
+		if Plotting:
+			try:
+				import matplotlib
+			except ImportError:
+				print("The matplotlib package is not installed, so no fan charts will be created.  The percentiles will still be written.")
+				Plotting = False
+		if Plotting:
+			for Variable, Summary in Summaries.items():
+				PlotFanChart(PlotFileName(Variable), Variable, Years, Summary)
+	else:
+		raise ValueError("Unknown Mode setting: " + Mode + ".  Use \"generate\", \"run\", or \"ingest\".")
@@ -0,0 +1,349 @@
+# OptimizeLeverPortfolio.py
+#
+# This is a Python script that searches for a set of policy settings (a "portfolio") that meets
+# a target for one output variable, such as cumulative emissions, at the lowest value of another
+# output variable (the "objective"), such as cost.  Each of the enabled policies below may take
+# any setting between the lowest and highest of its listed settings.  Instead of running every
+# combination of settings (as the script from CreateCombinationsScript.py does), the search
+# performs rounds of a few runs each and chooses each round's runs using the results so far, so
+# it usually finds a good portfolio in a few hundred runs.  The best portfolio found is written
+# to a settings file (.cin) that can be used like Scenario_MEIMTarget.cin.
+#
+# The runs are performed by a VensimWorkerPool (see VensimWorkerPool.py), so this script runs
+# the model itself, and needs Vensim (set Executor to "StandIn" to try the script without it).
+# Every run is recorded in the OptimizerHistoryFile.  If the script is stopped, running it again
+# continues the search from the runs recorded there; delete the file to start over.
+#
+# Search Method
+# -------------
+# A portfolio that meets the target is always preferred to one that doesn't; among portfolios
+# that meet the target, the one with the better objective is preferred, and among those that
+# don't, the one closest to meeting it.  The first round tests the portfolio with every policy
+# at its lowest setting (normally the BAU case), the portfolio with every policy at its highest
+# setting, and portfolios spread evenly over the range of settings (a "Latin hypercube").  Each
+# later round:
+#	1. Proposes many candidate portfolios: random changes to the best portfolios found so far,
+#	   no larger than the current step size, and points between the best portfolio that meets
+#	   the target and the best ones that don't (the least costly portfolios are usually close to
+#	   just meeting the target).
+#	2. Predicts the target and objective variables for each candidate with a linear model fitted
+#	   to the runs closest to the best portfolio (a "surrogate" for the model), and runs the
+#	   RunsPerRound candidates predicted to be best, skipping candidates too close together.
+#	3. Enlarges the step size if the round found a better portfolio, and halves it otherwise.
+# The search ends when the step size falls below MinimumStep or MaxRuns runs have been done.
+
+
+# File Names
+# ----------
+ModelFile = "EPS.mdl" # The name of the Vensim model file (typically with .mdl or .vpm extension)
+OutputVarsFile = "OutputVarsToExport.lst" # Must include the TargetVariable and the ObjectiveVariable
+OptimizerHistoryFile = "OptimizerHistory.tsv" # Every run of the search so far.  Delete it to start over.
+PortfolioFile = "Scenario_Optimized.cin" # The desired filename of the settings file for the best portfolio
+
+
+# Target and Objective
+# --------------------
+TargetVariable = "Output Cumulative Total CO2e Emissions"
+TargetYear = 2050
+TargetComparison = "at most" # "at most" or "at least"
+TargetValue = 0.8 # The value the TargetVariable must not exceed ("at most") or fall below ("at least")
+TargetRelativeToBAU = True # If True, the TargetValue is a fraction of the TargetVariable's value in the run with every policy at its lowest setting
+ObjectiveVariable = "Output First Year NPV of CapEx and OpEx through This Year with Revenue Neutral Taxes and Subsidies"
+ObjectiveYear = 2050
+ObjectiveDirection = "min" # "min" or "max".  The NPV is of the change in capital and operating expenditures from BAU, which is
+						   # positive when a portfolio costs money, so "min" finds the least costly portfolio.
+
+
+# Search Settings
+# ---------------
+RunsPerRound = 16 # The number of runs in each round (a multiple of the number of Workers uses them fully)
+MaxRuns = 400 # The search ends after this many runs
+InitialStep = 0.25 # The largest change to a policy's setting in the second round, as a fraction of its range
+MinimumStep = 0.01 # The search ends when the step size falls below this fraction of each policy's range
+SettingResolution = 0.001 # Settings are rounded to this fraction of each policy's range
+CandidatesPerRun = 20 # The number of candidate portfolios proposed for each run in a round
+RandomSeed = 1 # Change this to search along a different path
+
+
+# Other Settings
+# --------------
+Workers = 0 # The number of worker processes (0 to use one per processor)
+Executor = "VensimDLL" # "VensimDLL" to run the model in Vensim, or "StandIn" to try out the script without Vensim
+PolicySchedule = 1 # The number of the policy implementation schedule file to be used (in InputData/plcy-schd/FoPITY)
+
+
+# Index definitions
+# -----------------
+# Each policy is a Python list, in the same format as in CreateCombinationsScript.py.  Do not
+# change any names or numbers in this section.
+Enabled = 0
+LongName = 1
+ShortName = 2
+Settings = 3
+Group = 4 # Groups are not used in this script
+
+
+# Optimized Policies
+# ------------------
+# Enable the policies whose settings the search may change.  Each policy may take any setting
+# from the lowest to the highest of its listed settings.  Policies that are not enabled keep
+# their BAU settings.  Copy additional policies from CreateCombinationsScript.py as needed.
+OptimizedPolicies = (
+	(True,"Additional Carbon Tax Rate[electricity sector]","Domestic Carbon Pricing - Electricity Sector",[0,200],"Carbon Pricing"),
+	(True,"Additional Carbon Tax Rate[industry sector]","Domestic Carbon Pricing - Industry Sector",[0,200],"Carbon Pricing"),
+	(True,"Renewable Portfolio Std Percentage","Carbon-free Electricity Standard",[0,1],"Carbon-free Electricity Standard"),
+	(True,"Percentage Additional Improvement of Fuel Economy Std[passenger,LDVs]","Fuel Economy Standard - Passenger LDVs",[0,1],"Vehicle Fuel Economy Standards"),
+	(True,"Additional Minimum Required EV Sales Percentage[passenger,LDVs]","Electric Vehicle Sales Mandate - Passenger LDVs",[0,1],"EV Sales Mandate"),
+	(True,"Fraction of F Gases Avoided","F-gas Measures",[0,1],"F-gas Measures"),
+	(True,"Fraction of Methane Capture Opportunities Achieved","Methane Capture",[0,1],"Methane Capture")
+)
+
+
+import math
+import os
+import random
+import time
+import EPSScriptGenerators
+
+
+# Portfolios
+# ----------
+# The search works with each setting scaled to the range 0 (the policy's lowest setting) to 1
+# (its highest), so that every policy's step size is the same fraction of its range.  A
+# portfolio is a tuple of scaled settings, rounded to the SettingResolution.
+def PolicyRanges(Policies):
+	Ranges = []
+	for Policy in Policies:
+		if len(Policy[Settings]) < 2 or min(Policy[Settings]) == max(Policy[Settings]):
+			raise ValueError("The policy " + Policy[ShortName] + " needs at least two different settings to define its range.")
+		Ranges.append((min(Policy[Settings]), max(Policy[Settings])))
+	return Ranges
+
+def RoundPortfolio(Portfolio):
+	return tuple(round(min(max(Setting, 0), 1) / SettingResolution) * SettingResolution for Setting in Portfolio)
+
+def LeverSettings(Portfolio, Policies, Ranges):
+	return {Policy[LongName]: format(Low + Setting * (High - Low), ".6g") for Policy, (Low, High), Setting in zip(Policies, Ranges, Portfolio)}
+
+# This returns Count portfolios spread evenly over the range of every setting: the range of each
+# setting is divided into Count equal parts, and each part is used by one portfolio.
+def LatinHypercube(Count, Dimensions, Random):
+	Columns = []
+	for Dimension in range(Dimensions):
+		Column = [(Part + Random.random()) / Count for Part in range(Count)]
+		Random.shuffle(Column)
+		Columns.append(Column)
+	return [RoundPortfolio(Portfolio) for Portfolio in zip(*Columns)]
+
+
+# Ranking Portfolios
+# ------------------
+# Each run is recorded as [Round, Portfolio, Target, Objective].  The run with every policy at
+# its lowest setting is recorded first, since a target relative to BAU depends on it.
+def TargetLimit(Records):
+	if TargetRelativeToBAU:
+		return TargetValue * Records[0][2]
+	return TargetValue
+
+# This returns how far a target value is from meeting the target, as a fraction of the limit
+# (zero if it meets the target).
+def Violation(Target, Limit):
+	Excess = Target - Limit if TargetComparison == "at most" else Limit - Target
+	return max(Excess, 0) / (abs(Limit) or 1)
+
+# Portfolios are sorted by this key: those that meet the target first, in order of their
+# objective, then the others, in order of how far they are from meeting it.
+def RankKey(Target, Objective, Limit):
+	if Violation(Target, Limit) > 0:
+		return (1, Violation(Target, Limit))
+	return (0, Objective if ObjectiveDirection == "min" else -Objective)
+
+def RankedRecords(Records):
+	Limit = TargetLimit(Records)
+	return sorted((Record for Record in Records if Record[2] == Record[2] and Record[3] == Record[3]), key=lambda Record: RankKey(Record[2], Record[3], Limit))
+
+
+# The Surrogate
+# -------------
+# A linear model, Value = a + b1 * Setting1 + b2 * Setting2 + ..., fitted by least squares
+# (with a small penalty on the coefficients, so it can be fitted to few runs).  This returns the
+# coefficients [a, b1, b2, ...].
+def FitLinearModel(Portfolios, Values, Penalty=1e-6):
+	Rows = [[1.0] + list(Portfolio) for Portfolio in Portfolios]
+	Size = len(Rows[0])
+	Matrix = [[sum(Row[i] * Row[j] for Row in Rows) + (Penalty if i == j and i > 0 else 0) for j in range(Size)] + [sum(Row[i] * Value for Row, Value in zip(Rows, Values))] for i in range(Size)]
+
+	# Gaussian elimination with partial pivoting
+	for Column in range(Size):
+		Pivot = max(range(Column, Size), key=lambda Row: abs(Matrix[Row][Column]))
+		Matrix[Column], Matrix[Pivot] = Matrix[Pivot], Matrix[Column]
+		if Matrix[Column][Column] == 0:
+			continue
+		for Row in range(Column + 1, Size):
+			Factor = Matrix[Row][Column] / Matrix[Column][Column]
+			for Position in range(Column, Size + 1):
+				Matrix[Row][Position] -= Factor * Matrix[Column][Position]
+	Coefficients = [0.0] * Size
+	for Row in reversed(range(Size)):
+		if Matrix[Row][Row] != 0:
+			Coefficients[Row] = (Matrix[Row][Size] - sum(Matrix[Row][Position] * Coefficients[Position] for Position in range(Row + 1, Size))) / Matrix[Row][Row]
+	return Coefficients
+
+def Predict(Coefficients, Portfolio):
+	return Coefficients[0] + sum(Coefficient * Setting for Coefficient, Setting in zip(Coefficients[1:], Portfolio))
+
+def Distance(First, Second):
+	return math.sqrt(sum((A - B) ** 2 for A, B in zip(First, Second)))
+
+
+# Proposing the Next Round
+# ------------------------
+# This returns the portfolios to run in the next round (see "Search Method" above).
+def ProposeRound(Records, Step, Random):
+
+	Ranked = RankedRecords(Records)
+	Limit = TargetLimit(Records)
+	Best = Ranked[0][1]
+	Dimensions = len(Best)
+	Elites = [Record[1] for Record in Ranked[:max(2, RunsPerRound // 4)]]
+
+	Candidates = []
+	for Number in range(RunsPerRound * CandidatesPerRun):
+		Parent = Elites[min(int(Random.expovariate(1.0)), len(Elites) - 1)]
+		Candidates.append(RoundPortfolio(Setting + Random.gauss(0, Step / 2) for Setting in Parent))
+
+	# Points between the best portfolio that meets the target and the best that don't
+	Meeting = [Record[1] for Record in Ranked if Violation(Record[2], Limit) == 0]
+	Missing = [Record[1] for Record in Ranked if Violation(Record[2], Limit) > 0]
+	if Meeting and Missing:
+		for Portfolio in Missing[:len(Elites)]:
+			for Number in range(CandidatesPerRun):
+				Fraction = Random.random()
+				Candidates.append(RoundPortfolio(A + Fraction * (B - A) for A, B in zip(Meeting[0], Portfolio)))
+
+	# The surrogate is fitted to the runs closest to the best portfolio
+	Nearest = sorted(Ranked, key=lambda Record: Distance(Record[1], Best))[:max(2 * Dimensions + 2, 4 * RunsPerRound)]
+	TargetModel = FitLinearModel([Record[1] for Record in Nearest], [Record[2] for Record in Nearest])
+	ObjectiveModel = FitLinearModel([Record[1] for Record in Nearest], [Record[3] for Record in Nearest])
+	Candidates.sort(key=lambda Portfolio: RankKey(Predict(TargetModel, Portfolio), Predict(ObjectiveModel, Portfolio), Limit))
+
+	Tried = set(Record[1] for Record in Records)
+	Chosen = []
+	for Portfolio in Candidates:
+		if Portfolio in Tried or any(Distance(Portfolio, Other) < Step / 4 for Other in Chosen):
+			continue
+		Chosen.append(Portfolio)
+		if len(Chosen) == RunsPerRound:
+			break
+	return Chosen
+
+
+# After each round, the step size is enlarged if the round found a better portfolio, and halved
+# otherwise.
+def NextStep(Records, Round, Step):
+	if RankedRecords([Record for Record in Records if Record[0] <= Round])[0][0] == Round:
+		return min(Step * 1.5, InitialStep)
+	return Step / 2
+
+
+# Optimizer History
+# -----------------
+def ReadOptimizerHistory(Policies):
+	Records = []
+	if os.path.exists(OptimizerHistoryFile):
+		with open(OptimizerHistoryFile, 'r') as HistoryFile:
+			Header = next(HistoryFile).rstrip("\n").split("\t")
+			if Header[2:-2] != [Policy[ShortName] for Policy in Policies]:
+				raise ValueError(OptimizerHistoryFile + " was written for a different set of policies.  Delete it to start over.")
+			for Line in HistoryFile:
+				Fields = Line.rstrip("\n").split("\t")
+				Records.append([int(Fields[1]), RoundPortfolio(float(Field) for Field in Fields[2:-2]), float(Fields[-2]), float(Fields[-1])])
+	return Records
+
+# The history lists the scaled settings of each run, so the search can continue exactly.
+def WriteOptimizerHistory(Records, Policies):
+	with open(OptimizerHistoryFile, 'w') as HistoryFile:
+		HistoryFile.write("Run\tRound\t" + "\t".join(Policy[ShortName] for Policy in Policies) + "\t" + TargetVariable + "\t" + ObjectiveVariable + "\n")
+		for RunNumber, (Round, Portfolio, Target, Objective) in enumerate(Records, start=1):
+			HistoryFile.write(str(RunNumber) + "\t" + str(Round) + "".join("\t" + format(Setting, ".6g") for Setting in Portfolio) + "\t" + str(Target) + "\t" + str(Objective) + "\n")
+
+
+# Running Portfolios
+# ------------------
+# This runs the portfolios and returns a list of (Target, Objective) pairs.  A run that failed
+# or lacks a variable gives NaN values, so it is never chosen as the best portfolio.
+def RunPortfolios(Pool, Portfolios, Policies, Ranges):
+	Results = Pool.Wait([Pool.Submit({"Settings": LeverSettings(Portfolio, Policies, Ranges), "PolicySchedule": PolicySchedule}) for Portfolio in Portfolios])
+	Values = []
+	for Portfolio, Result in zip(Portfolios, Results):
+		if "Error" in Result:
+			print("A run failed (" + Result["Error"] + "), so its portfolio is skipped.")
+			Values.append((float("nan"), float("nan")))
+			continue
+		for Variable, Year in [(TargetVariable, TargetYear), (ObjectiveVariable, ObjectiveYear)]:
+			if Variable not in Result["Values"]:
+				raise ValueError(Variable + " is not in the results.  Add it to the OutputVarsFile.")
+			if Year not in Result["Years"]:
+				raise ValueError("Year " + str(Year) + " is not in the results (which cover " + str(Result["Years"][0]) + "-" + str(Result["Years"][-1]) + ").")
+		Values.append((Result["Values"][TargetVariable][Result["Years"].index(TargetYear)], Result["Values"][ObjectiveVariable][Result["Years"].index(ObjectiveYear)]))
+	return Values
+
+
+if __name__ == "__main__":
+	from VensimWorkerPool import VensimWorkerPool
+
+	if TargetComparison not in ("at most", "at least"):
+		raise ValueError("TargetComparison must be \"at most\" or \"at least\", not \"" + str(TargetComparison) + "\".")
+	if ObjectiveDirection not in ("min", "max"):
+		raise ValueError("ObjectiveDirection must be \"min\" or \"max\", not \"" + str(ObjectiveDirection) + "\".")
+	Policies = EPSScriptGenerators.EnabledPolicies(OptimizedPolicies)
+	if not Policies:
+		raise ValueError("No policies were enabled in OptimizedPolicies.")
+	Ranges = PolicyRanges(Policies)
+	Random = random.Random(RandomSeed)
+
+	# A resumed search continues from the round after the last one recorded, with the step size
+	# those rounds led to.
+	Records = ReadOptimizerHistory(Policies)
+	Step = InitialStep
+	Round = 0
+	if Records:
+		Round = max(Record[0] for Record in Records) + 1
+		for Previous in range(1, Round):
+			Step = NextStep(Records, Previous, Step)
+		Random.seed(RandomSeed + len(Records))
+
+	Start = time.perf_counter()
+	with VensimWorkerPool(Workers, Executor, ModelFile=ModelFile, OutputVarsFile=OutputVarsFile) as Pool:
+		while len(Records) < MaxRuns and Step >= MinimumStep:
+			if Round == 0:
+				Portfolios = [RoundPortfolio([0] * len(Policies)), RoundPortfolio([1] * len(Policies))] + LatinHypercube(max(RunsPerRound - 2, 1), len(Policies), Random)
+			else:
+				Portfolios = ProposeRound(Records, Step, Random)
+				if not Portfolios:
+					break
+			Portfolios = Portfolios[:MaxRuns - len(Records)]
+			for Portfolio, (Target, Objective) in zip(Portfolios, RunPortfolios(Pool, Portfolios, Policies, Ranges)):
+				Records.append([Round, Portfolio, Target, Objective])
+			WriteOptimizerHistory(Records, Policies)
+			if Records[0][2] != Records[0][2]:
+				raise RuntimeError("The run with every policy at its lowest setting failed, so the target can't be set.")
+
+			if Round > 0:
+				Step = NextStep(Records, Round, Step)
+			Best = RankedRecords(Records)[0]
+			print("Round " + str(Round) + ": " + str(len(Records)) + " runs, best " + TargetVariable + " " + format(Best[2], ".6g")
+				+ ", " + ObjectiveVariable + " " + format(Best[3], ".6g") + (" (meets the target)" if Violation(Best[2], TargetLimit(Records)) == 0 else " (target not met)"))
+			Round += 1
+
+	Best = RankedRecords(Records)[0]
+	with open(PortfolioFile, 'w') as f:
+		for Lever, Value in LeverSettings(Best[1], Policies, Ranges).items():
+			if float(Value) != 0:
+				f.write(Lever + " = " + Value + "\n")
+
+	print("Performed " + str(len(Records)) + " runs in " + format(time.perf_counter() - Start, ".1f") + " seconds.")
+	if Violation(Best[2], TargetLimit(Records)) == 0:
+		print("The best portfolio meets the target (" + format(TargetLimit(Records), ".6g") + ") and was written to " + PortfolioFile + ".")
+	else:
+		print("No portfolio met the target (" + format(TargetLimit(Records), ".6g") + ").  The portfolio closest to meeting it was written to " + PortfolioFile + ".")
@@ -0,0 +1,188 @@
+# PlanSavelist.py
+#
+# This is a Python script that estimates how much disk space each model run uses, and writes
+# a SAVELIST containing only the variables that our analyses need.
+#
+# Without a SAVELIST, Vensim saves every variable in the model to the .vdf file for each run,
+# although the generated command scripts only export the few variables in the OutputVarsFile
+# to the results file.  Vensim can only export variables that it saved, so the smallest
+# useful SAVELIST is the set of variables exported by the command scripts plus any the
+# post-processing scripts read.  This script collects that set, checks that every variable
+# exists in the model, and writes it to the SavelistFile.  It then reports the estimated size
+# of the .vdf file for one run, with and without the SAVELIST, and the size of the results
+# that each command script in BatchScripts will write.
+#
+# Size Estimates
+# --------------
+# Vensim stores each saved value as a 4-byte number.  A variable that changes over time is
+# saved once per save period (SAVEPER) from INITIAL TIME to FINAL TIME, which come from the
+# files in InputData/plcy-schd/IT and FT; a constant is saved once.  The results file stores
+# each value as text, which we estimate at BytesPerValueText bytes, plus the variable name
+# and labels on each row.  These are estimates, but they are close enough to compare save
+# sets and to plan disk space for a batch.
+#
+# Using the SAVELIST
+# ------------------
+# CreateDataLoggingScript.py already uses a SAVELIST.  The other generator scripts include
+# the SAVELIST command as a comment, because Vensim shows a pop-up window asking whether to
+# save the other variables when a SAVELIST is in use.  To use the SAVELIST in those scripts,
+# remove the "# " before the SAVELIST and NOINTERACTION commands and set their OutputVarsFile
+# to the SavelistFile (or copy the SavelistFile over the OutputVarsFile).
+
+
+# File Names
+# ----------
+ModelFile = "EPS.mdl" # The name of the Vensim model file
+SavelistFile = "OptimizedSavelist.lst" # The desired filename for the SAVELIST to be written
+AnalysisVariableLists = ["OutputVarsToExport.lst", "OutputVarsForCarbonCapToTaxScript.lst"] # The lists of variables exported by the
+																							  # command scripts in use
+BatchScripts = ["GeneratedCombinationsScript.cmd", "GeneratedContributionTestScript.cmd", "GeneratedCarbonCapToTaxScript.cmd", "GeneratedDataLoggingScript.cmd"]
+	# Command scripts for which to project the size of the results (any that don't exist are skipped)
+
+
+# Other Settings
+# --------------
+BytesPerSavedValue = 4 # Vensim saves each value as a single-precision number
+BytesPerValueText = 10 # The typical length of a value written to the results file, with its tab
+AnnotationBytes = 100 # The typical length of the labels (annotations) added to each row of the results file
+
+
+import os
+import ModelIndex
+
+# The post-processing scripts read these variables from the results, so they must be saved too.
+import CreateCostCurves
+PostProcessingVariables = [CreateCostCurves.AbatementVariable, CreateCostCurves.CostVariable]
+
+
+# Simulated Time
+# --------------
+# INITIAL TIME and FINAL TIME are read from the same files the model reads.  SAVEPER and
+# TIME STEP are read from the model, where they are either numbers or refer to one another.
+def ReadYearFile(FileName):
+	with open(FileName, 'r') as YearFile:
+		return float(YearFile.read().split(",")[-1])
+
+def ConstantValue(Index, Name, Visited=()):
+	Variable = ModelIndex.FindVariable(Index, Name)
+	if Variable is None or Name in Visited:
+		return None
+	Expression = Variable["Equations"][0]["Expression"]
+	try:
+		return float(Expression)
+	except ValueError:
+		return ConstantValue(Index, Expression, Visited + (Name,))
+
+def SavedTimePoints(Index, ModelFile):
+	InputFolder = os.path.join(os.path.dirname(os.path.abspath(ModelFile)), "InputData", "plcy-schd")
+	InitialTime = ReadYearFile(os.path.join(InputFolder, "IT", "IT.csv"))
+	FinalTime = ReadYearFile(os.path.join(InputFolder, "FT", "FT.csv"))
+	SavePeriod = ConstantValue(Index, "SAVEPER") or ConstantValue(Index, "TIME STEP") or 1
+	return int(round((FinalTime - InitialTime) / SavePeriod)) + 1
+
+
+# Estimating Sizes
+# ----------------
+# A reference to a whole variable saves all of its values; a reference with subscripts
+# (such as "Output Total CO2e Emissions by Sector[transportation sector]") saves only the
+# values it names.
+def ReferenceSize(Index, Reference):
+	Variable = ModelIndex.FindVariable(Index, Reference)
+	Subscripts = ModelIndex.SplitSubscripts(Reference)[1]
+	if not Subscripts:
+		return ModelIndex.VariableSize(Index, Variable)
+	Size = 1
+	for Subscript in Subscripts:
+		Size *= ModelIndex.SubscriptSize(Index, Subscript)
+	return Size
+
+def ReferenceTimePoints(Index, Reference, TimePoints):
+	Kind = ModelIndex.FindVariable(Index, Reference)["Kind"]
+	return 1 if Kind in ("constant", "input data") else TimePoints
+
+def SavedBytes(Index, Reference, TimePoints):
+	return ReferenceSize(Index, Reference) * ReferenceTimePoints(Index, Reference, TimePoints) * BytesPerSavedValue
+
+# Each value of an exported variable becomes one row of the results file.
+def ExportedBytes(Index, Reference, TimePoints):
+	Name = ModelIndex.FindVariable(Index, Reference)["Name"]
+	RowBytes = len(Name) + 30 + AnnotationBytes + TimePoints * BytesPerValueText # allowing 30 bytes for the subscripts written after the name
+	return ReferenceSize(Index, Reference) * RowBytes
+
+
+# Counting Runs
+# -------------
+# Each run in a command script has one MENU>RUN command, and its results are exported with one
+# VDF2TAB command per results file (the carbon cap script can export one run several times).
+# This returns the number of runs and the variable list used by each export.
+def ReadRunsAndExports(ScriptFile):
+	Runs = 0
+	ExportLists = []
+	with open(ScriptFile, 'r') as Script:
+		for Line in Script:
+			if Line.startswith("MENU>RUN|"):
+				Runs += 1
+			elif Line.startswith("MENU>VDF2TAB|"):
+				ExportLists.append(Line.split("|")[3])
+	return Runs, ExportLists
+
+
+def FormatBytes(Bytes):
+	for Unit in ("bytes", "KB", "MB", "GB"):
+		if Bytes < 1000 or Unit == "GB":
+			return format(Bytes, ".0f" if Unit == "bytes" else ".1f") + " " + Unit
+		Bytes /= 1000
+
+
+if __name__ == "__main__":
+	Index = ModelIndex.LoadModelIndex(ModelFile)
+	TimePoints = SavedTimePoints(Index, ModelFile)
+
+	# The minimal save set, in the order the variables are first listed.
+	Savelist = []
+	Sources = {}
+	for ListFile in AnalysisVariableLists:
+		for Reference in ModelIndex.ReadVariableList(ListFile):
+			Sources.setdefault(Reference, []).append(ListFile)
+	for Reference in PostProcessingVariables:
+		Sources.setdefault(Reference, []).append("CreateCostCurves.py")
+	for Reference in Sources:
+		if ModelIndex.FindVariable(Index, Reference) is None:
+			raise ValueError(Reference + " (listed in " + ", ".join(Sources[Reference]) + ") is not a variable in " + ModelFile + ".")
+		Savelist.append(Reference)
+
+	# A whole variable makes listing some of its elements separately unnecessary.
+	WholeVariables = set(ModelIndex.CanonicalName(Reference) for Reference in Savelist if not ModelIndex.SplitSubscripts(Reference)[1])
+	Savelist = [Reference for Reference in Savelist
+		if not ModelIndex.SplitSubscripts(Reference)[1] or ModelIndex.CanonicalName(ModelIndex.SplitSubscripts(Reference)[0]) not in WholeVariables]
+
+	f = open(SavelistFile, 'w')
+	for Reference in Savelist:
+		f.write(Reference + "\n")
+	f.close()
+
+	FullModelBytes = sum(SavedBytes(Index, Variable["Name"], TimePoints) for Variable in Index["Variables"].values() if Variable["Kind"] != "lookup")
+	SavelistBytes = sum(SavedBytes(Index, Reference, TimePoints) for Reference in Savelist)
+	print("Wrote " + str(len(Savelist)) + " variables to " + SavelistFile + " (" + str(TimePoints) + " saved time points per run).")
+	print()
+	print("Estimated .vdf file size per run:")
+	print("\tWithout a SAVELIST: " + FormatBytes(FullModelBytes))
+	print("\tWith " + SavelistFile + ": " + FormatBytes(SavelistBytes) + " (" + format(SavelistBytes / FullModelBytes * 100, ".2f") + "% of the full model)")
+	print()
+	print("Largest variables in the SAVELIST:")
+	for Reference in sorted(Savelist, key=lambda Reference: -SavedBytes(Index, Reference, TimePoints))[:10]:
+		print("\t" + FormatBytes(SavedBytes(Index, Reference, TimePoints)) + "\t" + Reference)
+
+	for ScriptFile in BatchScripts:
+		if not os.path.exists(ScriptFile):
+			continue
+		Runs, ExportLists = ReadRunsAndExports(ScriptFile)
+		ListBytes = {}
+		for ListFile in set(ExportLists):
+			if os.path.exists(ListFile):
+				ListBytes[ListFile] = sum(ExportedBytes(Index, Reference, TimePoints) for Reference in ModelIndex.ReadVariableList(ListFile))
+		ExportedTotal = sum(ListBytes.get(ListFile, 0) for ListFile in ExportLists)
+		print()
+		print(ScriptFile + ": " + str(Runs) + " runs")
+		print("\t.vdf data written: " + FormatBytes(FullModelBytes * Runs) + " without a SAVELIST, " + FormatBytes(SavelistBytes * Runs) + " with it")
+		print("\tResults file: about " + FormatBytes(ExportedTotal / max(Runs, 1)) + " per run, " + FormatBytes(ExportedTotal) + " in total")
@@ -0,0 +1,169 @@
+# ProfileModelEquations.py
+#
+# This is a Python script that estimates how much of the work of simulating the model is done
+# by each of its variables, using only the equations in the model file (so Vensim is not
+# needed).  A variable's cost per simulated year is estimated as:
+#
+#	(number of values it defines) x (operations to compute each value) x (evaluations per year)
+#
+# The number of values comes from the sizes of the subscript ranges on the left side of its
+# equations.  Operations are counted in the right side of each equation: arithmetic and
+# comparison operators and function calls each count as one, a call to a lookup counts as
+# LookupCost, and a function that works through a whole subscript range (such as SUM or VMAX)
+# repeats the work of its argument once for every element it adds up.  Constants, input data,
+# lookups, and INITIAL equations are only computed once, at the start of a run, so they cost
+# nothing per year.
+#
+# These are estimates of relative cost, not measurements, but they show which equations and
+# which parts of the model are worth attention when tuning the model or choosing what to save.
+# The script writes the estimates for every variable to the ProfileFile and prints the most
+# expensive variables and a total for each sector.
+
+
+# File Names
+# ----------
+ModelFile = "EPS.mdl" # The name of the Vensim model file
+ProfileFile = "EquationProfile.tsv" # The desired filename for the estimates for every variable
+
+
+# Other Settings
+# --------------
+TopVariables = 25 # The number of most expensive variables to print
+LookupCost = 5 # Operations counted for each call to a lookup (Vensim searches the lookup's points and interpolates)
+FunctionCosts = {"ALLOCATE AVAILABLE": 20, "DELAY FIXED": 2, "LN": 2, "POWER": 2} # Operations counted for functions
+											# that take more work than an operator; other functions count as one
+RangeFunctions = ["SUM", "PROD", "VMAX", "VMIN"] # Functions that work through every element of the ranges marked with "!"
+
+
+import re
+import ModelIndex
+
+
+# Counting Operations
+# -------------------
+# We remove strings and comments, and replace the subscripts in each reference with a
+# placeholder (remembering which ranges are marked with "!"), so names and operators can be
+# found without confusion.  A lookup is called like a function, but its subscripts (if any)
+# come before the parenthesis.
+Operators = re.compile(r'<=|>=|<>|:AND:|:OR:|:NOT:|[-+*/^=<>]')
+Calls = re.compile(r'("[^"]*"|[A-Za-z][\w .&\']*?)\s*(?:\[\d+\]\s*)?\(')
+
+def MatchingParenthesis(Expression, Open):
+	Depth = 0
+	for Position in range(Open, len(Expression)):
+		if Expression[Position] == "(":
+			Depth += 1
+		elif Expression[Position] == ")":
+			Depth -= 1
+			if Depth == 0:
+				return Position
+	return len(Expression)
+
+def CountOperations(Index, Expression):
+
+	Expression = re.sub(r"'[^']*'", " ", Expression)
+	Expression = re.sub(r'\{[^}]*\}', " ", Expression)
+	RangeSizes = []
+	def ReplaceSubscripts(Match):
+		Size = 1
+		for Subscript in Match.group(1).split(","):
+			if Subscript.strip().endswith("!"):
+				Size *= ModelIndex.SubscriptSize(Index, Subscript.strip())
+		RangeSizes.append(Size)
+		return "[" + str(len(RangeSizes) - 1) + "]"
+	Expression = re.sub(r'\[([^\]]*)\]', ReplaceSubscripts, Expression)
+	# Numbers in scientific notation (like 1e-06) contain a sign that isn't an operator.
+	Expression = re.sub(r'(\d\.?\d*)[eE][-+]?\d+', r'\1', Expression)
+
+	Operations = len(Operators.findall(Expression))
+	LookupCalls = 0
+	for Match in Calls.finditer(Expression):
+		Name = " ".join(Match.group(1).split())
+		Variable = Index["Variables"].get(ModelIndex.CanonicalName(Name))
+		if Variable is not None and Variable["Kind"] == "lookup":
+			Operations += LookupCost
+			LookupCalls += 1
+			continue
+		if Name.upper() != Name or Variable is not None:
+			continue
+		Operations += FunctionCosts.get(Name, 1)
+
+		# A range function repeats its argument's work for every element it combines.
+		if Name in RangeFunctions:
+			Open = Match.end() - 1
+			Argument = Expression[Open + 1:MatchingParenthesis(Expression, Open)]
+			Repeats = 1
+			for Placeholder in re.findall(r'\[(\d+)\]', Argument):
+				Repeats = max(Repeats, RangeSizes[int(Placeholder)])
+			Operations += (Repeats - 1) * (1 + CountOperations(Index, Argument)[0])
+
+	return max(Operations, 1), LookupCalls
+
+
+# Profiling
+# ---------
+EvaluatedOnce = ["constant", "input data", "lookup", "initial"]
+
+def Sector(View):
+	if View is None:
+		return "(no view)"
+	for Suffix in (" - Main", " - BAU", " - Cash Flow"):
+		if View.endswith(Suffix):
+			return View[:-len(Suffix)]
+	return View
+
+def ProfileModel(Index):
+
+	TimeStep = ModelIndex.FindVariable(Index, "TIME STEP")
+	try:
+		EvaluationsPerYear = 1 / float(TimeStep["Equations"][0]["Expression"])
+	except (TypeError, ValueError, ZeroDivisionError):
+		EvaluationsPerYear = 1
+
+	Profile = []
+	for Variable in Index["Variables"].values():
+		Size = 0
+		Operations = 0
+		LookupCalls = 0
+		for Equation in Variable["Equations"]:
+			EquationOperations, EquationLookupCalls = CountOperations(Index, Equation["Expression"])
+			EquationSize = ModelIndex.EquationSize(Index, Equation)
+			Size += EquationSize
+			Operations += EquationSize * EquationOperations
+			LookupCalls += EquationLookupCalls
+		Evaluations = 0 if Variable["Kind"] in EvaluatedOnce else EvaluationsPerYear
+		Profile.append({"Name": Variable["Name"], "View": Variable["View"], "Sector": Sector(Variable["View"]), "Kind": Variable["Kind"],
+			"Equations": len(Variable["Equations"]), "Size": Size, "OperationsPerValue": Operations / Size if Size else 0,
+			"LookupCalls": LookupCalls, "EvaluationsPerYear": Evaluations, "OperationsPerYear": Operations * Evaluations})
+
+	Profile.sort(key=lambda Entry: -Entry["OperationsPerYear"])
+	return Profile
+
+
+if __name__ == "__main__":
+	Profile = ProfileModel(ModelIndex.LoadModelIndex(ModelFile))
+	TotalOperations = sum(Entry["OperationsPerYear"] for Entry in Profile)
+
+	f = open(ProfileFile, 'w')
+	f.write("Variable\tView\tSector\tKind\tEquations\tValues\tOperations per Value\tLookup Calls\tEvaluations per Year\tOperations per Year\tShare of Total\n")
+	for Entry in Profile:
+		f.write(Entry["Name"] + "\t" + str(Entry["View"] or "") + "\t" + Entry["Sector"] + "\t" + Entry["Kind"] + "\t" + str(Entry["Equations"]) + "\t" + str(Entry["Size"])
+			+ "\t" + format(Entry["OperationsPerValue"], ".1f") + "\t" + str(Entry["LookupCalls"]) + "\t" + format(Entry["EvaluationsPerYear"], "g")
+			+ "\t" + format(Entry["OperationsPerYear"], ".0f") + "\t" + format(Entry["OperationsPerYear"] / TotalOperations * 100, ".2f") + "%\n")
+	f.close()
+
+	print("Estimated operations per simulated year: " + format(TotalOperations, ",.0f"))
+	print()
+	print("Most expensive variables:")
+	Cumulative = 0
+	for Entry in Profile[:TopVariables]:
+		Cumulative += Entry["OperationsPerYear"]
+		print(format(Entry["OperationsPerYear"] / TotalOperations * 100, "5.1f") + "%  (" + format(Cumulative / TotalOperations * 100, "5.1f") + "% cumulative)  "
+			+ Entry["Name"] + " [" + str(Entry["Size"]) + " values x " + format(Entry["OperationsPerValue"], ".1f") + " operations]")
+	print()
+	print("Sectors:")
+	Sectors = {}
+	for Entry in Profile:
+		Sectors[Entry["Sector"]] = Sectors.get(Entry["Sector"], 0) + Entry["OperationsPerYear"]
+	for SectorName, Operations in sorted(Sectors.items(), key=lambda Item: -Item[1]):
+		print(format(Operations / TotalOperations * 100, "5.1f") + "%  " + SectorName)
@@ -0,0 +1,162 @@
+# PruneRunResults.py
+#
+# This is a Python script that shrinks a results file produced by one of the generated Vensim
+# command scripts (such as RunResults.tsv from CreateCombinationsScript.py).  In most runs of a
+# large batch, many of the output variables are unaffected by the policies that were changed,
+# so their values are exactly the same as in the baseline (BAU) run.  This script writes a
+# copy of the results file in which those rows carry a reference to the baseline ("@BAU")
+# instead of a value for every year.
+#
+# The pruned file has the same layout as the original, except that the baseline run is moved
+# to the start of the file.  Scripts that read results through RunResultsReader.py (such as
+# CreateCostCurves.py) reconstruct the pruned rows automatically, and they read pruned files
+# faster, since the repeated values don't need to be read or converted to numbers again.
+
+
+# File Names
+# ----------
+RunResultsFile = "RunResults.tsv" # The results file to prune
+PrunedResultsFile = "RunResults-Pruned.tsv" # The desired filename for the pruned results.  If this is the same
+											# as RunResultsFile, the original file is replaced once pruning succeeds.
+
+
+# Baseline Run
+# ------------
+# The baseline run is normally found automatically (see FindBaselineRun below).  To choose a
+# specific run instead, list annotations identifying it, such as {"CurrentRunNumber": "1"}.
+BaselineAnnotations = {}
+
+
+# Tolerance
+# ---------
+# A variable's values are treated as identical to the baseline if every yearly value differs
+# from the baseline value by no more than AbsoluteTolerance plus RelativeTolerance times the
+# size of the baseline value.  Vensim writes about six significant figures, so the defaults
+# only prune values that would be written identically.
+AbsoluteTolerance = 0
+RelativeTolerance = 1e-9
+
+
+import math
+import os
+from RunResultsReader import IterateRunResults, ParseAnnotations, ParseValue, BaselineReference
+
+
+# Finding the Baseline Run
+# ------------------------
+# Each generator labels its runs differently, so we recognize the baseline run of each:
+#	- Contribution tests: the run with no groups enabled ("EnabledPolicyGroup=None") or all
+#	  groups disabled ("DisabledPolicyGroup=All")
+#	- Data logging: the run with no settings file ("NoSettings")
+#	- Combinations and carbon cap scripts: the first run in which every numeric setting is
+#	  zero (such as "CurrentPrice=0" in a carbon cap scan).  Annotations that only identify a
+#	  run (IdentifyingAnnotations, such as the run number and the policy schedule) and text
+#	  annotations (such as the covered sectors) are not settings, so they are skipped.
+# If no run matches, the first run in the file is used.  Pruning is correct no matter which
+# run is the baseline; choosing the BAU run simply prunes the most rows.
+IdentifyingAnnotations = ["CurrentRunNumber", "PolicySchedule", "CoverageSet", "SolverIteration"]
+
+def IsBaselineRun(Annotations):
+	if BaselineAnnotations:
+		return all((Name, Value) in Annotations for Name, Value in BaselineAnnotations.items())
+	if ("EnabledPolicyGroup", "None") in Annotations or ("DisabledPolicyGroup", "All") in Annotations or ("", "NoSettings") in Annotations:
+		return True
+	Settings = []
+	for Name, Value in Annotations:
+		if Name and Name not in IdentifyingAnnotations:
+			try:
+				Settings.append(float(Value))
+			except ValueError:
+				continue
+	return len(Settings) > 0 and all(Value == 0 for Value in Settings)
+
+def FindBaselineRun(FileName):
+	FirstRun = None
+	for Years, Variable, Annotations, Values in IterateRunResults(FileName):
+		if FirstRun is None:
+			FirstRun = Annotations
+		if IsBaselineRun(Annotations):
+			return Annotations
+	if BaselineAnnotations:
+		raise ValueError("No run in " + FileName + " matches the BaselineAnnotations setting.")
+	return FirstRun
+
+
+def SameAsBaseline(Values, BaselineValues):
+	if len(Values) != len(BaselineValues):
+		return False
+	for Value, BaselineValue in zip(Values, BaselineValues):
+		if Value != BaselineValue and not (math.isnan(Value) and math.isnan(BaselineValue)):
+			if not abs(Value - BaselineValue) <= AbsoluteTolerance + RelativeTolerance * abs(BaselineValue):
+				return False
+	return True
+
+
+# Pruning
+# -------
+# We read the file twice.  The first pass finds the baseline run and keeps its rows (both the
+# original text, which is written unchanged at the start of the pruned file, and the values).
+# The second pass copies every other row, replacing the values with "@BAU" where they match
+# the baseline.  Rows are compared as text first, which settles most rows without converting
+# the values to numbers.  A pruned row keeps the line ending of the row it replaces, so the
+# pruned file has the same line endings as the original.
+def PruneRunResults(InputFile, OutputFile):
+
+	Baseline = FindBaselineRun(InputFile)
+	if Baseline is None:
+		raise ValueError(InputFile + " contains no runs.")
+
+	TimeRow = None
+	NumYears = None
+	BaselineRows = []
+	BaselineText = {}
+	BaselineValues = {}
+	with open(InputFile, 'r', newline='') as ResultsFile:
+		for Line in ResultsFile:
+			Fields = Line.rstrip("\r\n").split("\t")
+			if Fields[0].strip() == "Time" and TimeRow is None:
+				TimeRow = Line
+				NumYears = len(Fields) - ParseAnnotations(Fields)[1]
+				continue
+			if not Line.strip() or Fields[-1] == BaselineReference:
+				continue
+			Annotations, ValuesStart = ParseAnnotations(Fields, NumYears)
+			if Annotations == Baseline:
+				BaselineRows.append(Line)
+				BaselineText[Fields[0].strip()] = "\t".join(Fields[ValuesStart:])
+				BaselineValues[Fields[0].strip()] = [ParseValue(Field) for Field in Fields[ValuesStart:]]
+
+	TotalRows = PrunedRows = 0
+	TemporaryFile = OutputFile + ".tmp"
+	with open(InputFile, 'r', newline='') as ResultsFile, open(TemporaryFile, 'w', newline='') as PrunedFile:
+		if TimeRow is not None:
+			PrunedFile.write(TimeRow)
+		for Line in BaselineRows:
+			PrunedFile.write(Line)
+		for Line in ResultsFile:
+			Fields = Line.rstrip("\r\n").split("\t")
+			Variable = Fields[0].strip()
+			if not Line.strip() or Variable == "Time":
+				continue
+			if Fields[-1] == BaselineReference:
+				raise ValueError(InputFile + " has already been pruned.")
+			Annotations, ValuesStart = ParseAnnotations(Fields, NumYears)
+			if Annotations == Baseline:
+				continue
+			TotalRows += 1
+			if Variable in BaselineText and ("\t".join(Fields[ValuesStart:]) == BaselineText[Variable]
+					or SameAsBaseline([ParseValue(Field) for Field in Fields[ValuesStart:]], BaselineValues[Variable])):
+				PrunedFile.write("\t".join(Fields[:ValuesStart]) + "\t" + BaselineReference + Line[len(Line.rstrip("\r\n")):])
+				PrunedRows += 1
+			else:
+				PrunedFile.write(Line)
+	os.replace(TemporaryFile, OutputFile)
+
+	return TotalRows, PrunedRows
+
+
+if __name__ == "__main__":
+	OriginalSize = os.path.getsize(RunResultsFile)
+	TotalRows, PrunedRows = PruneRunResults(RunResultsFile, PrunedResultsFile)
+	print(str(PrunedRows) + " of " + str(TotalRows) + " rows outside the baseline run were identical to the baseline and were pruned.")
+	print("File size reduced from " + str(OriginalSize) + " to " + str(os.path.getsize(PrunedResultsFile)) + " bytes.")
@@ -0,0 +1,419 @@
+# RenderGraphs.py
+#
+# This is a Python script that draws the graphs defined in GraphDefinitions.vgd (the graphs
+# used by the web application and in Vensim) for every run in one or more results files,
+# without Vensim.  In Vensim, these graphs can only be viewed one run at a time; this script
+# writes each graph for each run to an image file, so the figures for a report or for a whole
+# batch can be produced at once.  Every variable in a graph must be in the OutputVarsFile used
+# for the runs (lines for variables that aren't in the results are left out, and the script
+# reports them).
+#
+# Each run in a results file is a "scenario".  A results file with one run (such as those
+# written by the script from CreateDataLoggingScript.py) is named after the file; runs in a
+# file with several runs are named after the file and their run number (or their position in
+# the file).  The graphs for each scenario are written to a folder named after it, inside the
+# ChartFolder, and the ScenarioIndexFile lists each scenario with the labels of its run.
+#
+# Graph Definitions
+# -----------------
+# The following parts of Vensim's graph definition format are used:
+#	:GRAPH name			starts a graph (the name is used for the image file)
+#	:TITLE text			the title shown above the graph
+#	:VAR variable|label	a line, with the label shown in the legend (the variable name if none)
+#	:LINE-WIDTH n		the width of the preceding line
+#	:LINE-COLOR r-g-b	the color of the preceding line
+#	:STACK-FILL			the lines are stacked and the areas between them are filled
+#	:Y-MIN n, :Y-MAX n	fixed ends of the vertical axis
+# All lines in a graph share one vertical axis (as :SCALE requests), and a legend is drawn for
+# graphs with more than one line.  Other entries, and lines that don't start with ":", are
+# ignored.
+#
+# Speed
+# -----
+# The graphs are drawn by several processes at once.  The script keeps a cache listing, for
+# every image it has written, a fingerprint (hash) of the graph's definition and the data it
+# shows.  When the script is run again, an image is only redrawn if its fingerprint changed
+# (or the file is missing), so after a batch is rerun, only the graphs whose data changed are
+# redrawn.  Delete the CacheFile to redraw every graph.
+#
+# Image Formats
+# -------------
+# SVG images are drawn by this script and need no other packages.  PNG images require the
+# matplotlib package; if it is not installed, SVG images are written instead.
+
+
+# File Names
+# ----------
+GraphDefinitionsFile = "GraphDefinitions.vgd"
+RunResultsFiles = ["NoSettings.tsv", "Scenario_Example.tsv", "Scenario_MEIMTarget.tsv"] # The results files with the runs to draw
+ChartFolder = "Charts" # The folder in which the images are written (one subfolder per scenario)
+ScenarioIndexFile = "Charts/Scenarios.tsv" # The desired filename of the TSV file listing the scenarios and their labels
+CacheFile = "Charts/ChartCache.json" # The fingerprint of every image written, used to skip images whose data hasn't changed
+
+
+# Chart Settings
+# --------------
+ChartFormat = "svg" # "svg" or "png"
+GraphNames = [] # The names of the graphs to draw (from the :GRAPH lines).  Leave empty to draw every graph.
+ChartWidth = 800 # In pixels
+ChartHeight = 450 # In pixels
+Workers = 0 # The number of processes drawing graphs at once.  Use 0 for one per processor.
+ChartsPerBatch = 2000 # The number of images handed to the processes at a time (limits memory use for large batches)
+
+
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import re
+import time
+from xml.sax.saxutils import escape
+from RunResultsReader import IterateRunResults, AnnotationValue
+
+
+# Changing the way the graphs are drawn should redraw every graph, so this number is part of
+# every fingerprint.  Increase it when the drawing code changes.
+RendererVersion = 1
+
+# Lines without a :LINE-COLOR are given these colors, in order.
+DefaultColors = [(0, 0, 255), (255, 0, 0), (0, 160, 0), (128, 0, 128), (255, 128, 0), (0, 160, 160), (128, 128, 128), (160, 82, 45)]
+
+
+# Reading the Graph Definitions
+# -----------------------------
+# Vensim ignores case, and treats underscores as spaces, in variable names.  This returns the
+# form of a name used to match the variables in a graph with the rows of a results file.
+def VariableKey(Name):
+	Key = " ".join(Name.replace("_", " ").lower().split())
+	return re.sub(r"\s*([\[\],])\s*", r"\1", Key)
+
+# This returns a list of graphs, in the order they are defined.  Each graph is a dictionary
+# with its "Name", "Title", "StackFill", "YMin" and "YMax" (None if not given), and "Lines", a
+# list of dictionaries with each line's "Variable", "Label", "Width", and "Color" (None if not
+# given).
+def ReadGraphDefinitions(FileName):
+
+	Graphs = []
+	Graph = None
+	with open(FileName, 'r', encoding="utf-8", errors="replace") as f:
+		for LineNumber, Line in enumerate(f, start=1):
+			Line = Line.strip()
+			if not Line.startswith(":"):
+				continue
+			Keyword, Separator, Value = Line.partition(" ")
+			Keyword = Keyword.upper()
+			Value = Value.strip()
+
+			if Keyword == ":GRAPH":
+				Graph = {"Name": Value, "Title": Value, "StackFill": False, "YMin": None, "YMax": None, "Lines": []}
+				Graphs.append(Graph)
+				continue
+			if Graph is None:
+				raise ValueError(FileName + ", line " + str(LineNumber) + ": " + Keyword + " appears before the first :GRAPH.")
+
+			try:
+				if Keyword == ":TITLE":
+					Graph["Title"] = Value
+				elif Keyword == ":STACK-FILL":
+					Graph["StackFill"] = True
+				elif Keyword == ":Y-MIN":
+					Graph["YMin"] = float(Value)
+				elif Keyword == ":Y-MAX":
+					Graph["YMax"] = float(Value)
+				elif Keyword == ":VAR":
+					Variable, Separator, Label = Value.partition("|")
+					Graph["Lines"].append({"Variable": Variable.strip(), "Label": Label.strip() or Variable.strip(), "Width": None, "Color": None})
+				elif Keyword in (":LINE-WIDTH", ":LINE-COLOR") and Graph["Lines"]:
+					if Keyword == ":LINE-WIDTH":
+						Graph["Lines"][-1]["Width"] = float(Value)
+					else:
+						Graph["Lines"][-1]["Color"] = tuple(int(Part) for Part in Value.split("-"))
+			except ValueError:
+				raise ValueError(FileName + ", line " + str(LineNumber) + ": \"" + Value + "\" is not a valid value for " + Keyword + ".")
+
+	return Graphs
+
+
+# Reading the Runs
+# ----------------
+# VDF2TAB writes all the rows of a run together, so a run ends when the annotations change.
+# This yields (RunPosition, Annotations, Years, Values) for every run in the file, where Values
+# maps the VariableKey of each of the requested variables found in the run to its values.
+def IterateRuns(FileName, Keys):
+
+	RunPosition = 0
+	Current = None
+	RunYears = None
+	Values = {}
+	VariableKeys = {}
+	for Years, Variable, Annotations, RowValues in IterateRunResults(FileName):
+		if Annotations != Current:
+			if Current is not None:
+				yield RunPosition, Current, RunYears, Values
+			Current = Annotations
+			Values = {}
+			RunPosition += 1
+		RunYears = Years
+		Key = VariableKeys.get(Variable)
+		if Key is None:
+			Key = VariableKeys[Variable] = VariableKey(Variable)
+		if Key in Keys:
+			Values[Key] = RowValues
+	if Current is not None:
+		yield RunPosition, Current, RunYears, Values
+
+def ScenarioName(FileName, RunPosition, Annotations, OneRun):
+	Name = os.path.splitext(os.path.basename(FileName))[0]
+	if OneRun:
+		return Name
+	return Name + " - Run " + AnnotationValue(Annotations, "CurrentRunNumber", str(RunPosition))
+
+# This only reads the file until the start of its third run.
+def HasOneRun(FileName):
+	return sum(1 for Run in itertools.islice(IterateRuns(FileName, set()), 2)) == 1
+
+
+# Axes
+# ----
+# This returns evenly spaced tick values covering Low to High, with a spacing of 1, 2, or 5
+# times a power of ten, so there are no more than about MaxTicks ticks.
+def AxisTicks(Low, High, MaxTicks=6):
+	Step = 10 ** math.floor(math.log10((High - Low) / MaxTicks))
+	for Multiple in (1, 2, 5, 10):
+		if (High - Low) / (Step * Multiple) <= MaxTicks:
+			Step *= Multiple
+			break
+	First = math.ceil(Low / Step - 1e-9)
+	Last = math.floor(High / Step + 1e-9)
+	return [round(Number * Step, 12) for Number in range(First, Last + 1)]
+
+def FormatTick(Value):
+	if abs(Value) >= 10**4:
+		return format(Value, ",.0f")
+	return format(Value, ".10g")
+
+# For stacked graphs, each line's values are added to those of the lines before it.  Values
+# that aren't numbers are stacked as zero.
+def StackedSeries(Series):
+	Stacked = []
+	Below = [0] * len(Series[0])
+	for Values in Series:
+		Below = [Base + (Value if Value == Value else 0) for Base, Value in zip(Below, Values)]
+		Stacked.append(Below)
+	return Stacked
+
+# This returns the ends of the vertical axis: the fixed ends given in the graph definition, or
+# the range of the data extended to the nearest ticks.
+def VerticalRange(Graph, PlottedSeries):
+	Numbers = [Value for Values in PlottedSeries for Value in Values if Value == Value]
+	if Graph["StackFill"]:
+		Numbers.append(0)
+	Low = min(Numbers) if Numbers else 0
+	High = max(Numbers) if Numbers else 1
+	if Graph["YMin"] is not None:
+		Low = Graph["YMin"]
+	if Graph["YMax"] is not None:
+		High = Graph["YMax"]
+	if High <= Low:
+		Margin = abs(Low) * 0.1 or 1
+		if Graph["YMax"] is None:
+			High = Low + Margin
+		else:
+			Low = High - Margin
+	Ticks = AxisTicks(Low, High)
+	Step = Ticks[1] - Ticks[0] if len(Ticks) > 1 else High - Low
+	if Graph["YMin"] is None:
+		Low = math.floor(Low / Step + 1e-9) * Step
+	if Graph["YMax"] is None:
+		High = math.ceil(High / Step - 1e-9) * Step
+	return Low, High
+
+
+# Drawing SVG Images
+# ------------------
+def ColorText(Color):
+	return "rgb(" + ",".join(str(Part) for Part in Color) + ")"
+
+def DrawSVG(FileName, Graph, Years, Series, Width, Height):
+
+	Lines = Graph["Lines"]
+	Colors = [Line["Color"] or DefaultColors[Number % len(DefaultColors)] for Number, Line in enumerate(Lines)]
+	PlottedSeries = StackedSeries(Series) if Graph["StackFill"] else Series
+	Low, High = VerticalRange(Graph, PlottedSeries)
+
+	Legend = len(Lines) > 1
+	Left, Right, Top, Bottom = 80, Width - (230 if Legend else 20), 45, Height - 40
+	def X(Year):
+		return Left + (Year - Years[0]) / max(Years[-1] - Years[0], 1) * (Right - Left)
+	def Y(Value):
+		return Bottom - (min(max(Value, Low), High) - Low) / (High - Low) * (Bottom - Top)
+
+	Parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="' + str(Width) + '" height="' + str(Height) + '" viewBox="0 0 ' + str(Width) + ' ' + str(Height) + '" font-family="Arial, Helvetica, sans-serif">\n',
+		'<rect width="100%" height="100%" fill="white"/>\n',
+		'<text x="' + str(Width / 2) + '" y="25" font-size="16" font-weight="bold" text-anchor="middle">' + escape(Graph["Title"]) + '</text>\n']
+
+	# Grid lines and tick labels
+	for Tick in AxisTicks(Low, High):
+		Parts.append('<line x1="' + str(Left) + '" x2="' + str(Right) + '" y1="' + format(Y(Tick), ".1f") + '" y2="' + format(Y(Tick), ".1f") + '" stroke="#dddddd"/>\n')
+		Parts.append('<text x="' + str(Left - 6) + '" y="' + format(Y(Tick) + 4, ".1f") + '" font-size="11" text-anchor="end">' + FormatTick(Tick) + '</text>\n')
+	for Tick in AxisTicks(Years[0], max(Years[-1], Years[0] + 1)):
+		if Tick == int(Tick) and Years[0] <= Tick <= Years[-1]:
+			Parts.append('<text x="' + format(X(Tick), ".1f") + '" y="' + str(Bottom + 18) + '" font-size="11" text-anchor="middle">' + str(int(Tick)) + '</text>\n')
+	Parts.append('<polyline points="' + str(Left) + ',' + str(Top) + ' ' + str(Left) + ',' + str(Bottom) + ' ' + str(Right) + ',' + str(Bottom) + '" fill="none" stroke="black"/>\n')
+
+	# The data.  Lines break where values aren't numbers.
+	if Graph["StackFill"]:
+		Below = [0] * len(Years)
+		for Values, Color in zip(PlottedSeries, Colors):
+			Points = [(X(Year), Y(Value)) for Year, Value in zip(Years, Values)] + [(X(Year), Y(Value)) for Year, Value in reversed(list(zip(Years, Below)))]
+			Parts.append('<polygon points="' + " ".join(format(PointX, ".1f") + "," + format(PointY, ".1f") for PointX, PointY in Points) + '" fill="' + ColorText(Color) + '" stroke="none"/>\n')
+			Below = Values
+	else:
+		for Values, Color, Line in zip(PlottedSeries, Colors, Lines):
+			for IsNumber, Segment in itertools.groupby(zip(Years, Values), key=lambda Point: Point[1] == Point[1]):
+				if IsNumber:
+					Parts.append('<polyline points="' + " ".join(format(X(Year), ".1f") + "," + format(Y(Value), ".1f") for Year, Value in Segment)
+						+ '" fill="none" stroke="' + ColorText(Color) + '" stroke-width="' + str(Line["Width"] or 1) + '" stroke-linejoin="round"/>\n')
+
+	if Legend:
+		for Number, (Line, Color) in enumerate(zip(Lines, Colors)):
+			LegendY = Top + 10 + Number * 18
+			Parts.append('<rect x="' + str(Right + 15) + '" y="' + str(LegendY - 9) + '" width="14" height="10" fill="' + ColorText(Color) + '"/>\n')
+			Parts.append('<text x="' + str(Right + 35) + '" y="' + str(LegendY) + '" font-size="11">' + escape(Line["Label"]) + '</text>\n')
+
+	Parts.append('</svg>\n')
+	with open(FileName, 'w', encoding="utf-8") as f:
+		f.writelines(Parts)
+
+
+# Drawing PNG Images
+# ------------------
+def DrawPNG(FileName, Graph, Years, Series, Width, Height):
+
+	import matplotlib
+	matplotlib.use("Agg")
+	import matplotlib.pyplot as plt
+
+	Lines = Graph["Lines"]
+	Colors = [tuple(Part / 255 for Part in (Line["Color"] or DefaultColors[Number % len(DefaultColors)])) for Number, Line in enumerate(Lines)]
+	Figure, Axes = plt.subplots(figsize=(Width / 100, Height / 100), dpi=100)
+	if Graph["StackFill"]:
+		Axes.stackplot(Years, [[Value if Value == Value else 0 for Value in Values] for Values in Series], colors=Colors, labels=[Line["Label"] for Line in Lines])
+	else:
+		for Values, Color, Line in zip(Series, Colors, Lines):
+			Axes.plot(Years, Values, color=Color, linewidth=Line["Width"] or 1, label=Line["Label"])
+	Axes.set_ylim(*VerticalRange(Graph, StackedSeries(Series) if Graph["StackFill"] else Series))
+	Axes.set_xlim(Years[0], Years[-1])
+	Axes.grid(axis="y", color="#dddddd")
+	Axes.set_title(Graph["Title"], fontweight="bold")
+	if len(Lines) > 1:
+		Axes.legend(loc="center left", bbox_to_anchor=(1.01, 0.5), fontsize=8, frameon=False)
+	Figure.tight_layout()
+	Figure.savefig(FileName)
+	plt.close(Figure)
+
+
+# Each task is (FileName, Format, Graph, Years, Series), where Graph contains only the lines
+# whose variables were found, and Series has their values.  The processes draw one batch of
+# tasks at a time and return the names of the files they wrote.
+def DrawChart(Task):
+	FileName, Format, Graph, Years, Series = Task
+	if Format == "png":
+		DrawPNG(FileName, Graph, Years, Series, ChartWidth, ChartHeight)
+	else:
+		DrawSVG(FileName, Graph, Years, Series, ChartWidth, ChartHeight)
+	return FileName
+
+def Fingerprint(Format, Graph, Years, Series):
+	return hashlib.sha1(repr((RendererVersion, Format, ChartWidth, ChartHeight, Graph, Years, Series)).encode("utf-8")).hexdigest()
+
+def SafeFileName(Name):
+	return re.sub(r'[<>:"/\\|?*]', "_", Name)
+
+
+if __name__ == "__main__":
+
+	Format = ChartFormat.lower()
+	if Format not in ("svg", "png"):
+		raise ValueError("ChartFormat must be \"svg\" or \"png\", not \"" + str(ChartFormat) + "\".")
+	if Format == "png":
+		try:
+			import matplotlib
+		except ImportError:
+			print("The matplotlib package is not installed, so SVG images will be written instead of PNG images.")
+			Format = "svg"
+
+	Graphs = ReadGraphDefinitions(GraphDefinitionsFile)
+	if GraphNames:
+		Missing = [Name for Name in GraphNames if Name not in [Graph["Name"] for Graph in Graphs]]
+		if Missing:
+			raise ValueError("These GraphNames are not defined in " + GraphDefinitionsFile + ": " + ", ".join(Missing))
+		Graphs = [Graph for Graph in Graphs if Graph["Name"] in GraphNames]
+	Keys = set(VariableKey(Line["Variable"]) for Graph in Graphs for Line in Graph["Lines"])
+
+	Cache = {}
+	if os.path.exists(CacheFile):
+		with open(CacheFile, 'r') as f:
+			Cache = json.load(f)
+
+	# The tasks are produced while the results files are read.  Images whose fingerprint matches
+	# the cache (and whose file exists) are skipped.
+	Counts = {"Drawn": 0, "Unchanged": 0, "Empty": 0}
+	MissingVariables = {}
+	NewFingerprints = {}
+	def Tasks(ScenarioIndex):
+		for FileName in RunResultsFiles:
+			OneRun = HasOneRun(FileName)
+			for RunPosition, Annotations, Years, Values in IterateRuns(FileName, Keys):
+				Scenario = ScenarioName(FileName, RunPosition, Annotations, OneRun)
+				ScenarioIndex.write(Scenario + "\t" + FileName + "".join("\t" + (Name + "=" if Name else "") + Value for Name, Value in Annotations) + "\n")
+				Folder = os.path.join(ChartFolder, SafeFileName(Scenario))
+				os.makedirs(Folder, exist_ok=True)
+				for Graph in Graphs:
+					Found = [Line for Line in Graph["Lines"] if VariableKey(Line["Variable"]) in Values]
+					for Line in Graph["Lines"]:
+						if Line not in Found:
+							MissingVariables.setdefault(Line["Variable"], set()).add(Graph["Name"])
+					if not Found or Years is None:
+						Counts["Empty"] += 1
+						continue
+					Shown = dict(Graph, Lines=Found)
+					Series = [Values[VariableKey(Line["Variable"])] for Line in Found]
+					ChartFile = os.path.join(Folder, SafeFileName(Graph["Name"]) + "." + Format)
+					Hash = Fingerprint(Format, Shown, Years, Series)
+					if Cache.get(ChartFile) == Hash and os.path.exists(ChartFile):
+						Counts["Unchanged"] += 1
+						continue
+					NewFingerprints[ChartFile] = Hash
+					yield ChartFile, Format, Shown, Years, Series
+
+	Start = time.perf_counter()
+	os.makedirs(ChartFolder, exist_ok=True)
+	Pool = None if Workers == 1 else multiprocessing.get_context("spawn").Pool(Workers if Workers > 0 else None)
+	try:
+		with open(ScenarioIndexFile, 'w') as ScenarioIndex:
+			ScenarioIndex.write("Scenario\tResults File\tLabels\n")
+			PendingTasks = Tasks(ScenarioIndex)
+			while True:
+				Batch = list(itertools.islice(PendingTasks, ChartsPerBatch))
+				if not Batch:
+					break
+				Written = Pool.map(DrawChart, Batch, chunksize=max(1, len(Batch) // 64)) if Pool is not None else map(DrawChart, Batch)
+				for ChartFile in Written:
+					Cache[ChartFile] = NewFingerprints.pop(ChartFile)
+					Counts["Drawn"] += 1
+	finally:
+		if Pool is not None:
+			Pool.terminate()
+		with open(CacheFile, 'w') as f:
+			json.dump(Cache, f, indent=0, sort_keys=True)
+
+	print("Drew " + str(Counts["Drawn"]) + " images and skipped " + str(Counts["Unchanged"]) + " unchanged images in " + format(time.perf_counter() - Start, ".1f") + " seconds.")
+	if Counts["Empty"]:
+		print(str(Counts["Empty"]) + " images were not drawn because none of the variables in their graph are in the results.")
+	if MissingVariables:
+		print("These variables are not in the results (add them to the OutputVarsFile to show them):")
+		for Variable in sorted(MissingVariables):
+			print("\t" + Variable + " (in " + ", ".join(sorted(MissingVariables[Variable])) + ")")
@@ -0,0 +1,286 @@
+# RunBenchmarks.py
+#
+# This is a Python script that measures how long the Python side of the EPS batch tools takes
+# (and how much memory it uses) on work of increasing size, so that changes which make the
+# tools slower are noticed.  Vensim is not needed.  The benchmarks are:
+#	- Combinations plan: generating the text of a combinations command script (see
+#	  EPSScriptGenerators.py) for PolicyCounts enabled policies, without writing it
+#	- Contribution plan: the same, for a contribution test command script
+#	- Write combinations script: generating a combinations command script and writing it to a file
+#	- Parse results: reading every row of a results file with ResultsRunCounts runs (see RunResultsReader.py)
+#	- Cost curves: the contribution analysis in CreateCostCurves.py, on the same results files
+#
+# Each enabled policy has two settings, so a combinations script for N policies has 2^N runs
+# (about a million at 20 policies).  The policies are taken from CreateContributionTestScript.py,
+# one from each group first, so the contribution test scripts have one group per policy.  The
+# results files are made up for the benchmark: each run is labeled like a contribution test
+# run and has a row for each of the variables CreateCostCurves.py reads, with made-up values.
+# All files are written to a temporary folder, which is deleted afterward.
+#
+# Measurements
+# ------------
+# Each benchmark is timed up to Repeats times, and the fastest time is kept, since slower
+# repeats are slowed by other programs running on the computer.  Peak memory use is measured
+# separately (unless MeasureMemory is False), in one more repeat with the tracemalloc module
+# turned on, since tracemalloc slows the code down.  It is the most memory the benchmark
+# allocated through Python at any one time.
+#
+# Baselines
+# ---------
+# The first time the script is run, or when UpdateBaselines is True, the measurements are
+# saved to the BaselineFile.  After that, each measurement is compared to its baseline, and
+# a benchmark that has become slower or uses more memory than allowed by the tolerances below
+# is reported as a regression (and the script exits with an error status, so it can be used
+# in automated checks).  Timings depend on the computer, so baselines should be recorded on the
+# same computer they are compared on; the script warns if they were not.
+
+
+# File Names
+# ----------
+BaselineFile = "BenchmarkBaselines.json" # The file holding the baseline measurements
+BenchmarkReportFile = "BenchmarkReport.txt" # The desired filename for the report comparing the measurements to the baselines
+
+
+# Benchmark Sizes
+# ---------------
+PolicyCounts = [5, 10, 15, 20] # Numbers of enabled policies for which to generate command scripts
+ScriptWritingPolicyCounts = [5, 10, 15] # Numbers of enabled policies for which to write the combinations script to a file
+										 # (the script for 20 policies is over 2 GB)
+ResultsRunCounts = [1000, 10000, 100000] # Numbers of runs in the results files to be parsed and analyzed
+
+
+# Other Settings
+# --------------
+Repeats = 3 # The number of times each benchmark is timed (the fastest time is kept)
+RepeatSecondsLimit = 30 # No more repeats of a benchmark are started after it has taken this many seconds in total
+TimeTolerance = 0.25 # A benchmark more than this fraction slower than its baseline is a regression...
+MinimumSlowdownSeconds = 0.05 # ...if it is also at least this many seconds slower (so that very fast benchmarks
+							  # aren't reported because of small variations in timing)
+MemoryTolerance = 0.10 # A benchmark using more than this fraction more memory than its baseline is a regression
+MeasureMemory = True # If False, peak memory use isn't measured.  Measuring it takes several times as long as timing the benchmarks.
+UpdateBaselines = False # If True, the measurements replace the baselines in the BaselineFile
+OnlyBenchmarks = [] # Names, or beginnings of names, of the benchmarks to run (such as "Parse results").  Leave empty to run all benchmarks.
+
+
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import EPSScriptGenerators
+import CreateContributionTestScript
+import CreateCostCurves
+from RunResultsReader import IterateRunResults
+
+
+# Benchmark Inputs
+# ----------------
+# This returns Count enabled policies, each with the settings 0 and its largest setting.
+def BenchmarkPolicies(Count):
+	FirstOfGroup = []
+	Others = []
+	for Policy in CreateContributionTestScript.PotentialPolicies:
+		if any(Policy[EPSScriptGenerators.Group] == Chosen[EPSScriptGenerators.Group] for Chosen in FirstOfGroup):
+			Others.append(Policy)
+		else:
+			FirstOfGroup.append(Policy)
+	Policies = []
+	for Policy in (FirstOfGroup + Others)[:Count]:
+		Policies.append((True, Policy[EPSScriptGenerators.LongName], Policy[EPSScriptGenerators.ShortName],
+			[0, Policy[EPSScriptGenerators.Settings][-1]], Policy[EPSScriptGenerators.Group]))
+	if len(Policies) < Count:
+		raise ValueError("CreateContributionTestScript.py lists only " + str(len(Policies)) + " policies, so a benchmark with " + str(Count) + " policies can't be run.")
+	return Policies
+
+# This writes a results file in the format written by a contribution test script in "Disable"
+# mode: a run with all policies ("None" disabled), a run with each group disabled, and a run
+# with all groups disabled ("All").  Disabling a group raises emissions and lowers costs by a
+# random amount, so the cost curves have groups of different sizes and costs.
+def WriteBenchmarkResults(FileName, Runs):
+	Generator = random.Random(Runs)
+	Years = list(range(2018, 2051))
+	BAUEmissions = [700.0 * (Position + 1) for Position in range(len(Years))]
+	PolicyEmissions = [Value * 0.6 for Value in BAUEmissions]
+	PolicyCost = [-5000.0 * (Position + 1) for Position in range(len(Years))]
+	GroupNames = ["None"] + ["Group " + str(Number) for Number in range(1, Runs - 1)] + ["All"]
+
+	with open(FileName, 'w') as f:
+		f.write("Time\tDisabledPolicyGroup=None\tDisabledPolicies=None\t" + "\t".join(str(Year) for Year in Years) + "\n")
+		for GroupName in GroupNames:
+			if GroupName == "None":
+				Emissions = PolicyEmissions
+				Cost = PolicyCost
+			elif GroupName == "All":
+				Emissions = BAUEmissions
+				Cost = [0.0] * len(Years)
+			else:
+				Share = Generator.random() * 2 / (Runs - 2)
+				Emissions = [Value + Share * (BAU - Value) for Value, BAU in zip(PolicyEmissions, BAUEmissions)]
+				Cost = [Value * (1 - Share * Generator.uniform(-1, 3)) for Value in PolicyCost]
+			Annotations = "\tDisabledPolicyGroup=" + GroupName + "\tDisabledPolicies=" + GroupName + "\t"
+			f.write(CreateCostCurves.AbatementVariable + Annotations + "\t".join(format(Value, ".6g") for Value in Emissions) + "\n")
+			f.write(CreateCostCurves.CostVariable + Annotations + "\t".join(format(Value, ".6g") for Value in Cost) + "\n")
+
+
+# The Benchmarks
+# --------------
+# Each benchmark's function does any preparation that shouldn't be timed and returns the
+# function to be timed.
+def CombinationsPlan(PolicyCount, WorkFolder):
+	Policies = BenchmarkPolicies(PolicyCount)
+	def Benchmark():
+		for Part in EPSScriptGenerators.CombinationsScript(Policies):
+			pass
+	return Benchmark
+
+def ContributionPlan(PolicyCount, WorkFolder):
+	Policies = BenchmarkPolicies(PolicyCount)
+	def Benchmark():
+		for Part in EPSScriptGenerators.ContributionTestScript(Policies):
+			pass
+	return Benchmark
+
+def WriteCombinationsScript(PolicyCount, WorkFolder):
+	Policies = BenchmarkPolicies(PolicyCount)
+	def Benchmark():
+		with open(os.path.join(WorkFolder, "BenchmarkScript.cmd"), 'w') as f:
+			f.writelines(EPSScriptGenerators.CombinationsScript(Policies))
+	return Benchmark
+
+def BenchmarkResultsFile(Runs, WorkFolder):
+	FileName = os.path.join(WorkFolder, "BenchmarkResults-" + str(Runs) + ".tsv")
+	if not os.path.exists(FileName):
+		WriteBenchmarkResults(FileName, Runs)
+	return FileName
+
+def ParseResults(Runs, WorkFolder):
+	FileName = BenchmarkResultsFile(Runs, WorkFolder)
+	def Benchmark():
+		for Row in IterateRunResults(FileName):
+			pass
+	return Benchmark
+
+def CostCurves(Runs, WorkFolder):
+	FileName = BenchmarkResultsFile(Runs, WorkFolder)
+	def Benchmark():
+		Results, Years = CreateCostCurves.ReadContributionResults(FileName)
+		for Schedule in Results:
+			for Mode in Results[Schedule]:
+				CreateCostCurves.CalculateCostCurves(Mode, Results[Schedule][Mode], Years, CreateCostCurves.CostCurveYears)
+	return Benchmark
+
+def BenchmarkList():
+	Benchmarks = []
+	for PolicyCount in PolicyCounts:
+		Benchmarks.append(("Combinations plan, " + str(PolicyCount) + " policies", CombinationsPlan, PolicyCount))
+	for PolicyCount in PolicyCounts:
+		Benchmarks.append(("Contribution plan, " + str(PolicyCount) + " policies", ContributionPlan, PolicyCount))
+	for PolicyCount in ScriptWritingPolicyCounts:
+		Benchmarks.append(("Write combinations script, " + str(PolicyCount) + " policies", WriteCombinationsScript, PolicyCount))
+	for Runs in ResultsRunCounts:
+		Benchmarks.append(("Parse results, " + str(Runs) + " runs", ParseResults, Runs))
+	for Runs in ResultsRunCounts:
+		Benchmarks.append(("Cost curves, " + str(Runs) + " runs", CostCurves, Runs))
+	if OnlyBenchmarks:
+		Benchmarks = [Entry for Entry in Benchmarks if any(Entry[0].startswith(Name) for Name in OnlyBenchmarks)]
+	return Benchmarks
+
+
+# Measuring
+# ---------
+def Measure(Benchmark):
+	Times = []
+	while len(Times) < max(Repeats, 1) and (not Times or sum(Times) < RepeatSecondsLimit):
+		gc.collect()
+		Start = time.perf_counter()
+		Benchmark()
+		Times.append(time.perf_counter() - Start)
+
+	PeakMemoryBytes = None
+	if MeasureMemory:
+		gc.collect()
+		tracemalloc.start()
+		Benchmark()
+		PeakMemoryBytes = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+	return {"Seconds": min(Times), "Repeats": len(Times), "PeakMemoryBytes": PeakMemoryBytes}
+
+def Machine():
+	return {"Platform": platform.platform(), "Processor": platform.processor() or platform.machine(), "Python": platform.python_version()}
+
+def FormatMegabytes(Bytes):
+	return "-" if Bytes is None else format(Bytes / 10**6, ".1f")
+
+# This returns the regressions found in a measurement, as a list of descriptions.
+def Regressions(Measurement, Baseline):
+	Found = []
+	Slowdown = Measurement["Seconds"] - Baseline["Seconds"]
+	if Slowdown > TimeTolerance * Baseline["Seconds"] and Slowdown >= MinimumSlowdownSeconds:
+		Found.append(format(Slowdown / Baseline["Seconds"] * 100, ".0f") + "% slower")
+	if Measurement["PeakMemoryBytes"] is None or Baseline["PeakMemoryBytes"] is None:
+		return Found
+	if Measurement["PeakMemoryBytes"] > (1 + MemoryTolerance) * Baseline["PeakMemoryBytes"]:
+		Found.append(format((Measurement["PeakMemoryBytes"] / max(Baseline["PeakMemoryBytes"], 1) - 1) * 100, ".0f") + "% more memory")
+	return Found
+
+
+if __name__ == "__main__":
+
+	if os.path.exists(BaselineFile):
+		with open(BaselineFile, 'r') as f:
+			Baselines = json.load(f)
+	else:
+		Baselines = None
+
+	Report = []
+	if Baselines is not None and Baselines["Machine"] != Machine():
+		Report.append("Warning: the baselines were recorded on a different computer or Python version (" + ", ".join(Baselines["Machine"].values()) + "), so the timings may not be comparable.")
+		Report.append("")
+	Report.append("Benchmark\tSeconds\tBaseline Seconds\tPeak Memory (MB)\tBaseline Peak Memory (MB)\tResult")
+	print("\n".join(Report))
+
+	Measurements = {}
+	RegressionCount = 0
+	with tempfile.TemporaryDirectory() as WorkFolder:
+		for Name, Function, Size in BenchmarkList():
+			Measurement = Measure(Function(Size, WorkFolder))
+			Measurements[Name] = Measurement
+			Baseline = Baselines["Benchmarks"].get(Name) if Baselines is not None else None
+			if Baseline is None:
+				BaselineSeconds = BaselineMemory = "-"
+				Result = "no baseline"
+			else:
+				BaselineSeconds = format(Baseline["Seconds"], ".3f")
+				BaselineMemory = FormatMegabytes(Baseline["PeakMemoryBytes"])
+				Found = Regressions(Measurement, Baseline)
+				if Found:
+					RegressionCount += 1
+					Result = "REGRESSION: " + ", ".join(Found)
+				else:
+					Result = "ok"
+			Report.append(Name + "\t" + format(Measurement["Seconds"], ".3f") + "\t" + BaselineSeconds
+				+ "\t" + FormatMegabytes(Measurement["PeakMemoryBytes"]) + "\t" + BaselineMemory + "\t" + Result)
+			print(Report[-1])
+
+	Report.append("")
+	if Baselines is None or UpdateBaselines:
+		if Baselines is not None:
+			Measurements = dict(Baselines["Benchmarks"], **Measurements)
+		with open(BaselineFile, 'w') as f:
+			json.dump({"Machine": Machine(), "Benchmarks": Measurements}, f, indent="\t")
+		Report.append("Saved the measurements as the baselines in " + BaselineFile + ".")
+	elif RegressionCount:
+		Report.append(str(RegressionCount) + " benchmark(s) regressed.")
+	else:
+		Report.append("No regressions.")
+	print(Report[-1])
+
+	with open(BenchmarkReportFile, 'w') as f:
+		f.write("\n".join(Report) + "\n")
+	if RegressionCount and not UpdateBaselines:
+		sys.exit(1)
@@ -0,0 +1,254 @@
+# RunResultsReader.py
+#
+# This is a Python module used by the post-processing scripts to read the tab-separated
+# results files that Vensim produces when it runs one of the generated command scripts
+# (for example, RunResults.tsv or ContributionTestResults.tsv).  It is not meant to be
+# run by itself.
+#
+# File Format
+# -----------
+# The VDF2TAB command in the generated Vensim command scripts writes one row per output
+# variable per run.  Each row contains the variable name, then any text columns the
+# Python script asked Vensim to add (we call these "annotations"), then one value per
+# simulated year:
+#
+#	Output Total CO2e Emissions	DisabledPolicyGroup=None	DisabledPolicies=None	669.769	1360.61	...
+#
+# Only the first run written to a file includes the "Time" row, which has the same layout
+# and lists the simulated years.  Annotations generally take the form "Name=Value".  A
+# few scripts write the value in the following column (e.g. "CurrentPrice=" followed by
+# "10"), some add a bare label (such as the RunName), and CreateCombinationsScript.py
+# pads with "-" columns to satisfy MinPolicyCols.  All of these forms are handled here.
+#
+# Pruned Files
+# ------------
+# PruneRunResults.py rewrites results files so that the values of a variable that are
+# identical to those of the baseline (BAU) run are replaced by a single "@BAU" column.  In a
+# pruned file, the baseline run is always the first run in the file.  The reader keeps the
+# first run's values and substitutes them for every "@BAU" row, so scripts reading results
+# through this module don't need to know whether a file was pruned.
+BaselineReference = "@BAU"
+
+
+import locale
+import os
+
+
+# Missing Values
+# --------------
+# Vensim writes ":NA:" for values that are not available.  We read these (and any other
+# entries that aren't numbers) as NaN, so every row has one value per year.
+NotANumber = float("nan")
+
+
+def ParseValue(Text):
+	try:
+		return float(Text)
+	except ValueError:
+		return NotANumber
+
+
+def IsNumber(Text):
+	try:
+		float(Text)
+		return True
+	except ValueError:
+		return Text == ":NA:"
+
+
+# Annotations
+# -----------
+# This function splits the annotation columns off of a row that has already been split on
+# tabs.  It returns the annotations, as a tuple of (Name, Value) pairs in the order they
+# appear, and the position in the row where the yearly values begin.  A bare label is
+# returned with an empty Name.  When the number of years is known (from the "Time" row),
+# we use it to locate the values; otherwise we stop at the first number that is not the
+# value of a "Name=" annotation.
+def ParseAnnotations(Fields, NumYears=None):
+
+	if NumYears is not None and len(Fields) - NumYears >= 1:
+		ValuesStart = len(Fields) - NumYears
+	else:
+		ValuesStart = None
+
+	Annotations = []
+	Position = 1
+	while Position < len(Fields):
+		if ValuesStart is not None and Position >= ValuesStart:
+			break
+		Field = Fields[Position].strip()
+		if ValuesStart is None and IsNumber(Field):
+			break
+		Position += 1
+		if Field == "" or Field == "-":
+			continue
+		if Field.endswith("=") and Position < len(Fields):
+			Annotations.append((Field[:-1], Fields[Position].strip()))
+			Position += 1
+		elif "=" in Field:
+			Name, Value = Field.split("=", 1)
+			Annotations.append((Name, Value))
+		else:
+			Annotations.append(("", Field))
+
+	if ValuesStart is None:
+		ValuesStart = Position
+	return tuple(Annotations), ValuesStart
+
+
+# This returns the value of the named annotation, or Default if the row doesn't have one.
+def AnnotationValue(Annotations, Name, Default=None):
+	for AnnotationName, Value in Annotations:
+		if AnnotationName == Name:
+			return Value
+	return Default
+
+
+# The years of a "Time" row.
+def TimeRowYears(Fields):
+	return [int(round(ParseValue(Field))) for Field in Fields[ParseAnnotations(Fields)[1]:]]
+
+# This returns the values that a row of a pruned file refers to with "@BAU": those of the same
+# variable in the first run of the file.
+def BaselineRow(BaselineValues, Variable, FileName):
+	if Variable not in BaselineValues:
+		raise ValueError(FileName + " refers to baseline values of " + Variable + ", but the first run in the file doesn't include that variable.")
+	return BaselineValues[Variable]
+
+
+# Reading Results Files
+# ---------------------
+# This function reads a results file one row at a time, so files from very large batches
+# can be processed without holding them in memory.  For every variable row, it yields a
+# tuple of (Years, Variable, Annotations, Values), where Years is the list of simulated
+# years from the most recent "Time" row (or None if the file has no "Time" row), and Values
+# is a list of floats with one entry per year.  All the rows written for one run share the
+# same Annotations, so the annotations serve as the key identifying the run.  (In pruned
+# files, rows that refer to the baseline run share its Values list, so don't modify it.)
+#
+# Consecutive rows usually belong to the same run, so when a row's annotation columns are the
+# same as the previous row's, the previous row's Annotations are used without parsing them again.
+def IterateRunResults(FileName):
+	with open(FileName, 'r', newline='') as ResultsFile:
+		yield from ParseRunResults(ResultsFile, FileName)
+
+# This does the work of IterateRunResults for any sequence of lines from a results file.  A
+# part of a file that doesn't begin with the first run needs the Years and the baseline values
+# (for pruned files) from the start of the file (see ReadFirstRun below).
+def ParseRunResults(Lines, FileName, Years=None, BaselineValues=None):
+
+	CollectBaseline = BaselineValues is None
+	BaselineValues = {} if CollectBaseline else BaselineValues
+	FirstRun = None
+	PreviousFields = None
+	Annotations = None
+	for Line in Lines:
+		Line = Line.rstrip("\r\n")
+		if not Line.strip():
+			continue
+		Fields = Line.split("\t")
+		Variable = Fields[0].strip()
+
+		if Variable == "Time":
+			Years = TimeRowYears(Fields)
+			continue
+
+		if Fields[-1] == BaselineReference:
+			if Fields[1:-1] != PreviousFields:
+				PreviousFields = Fields[1:-1]
+				Annotations = ParseAnnotations(Fields[:-1], 0)[0]
+			yield Years, Variable, Annotations, BaselineRow(BaselineValues, Variable, FileName)
+			continue
+
+		if Years is not None and len(Fields) - len(Years) >= 1:
+			ValuesStart = len(Fields) - len(Years)
+			if Fields[1:ValuesStart] != PreviousFields:
+				PreviousFields = Fields[1:ValuesStart]
+				Annotations = ParseAnnotations(Fields, len(Years))[0]
+		else:
+			PreviousFields = None
+			Annotations, ValuesStart = ParseAnnotations(Fields, None if Years is None else len(Years))
+		Values = [ParseValue(Field) for Field in Fields[ValuesStart:]]
+		if CollectBaseline:
+			if FirstRun is None:
+				FirstRun = Annotations
+			if Annotations == FirstRun:
+				BaselineValues[Variable] = Values
+		yield Years, Variable, Annotations, Values
+
+
+# Reading Parts of a Results File
+# -------------------------------
+# Very large results files can be divided into parts that are read by several processes at
+# once.  Each part is a range of bytes that begins at the start of a line.  The years (from the
+# "Time" row) and the first run's values (which rows of a pruned file refer to) are read from
+# the start of the file once and given to every part.  (If a file was made by appending files
+# with different years, each part uses the years from the start of the file until it reaches
+# another "Time" row.)
+#
+# This returns the years from the first "Time" row and the values of each variable in the first
+# run.  If AsText is True, the values are the text of their columns, not numbers (as
+# CompareRunResults.py compares them).
+def ReadFirstRun(FileName, AsText=False):
+	Years = None
+	BaselineValues = {}
+	FirstRun = None
+	with open(FileName, 'r', newline='') as ResultsFile:
+		for Line in ResultsFile:
+			Fields = Line.rstrip("\r\n").split("\t")
+			if not Line.strip() or Fields[-1] == BaselineReference:
+				continue
+			if Fields[0].strip() == "Time":
+				Years = TimeRowYears(Fields)
+				continue
+			Annotations, ValuesStart = ParseAnnotations(Fields, None if Years is None else len(Years))
+			if FirstRun is None:
+				FirstRun = Annotations
+			if Annotations != FirstRun:
+				break
+			BaselineValues[Fields[0].strip()] = Fields[ValuesStart:] if AsText else [ParseValue(Field) for Field in Fields[ValuesStart:]]
+	return Years, BaselineValues
+
+# This returns a list of (Start, End) byte positions dividing the file into about NumParts
+# parts.
+def FileParts(FileName, NumParts):
+	Size = os.path.getsize(FileName)
+	Starts = [0]
+	with open(FileName, 'rb') as ResultsFile:
+		for Part in range(1, NumParts):
+			ResultsFile.seek(max(Size * Part // NumParts - 1, Starts[-1]))
+			ResultsFile.readline()
+			if ResultsFile.tell() < Size and ResultsFile.tell() > Starts[-1]:
+				Starts.append(ResultsFile.tell())
+	return list(zip(Starts, Starts[1:] + [Size]))
+
+# This yields the lines that begin between the Start and End byte positions.  Lines are decoded
+# as open() decodes them, unless Decode is False.
+Encoding = locale.getpreferredencoding(False)
+
+def ReadLines(FileName, Start, End, Decode=True):
+	with open(FileName, 'rb') as ResultsFile:
+		ResultsFile.seek(Start)
+		Position = Start
+		while Position < End:
+			Line = ResultsFile.readline()
+			if not Line:
+				break
+			Position += len(Line)
+			yield Line.decode(Encoding, errors='replace') if Decode else Line
+
+def IterateRunResultsPart(FileName, Start, End, Years, BaselineValues):
+	return ParseRunResults(ReadLines(FileName, Start, End), FileName, Years, BaselineValues)
+
+
+# Many scripts only need the values from a few years.  This returns the positions of the
+# requested years within Years, and raises an error naming any year that isn't present.
+def YearPositions(Years, RequestedYears):
+	if Years is None:
+		raise ValueError("The results file has no \"Time\" row, so simulated years are unknown.")
+	Positions = []
+	for Year in RequestedYears:
+		if Year not in Years:
+			raise ValueError("Year " + str(Year) + " is not in the results file (which covers " + str(Years[0]) + "-" + str(Years[-1]) + ").")
+		Positions.append(Years.index(Year))
+	return Positions
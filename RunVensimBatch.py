@@ -0,0 +1,254 @@
+# RunVensimBatch.py
+#
+# This is a Python script that carries out a Vensim command script generated by one of the
+# other Python scripts (such as GeneratedCombinationsScript.cmd), sending its commands to
+# Vensim one at a time through the Vensim DLL (see VensimExecutors.py).  The results are the
+# same as those produced by opening the command script in Vensim, but this script also
+# measures where the time goes.  For each run, it records:
+#	- the time spent on each kind of command: SETVAL and READCIN ("setval"), MENU>RUN ("run"),
+#	  MENU>VDF2TAB ("vdf2tab"), FILE>DELETE ("delete"), and anything else ("other")
+#	- the size of the .vdf file Vensim wrote for the run (before it is deleted)
+#	- how much the run added to the results file(s)
+#	- the peak memory use of the process running Vensim, so far
+#	- the policy settings (SETVAL commands) and labels (VDF2TAB annotations) of the run
+#
+# The measurements are written to a log file with one line of JSON per run, as soon as each
+# run finishes, so the log of an interrupted batch is still useful.  Afterward, the script
+# writes a summary: throughput, typical and worst-case times for each kind of command, and
+# the slowest runs with their policy settings.  To summarize an existing log without running
+# anything, set SummarizeOnly to True.
+
+
+# File Names
+# ----------
+CommandScript = "GeneratedCombinationsScript.cmd" # The Vensim command script to carry out
+TimingLogFile = "BatchTimings.jsonl" # The desired filename for the log of measurements (one line of JSON per run)
+TimingSummaryFile = "BatchTimingSummary.txt" # The desired filename for the summary of the measurements
+
+
+# Other Settings
+# --------------
+Executor = "VensimDLL" # "VensimDLL" to run the model in Vensim, or "StandIn" to try out a command script without Vensim
+					   # (the stand-in writes files of the right format, but the numbers in them are not model results)
+SummarizeOnly = False # If True, summarize the existing TimingLogFile instead of carrying out the CommandScript
+SlowestRunsToReport = 10 # The number of slowest runs to list in the summary
+
+
+import json
+import os
+import time
+import VensimExecutors
+from RunResultsReader import ParseAnnotations, AnnotationValue
+
+try:
+	import psutil
+except ImportError:
+	psutil = None
+try:
+	import resource
+except ImportError:
+	resource = None
+
+
+# Reading the Command Script
+# --------------------------
+# We divide the command script into a preamble (commands such as SPECIAL>LOADMODEL, which
+# come before the first run), the runs, and a postamble (commands after the last run, such as
+# clearing the SAVELIST).  A run begins with the first command that prepares or performs a
+# simulation (RUNNAME, SETVAL, READCIN, or MENU>RUN) after the previous run's simulation has
+# been performed, so the settings for a run are counted as part of it.
+Phases = {"SIMULATE>SETVAL": "setval", "SIMULATE>READCIN": "setval", "MENU>RUN": "run", "MENU>VDF2TAB": "vdf2tab", "FILE>DELETE": "delete"}
+RunStartingCommands = ("SIMULATE>RUNNAME", "SIMULATE>SETVAL", "SIMULATE>READCIN", "MENU>RUN")
+
+def CommandName(Line):
+	return Line.split("|", 1)[0].strip().upper()
+
+def ReadCommandScript(FileName):
+	Preamble = []
+	Runs = []
+	Current = Preamble
+	Simulated = False
+	with open(FileName, 'r') as Script:
+		for Line in Script:
+			Line = Line.rstrip("\r\n")
+			if not Line.strip():
+				continue
+			Name = CommandName(Line)
+			if Name in RunStartingCommands and (Current is Preamble or Simulated):
+				Current = []
+				Runs.append(Current)
+				Simulated = False
+			if Name == "MENU>RUN":
+				Simulated = True
+			Current.append(Line)
+
+	# Commands after the last VDF2TAB or FILE>DELETE of the last run belong to the postamble.
+	Postamble = []
+	if Runs:
+		while Runs[-1] and CommandName(Runs[-1][-1]) not in ("MENU>VDF2TAB", "FILE>DELETE", "MENU>RUN"):
+			Postamble.insert(0, Runs[-1].pop())
+	return Preamble, Runs, Postamble
+
+
+# Measurements
+# ------------
+# Peak memory use comes from psutil if it is installed (on Windows, this is the peak working
+# set of the process).  Otherwise, on Linux and macOS, we use the resource module.  Either
+# way, it is the highest memory use of the process since it started, so it can only rise
+# from one run to the next; a jump shows which run needed more memory.  If neither is
+# available, no memory use is recorded.
+def PeakMemoryBytes():
+	if psutil is not None:
+		MemoryInfo = psutil.Process().memory_info()
+		return getattr(MemoryInfo, "peak_wset", MemoryInfo.rss)
+	if resource is not None:
+		PeakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		return PeakRSS if os.uname().sysname == "Darwin" else PeakRSS * 1024
+	return None
+
+def FileSize(FileName):
+	try:
+		return os.path.getsize(FileName)
+	except OSError:
+		return 0
+
+
+# This carries out one group of commands, and returns a dictionary of measurements.  RunName
+# is a one-entry list holding the current run name (set by SIMULATE>RUNNAME), so it carries
+# over from one group of commands to the next.
+def PerformCommands(Vensim, Commands, RunName):
+
+	Seconds = {}
+	Record = {"Seconds": Seconds, "Settings": {}, "Annotations": None, "VDFBytes": 0, "ResultsBytesAdded": 0}
+	for Line in Commands:
+		Name = CommandName(Line)
+		Arguments = Line.split("|", 1)[1] if "|" in Line else ""
+		Phase = Phases.get(Name, "other")
+
+		if Name == "SIMULATE>RUNNAME":
+			RunName[0] = Arguments.strip()
+		elif Name == "SIMULATE>SETVAL" and "=" in Arguments:
+			Setting, Value = Arguments.split("=", 1)
+			Record["Settings"][Setting.strip()] = Value.strip()
+		elif Name == "SIMULATE>READCIN" and Arguments.strip():
+			Record["Settings"]["READCIN"] = Arguments.strip()
+		elif Name == "MENU>VDF2TAB":
+			Fields = Arguments.split(":", 1)[0].split("|")
+			ResultsFile = Fields[1]
+			SizeBefore = FileSize(ResultsFile) if len(Fields) > 3 and "+" in Fields[3] else 0
+			if Record["Annotations"] is None:
+				Record["Annotations"] = Arguments.split(":", 1)[1] if ":" in Arguments else ""
+
+		Start = time.perf_counter()
+		Vensim.Command(Line)
+		Seconds[Phase] = Seconds.get(Phase, 0) + time.perf_counter() - Start
+
+		if Name == "MENU>RUN":
+			Record["VDFBytes"] = FileSize(RunName[0] + ".vdf")
+		elif Name == "MENU>VDF2TAB":
+			Record["ResultsBytesAdded"] += FileSize(ResultsFile) - SizeBefore
+
+	Record["TotalSeconds"] = sum(Seconds.values())
+	Record["PeakMemoryBytes"] = PeakMemoryBytes()
+	return Record
+
+
+def PerformBatch(Vensim, FileName, LogFileName):
+
+	Preamble, Runs, Postamble = ReadCommandScript(FileName)
+	RunName = ["Current"]
+	with open(LogFileName, 'w') as LogFile:
+
+		def Log(Record):
+			LogFile.write(json.dumps(Record) + "\n")
+			LogFile.flush()
+
+		Record = PerformCommands(Vensim, Preamble, RunName)
+		Record["Part"] = "preamble"
+		Log(Record)
+		for Number, Commands in enumerate(Runs, start=1):
+			Record = PerformCommands(Vensim, Commands, RunName)
+			Record["Part"] = "run"
+			Record["Run"] = Number
+			if Record["Annotations"] is not None:
+				CurrentRunNumber = AnnotationValue(ParseAnnotations([""] + Record["Annotations"].split("\t"), 0)[0], "CurrentRunNumber")
+				if CurrentRunNumber is not None:
+					Record["CurrentRunNumber"] = int(CurrentRunNumber)
+			Log(Record)
+			print("Finished run " + str(Number) + " of " + str(len(Runs)) + " in " + format(Record["TotalSeconds"], ".2f") + " seconds.")
+		Record = PerformCommands(Vensim, Postamble, RunName)
+		Record["Part"] = "postamble"
+		Log(Record)
+
+
+# Summary Report
+# --------------
+# Percentiles use the nearest-rank method: the p-th percentile is the smallest measurement
+# that is at least as large as p percent of the measurements.
+def Percentile(SortedValues, Percent):
+	if not SortedValues:
+		return 0
+	Rank = max(1, int(-(-Percent * len(SortedValues) // 100)))
+	return SortedValues[Rank - 1]
+
+def ReadTimingLog(LogFileName):
+	with open(LogFileName, 'r') as LogFile:
+		return [json.loads(Line) for Line in LogFile if Line.strip()]
+
+def SummarizeTimings(Records):
+
+	Runs = [Record for Record in Records if Record["Part"] == "run"]
+	TotalSeconds = sum(Record["TotalSeconds"] for Record in Records)
+	Lines = []
+	Lines.append("Runs: " + str(len(Runs)))
+	Lines.append("Total time: " + format(TotalSeconds, ".1f") + " seconds (of which " + format(sum(Record["TotalSeconds"] for Record in Records if Record["Part"] != "run"), ".1f") + " before and after the runs)")
+	if not Runs:
+		return Lines
+	RunSeconds = sum(Record["TotalSeconds"] for Record in Runs)
+	Lines.append("Throughput: " + format(len(Runs) / TotalSeconds * 3600 if TotalSeconds else 0, ".0f") + " runs per hour")
+	Lines.append("")
+
+	Lines.append("Seconds per run\tMean\tp50\tp90\tp99\tMax\tShare of run time")
+	for Phase in ("setval", "run", "vdf2tab", "delete", "other", "total"):
+		if Phase == "total":
+			Values = sorted(Record["TotalSeconds"] for Record in Runs)
+		else:
+			Values = sorted(Record["Seconds"].get(Phase, 0) for Record in Runs)
+		if not any(Values):
+			continue
+		Lines.append(Phase + "\t" + "\t".join(format(Value, ".3f") for Value in [sum(Values) / len(Values), Percentile(Values, 50), Percentile(Values, 90), Percentile(Values, 99), Values[-1]])
+			+ "\t" + format(sum(Values) / RunSeconds * 100 if RunSeconds else 0, ".1f") + "%")
+	Lines.append("")
+
+	VDFSizes = [Record["VDFBytes"] for Record in Runs]
+	Lines.append("VDF file size: mean " + format(sum(VDFSizes) / len(VDFSizes) / 10**6, ".2f") + " MB, largest " + format(max(VDFSizes) / 10**6, ".2f") + " MB")
+	Added = [Record["ResultsBytesAdded"] for Record in Runs]
+	Lines.append("Results written: " + format(sum(Added) / 10**6, ".2f") + " MB in total, mean " + format(sum(Added) / len(Added) / 10**3, ".1f") + " KB per run")
+	PeakMemory = [Record["PeakMemoryBytes"] for Record in Runs if Record["PeakMemoryBytes"] is not None]
+	if PeakMemory:
+		Lines.append("Peak memory use: " + format(max(PeakMemory) / 10**6, ".0f") + " MB (" + format(PeakMemory[0] / 10**6, ".0f") + " MB after the first run)")
+	Lines.append("")
+
+	Lines.append("Slowest runs:")
+	Lines.append("Run\tCurrentRunNumber\tSeconds\tSimulation seconds\tSettings")
+	for Record in sorted(Runs, key=lambda Record: -Record["TotalSeconds"])[:SlowestRunsToReport]:
+		Settings = ", ".join(Setting + "=" + Value for Setting, Value in Record["Settings"].items())
+		Lines.append(str(Record["Run"]) + "\t" + str(Record.get("CurrentRunNumber", "")) + "\t" + format(Record["TotalSeconds"], ".3f")
+			+ "\t" + format(Record["Seconds"].get("run", 0), ".3f") + "\t" + Settings)
+	return Lines
+
+
+if __name__ == "__main__":
+	if not SummarizeOnly:
+		if Executor == "VensimDLL":
+			Vensim = VensimExecutors.VensimDLL()
+		elif Executor == "StandIn":
+			Vensim = VensimExecutors.StandIn()
+		else:
+			raise ValueError("Unknown Executor setting: " + Executor + ".  Use \"VensimDLL\" or \"StandIn\".")
+		PerformBatch(Vensim, CommandScript, TimingLogFile)
+
+	Summary = SummarizeTimings(ReadTimingLog(TimingLogFile))
+	with open(TimingSummaryFile, 'w') as SummaryFile:
+		SummaryFile.write("\n".join(Summary) + "\n")
+	print("\n".join(Summary))
@@ -0,0 +1,305 @@
+# ScenarioLibrary.py
+#
+# This is a Python module and script for working with settings files (.cin), such as
+# Scenario_Example.cin.  A settings file is a list of policy lever settings, one per line:
+#
+#	Fuel Price Deregulation[natural gas] = 0.5
+#
+# The module reads settings files into "scenarios", checks them against the model (using the
+# index built by ModelIndex.py), writes them in a canonical form, compares them, and writes
+# the commands that apply a scenario to a run.  Run it by itself to check a base scenario and
+# a list of scenarios, list how each scenario differs from the base, and write a Vensim
+# command script with one run for each scenario.
+#
+# Applying Scenarios
+# ------------------
+# Settings made with READCIN and SETVAL only last for the next run, so a script that runs a
+# scenario many times (with other settings changed in each run, as the carbon cap to tax
+# script does) normally repeats "SIMULATE>READCIN|" for every run, and Vensim rereads the file
+# each time.  Instead, the scenario can be read once, here, and "inlined": each run is given
+# one SETVAL for each of its settings that differs from the model's own value (settings equal
+# to the model's value change nothing, so they are left out).  Without inlining, each run reads
+# the base scenario and is given SETVALs only for the settings that differ from it.  Either way,
+# a setting is only written once per run, even if the scenario and the run both set it.
+#
+# Scenarios
+# ---------
+# A scenario is a dictionary with the entries:
+#	"File": the settings file it was read from
+#	"Settings": a dictionary mapping each setting's key (see SettingKey below) to a
+#		(Reference, Value) pair, where Reference is the lever name with its subscripts, as it
+#		is written in the file, and Value is a float, in the order they appear in the file
+#	"Defaults": a dictionary mapping setting keys to the model's own values of those settings
+#		(a setting whose value in the model could not be determined is left out)
+
+
+# File Names
+# ----------
+ModelFile = "EPS.mdl" # The name of the Vensim model file (typically with .mdl or .vpm extension)
+BaseScenarioFile = "Scenario_BAU.cin" # Every run starts from this scenario (use "" for the model's own settings)
+ScenarioFiles = ["Scenario_Example.cin", "Scenario_MEIMTarget.cin"] # Each scenario's settings are applied on top of the base scenario in one run
+OutputScript = "GeneratedScenarioScript.cmd" # The desired filename of the Vensim command script to be generated
+RunResultsFile = "ScenarioResults.tsv" # The desired filename for TSV file containing model run results
+OutputVarsFile = "OutputVarsToExport.lst" # The name of the file containing a list of variables to be included in the RunResultsFile
+ScenarioDiffFile = "ScenarioDifferences.tsv" # Each setting that differs between the base scenario and any scenario
+CanonicalFolder = "" # If not blank, a canonical copy of each settings file is written to this folder
+
+
+# Other Settings
+# --------------
+InlineScenarios = True # If True, settings are written as SETVALs, so no settings file is read during the runs
+PolicySchedule = 1 # The number of the policy implementation schedule file to be used (in InputData/plcy-schd/FoPITY)
+RunName = "MostRecentRun" # The desired name for all runs performed.  Used as the filename for the VDF files that Vensim creates.
+
+
+import os
+import re
+import ModelIndex
+import EPSScriptGenerators
+
+
+# Setting Keys
+# ------------
+# Vensim ignores case, spacing, and underscores in names, so "Fuel Price Deregulation[natural
+# gas]" and "fuel_price_deregulation[ Natural Gas ]" are the same setting.  The key of a setting
+# is its canonical name, with its canonical subscripts in brackets.
+def SettingKey(Reference):
+	Name, Subscripts = ModelIndex.SplitSubscripts(Reference)
+	if not Subscripts:
+		return ModelIndex.CanonicalName(Name)
+	return ModelIndex.CanonicalName(Name) + "[" + ",".join(ModelIndex.CanonicalName(Subscript) for Subscript in Subscripts) + "]"
+
+# This writes a value the way the model does: "750" rather than "750.0".
+def FormatValue(Value):
+	return format(Value, ".15g")
+
+
+# Reading Settings Files
+# ----------------------
+# This reads a settings file and returns its settings, raising a ValueError for lines that
+# aren't settings, values that aren't numbers, and settings given twice with different values.
+# (A setting given twice with the same value is kept once.)
+def ReadSettings(FileName):
+	Settings = {}
+	with open(FileName, 'r', encoding='utf-8', errors='replace') as SettingsFile:
+		for LineNumber, Line in enumerate(SettingsFile, start=1):
+			if not Line.strip():
+				continue
+			Reference, Separator, Value = Line.rpartition("=")
+			if not Separator or not Reference.strip():
+				raise ValueError(FileName + ", line " + str(LineNumber) + ": expected a setting such as \"Lever Name[subscript] = 1\", not \"" + Line.strip() + "\".")
+			Name, Subscripts = ModelIndex.SplitSubscripts(Reference)
+			Reference = " ".join(Name.split()) + ("[" + ",".join(Subscripts) + "]" if Subscripts else "")
+			try:
+				Value = float(Value)
+			except ValueError:
+				raise ValueError(FileName + ", line " + str(LineNumber) + ": the value of " + Reference + " (\"" + Value.strip() + "\") is not a number.")
+			Key = SettingKey(Reference)
+			if Key in Settings and Settings[Key][1] != Value:
+				raise ValueError(FileName + ", line " + str(LineNumber) + ": " + Reference + " is set to " + FormatValue(Value) + ", but it was already set to " + FormatValue(Settings[Key][1]) + ".")
+			Settings.setdefault(Key, (Reference, Value))
+	return Settings
+
+# A blank file name gives a scenario with no settings (the model's own settings).
+def ReadScenario(FileName, Index):
+	Settings = ReadSettings(FileName) if FileName else {}
+	return {"File": FileName, "Settings": Settings, "Defaults": ModelDefaults(Index, [Reference for Reference, Value in Settings.values()])}
+
+
+# Checking Scenarios
+# ------------------
+# This returns a list of problems with a scenario's settings: names that aren't variables in
+# the model, variables that aren't levers (constants typed into the model), and subscripts
+# that don't match the lever's subscripts.
+def CheckScenario(Scenario, Index):
+	Problems = []
+	for Reference, Value in Scenario["Settings"].values():
+		Variable = ModelIndex.FindVariable(Index, Reference)
+		if Variable is None:
+			Problems.append(Scenario["File"] + ": " + Reference + " is not a variable in the model.")
+		elif Variable["Kind"] != "constant":
+			Problems.append(Scenario["File"] + ": " + Reference + " is not a lever (its kind is \"" + Variable["Kind"] + "\"), so it can't be set.")
+		elif EquationPosition(Index, Variable, ModelIndex.SplitSubscripts(Reference)[1]) is None:
+			Problems.append(Scenario["File"] + ": the subscripts of " + Reference + " don't match the lever's subscripts (" + ", ".join("[" + ",".join(Equation["Subscripts"]) + "]" for Equation in Variable["Equations"]) + ").")
+	return Problems
+
+
+# The Model's Own Values
+# ----------------------
+# A lever is defined by numbers typed into the model, with a list of values for a subscripted
+# lever: a row of values separated by commas for each element of its first subscript, with
+# rows separated by semicolons (and {comments} naming the elements).  This finds the equation
+# that defines the given subscript elements, and the position of their value within it, or
+# None if there isn't one.  An equation may be written for a whole subscript range or for one
+# element; only ranges add to the position.
+def EquationPosition(Index, Variable, Subscripts):
+	for Equation in Variable["Equations"]:
+		if len(Equation["Subscripts"]) != len(Subscripts):
+			continue
+		Position = 0
+		for EquationSubscript, Subscript in zip(Equation["Subscripts"], Subscripts):
+			Range = Index["Subscripts"].get(ModelIndex.CanonicalName(EquationSubscript.rstrip("!")))
+			if Range is None:
+				if ModelIndex.CanonicalName(EquationSubscript) != ModelIndex.CanonicalName(Subscript):
+					break
+				continue
+			Elements = [ModelIndex.CanonicalName(Element) for Element in Range["Elements"]]
+			if ModelIndex.CanonicalName(Subscript) not in Elements:
+				break
+			Position = Position * len(Elements) + Elements.index(ModelIndex.CanonicalName(Subscript))
+		else:
+			return Equation, Position
+	return None
+
+def ModelDefault(Index, Reference):
+	Variable = ModelIndex.FindVariable(Index, Reference)
+	if Variable is None or Variable["Kind"] != "constant":
+		return None
+	Found = EquationPosition(Index, Variable, ModelIndex.SplitSubscripts(Reference)[1])
+	if Found is None:
+		return None
+	Equation, Position = Found
+	Values = [Value for Value in re.sub(r'\{[^}]*\}', " ", Equation["Expression"]).replace(";", ",").split(",") if Value.strip()]
+	if len(Values) != ModelIndex.EquationSize(Index, Equation) or Position >= len(Values):
+		return None
+	return float(Values[Position])
+
+# This returns a dictionary mapping the key of each reference to the model's own value, leaving
+# out references whose value could not be determined.
+def ModelDefaults(Index, References):
+	Defaults = {}
+	for Reference in References:
+		Default = ModelDefault(Index, Reference)
+		if Default is not None:
+			Defaults[SettingKey(Reference)] = Default
+	return Defaults
+
+
+# Canonical Form and Differences
+# ------------------------------
+# The canonical form of a scenario lists its settings sorted by key, with each value written
+# as the model writes it, and leaves out settings equal to the model's own values.  Two
+# settings files that have the same effect have the same canonical form.
+def CanonicalSettings(Scenario):
+	return [(Reference, Value) for Key, (Reference, Value) in sorted(Scenario["Settings"].items()) if Scenario["Defaults"].get(Key) != Value]
+
+def WriteCanonicalScenario(Scenario, FileName):
+	with open(FileName, 'w') as SettingsFile:
+		for Reference, Value in CanonicalSettings(Scenario):
+			SettingsFile.write(Reference + " = " + FormatValue(Value) + "\n")
+
+# This returns the value of a setting in a scenario: its own setting, or else the model's value
+# (None if neither is known).
+def EffectiveValue(Scenario, Key):
+	if Key in Scenario["Settings"]:
+		return Scenario["Settings"][Key][1]
+	return Scenario["Defaults"].get(Key)
+
+# This returns a list of (Reference, Values) pairs, one for each setting whose value differs
+# among the scenarios, with Values listing the setting's value in each scenario.
+def DiffScenarios(Scenarios, Index):
+	References = {}
+	for Scenario in Scenarios:
+		for Key, (Reference, Value) in Scenario["Settings"].items():
+			References.setdefault(Key, Reference)
+	Defaults = ModelDefaults(Index, References.values())
+	Differences = []
+	for Key in sorted(References):
+		Values = [Scenario["Settings"][Key][1] if Key in Scenario["Settings"] else Defaults.get(Key) for Scenario in Scenarios]
+		if len(set(Values)) > 1:
+			Differences.append((References[Key], Values))
+	return Differences
+
+
+# Applying Scenarios to Runs
+# --------------------------
+# This returns the commands that give one run the settings of the Scenario with the Overrides
+# applied, where Overrides is a list of (Reference, Value) pairs (whose model values must be
+# in the scenario's Defaults for them to be left out when unneeded; see OverrideDefaults).
+# With Inline, the scenario's settings are written as SETVALs; otherwise, the run reads the
+# scenario's file and only the overrides that change its settings are written.
+def SettingCommands(Scenario, Overrides, Inline=True):
+	Settings = {} if not Inline else dict(Scenario["Settings"])
+	for Reference, Value in Overrides:
+		Key = SettingKey(Reference)
+		if Inline or EffectiveValue(Scenario, Key) != float(Value):
+			Settings[Key] = (Reference, float(Value))
+		else:
+			Settings.pop(Key, None)
+	Text = "" if Inline or not Scenario["File"] else "SIMULATE>READCIN|" + Scenario["File"] + "\n"
+	for Key, (Reference, Value) in Settings.items():
+		if not Inline or Scenario["Defaults"].get(Key) != Value:
+			Text += EPSScriptGenerators.SetValCommand(Reference, FormatValue(Value))
+	return Text
+
+# This adds the model's values of levers that runs will override to a scenario's Defaults.
+def OverrideDefaults(Scenario, Index, References):
+	Scenario["Defaults"].update(ModelDefaults(Index, References))
+	return Scenario
+
+# This reads a scenario to be applied to many runs (as with the ComplementaryPoliciesFile in
+# CreateCarbonCapToTaxScript.py), checking it against the model, and raises a ValueError
+# listing any problems.  OverriddenLevers lists the levers the runs will set themselves.
+def LoadScenario(FileName, ModelFile="EPS.mdl", OverriddenLevers=()):
+	if FileName and not os.path.exists(FileName):
+		raise ValueError("Error: The settings file " + FileName + " does not exist.")
+	Index = ModelIndex.LoadModelIndex(ModelFile)
+	Scenario = ReadScenario(FileName, Index)
+	Problems = CheckScenario(Scenario, Index)
+	if Problems:
+		raise ValueError("Error: " + "  ".join(Problems))
+	return OverrideDefaults(Scenario, Index, OverriddenLevers)
+
+
+# Scenario Script
+# ---------------
+# One run for each scenario, starting from the base scenario, with the results labeled with
+# the scenario's file name.  The base scenario is read once, here.
+def ScenarioScript(Base, Scenarios, Inline=True, ModelFile="EPS.mdl", RunName="MostRecentRun", RunResultsFile="ScenarioResults.tsv", OutputVarsFile="OutputVarsToExport.lst", PolicySchedule=1):
+	yield EPSScriptGenerators.ScriptHeader(ModelFile, RunName)
+	for RunNumber, Scenario in enumerate(Scenarios):
+		Overrides = [(Reference, Value) for Reference, Value in Scenario["Settings"].values()] + [("Policy Implementation Schedule Selector", PolicySchedule)]
+		yield (SettingCommands(Base, Overrides, Inline) + "MENU>RUN|O\n"
+			+ EPSScriptGenerators.VDF2TABCommand(RunName, RunResultsFile, OutputVarsFile, RunNumber == 0) + "Scenario=" + (Scenario["File"] or "BAU") + "\n"
+			+ EPSScriptGenerators.DeleteCommand(RunName))
+
+
+if __name__ == "__main__":
+
+	Index = ModelIndex.LoadModelIndex(ModelFile)
+	try:
+		Base = ReadScenario(BaseScenarioFile, Index)
+		Scenarios = [ReadScenario(ScenarioFile, Index) for ScenarioFile in ScenarioFiles]
+	except ValueError as Problem:
+		Problems = [str(Problem)]
+	else:
+		Problems = [Problem for Scenario in [Base] + Scenarios for Problem in CheckScenario(Scenario, Index)]
+
+	# Give error and exit if any settings file has problems
+	if Problems:
+		f = open(OutputScript, 'w')
+		ErrorMessage = "Error: " + "  ".join(Problems)
+		f.write(ErrorMessage)
+		f.close()
+		import sys
+		sys.exit(ErrorMessage)
+
+	# The scenarios' own Defaults only cover their own settings, so the base scenario is given
+	# the model's values of every setting any scenario changes.
+	OverrideDefaults(Base, Index, [Reference for Scenario in Scenarios for Reference, Value in Scenario["Settings"].values()] + ["Policy Implementation Schedule Selector"])
+
+	with open(ScenarioDiffFile, 'w') as DiffFile:
+		DiffFile.write("Setting\t" + "\t".join(Scenario["File"] or "(model settings)" for Scenario in [Base] + Scenarios) + "\n")
+		for Reference, Values in DiffScenarios([Base] + Scenarios, Index):
+			DiffFile.write(Reference + "".join("\t" + ("" if Value is None else FormatValue(Value)) for Value in Values) + "\n")
+
+	if CanonicalFolder:
+		os.makedirs(CanonicalFolder, exist_ok=True)
+		for Scenario in [Base] + Scenarios:
+			if Scenario["File"]:
+				WriteCanonicalScenario(Scenario, os.path.join(CanonicalFolder, os.path.basename(Scenario["File"])))
+
+	f = open(OutputScript, 'w')
+	f.writelines(ScenarioScript(Base, Scenarios, InlineScenarios, ModelFile, RunName, RunResultsFile, OutputVarsFile, PolicySchedule))
+	f.close()
+	print(str(len(Scenarios)) + " runs written to " + OutputScript + ".  The differences between the scenarios are listed in " + ScenarioDiffFile + ".")
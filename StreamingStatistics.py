@@ -0,0 +1,345 @@
+# StreamingStatistics.py
+#
+# This is a Python module used by the scripts that summarize many model runs (such as
+# MonteCarloInputs.py).  It is not meant to be run by itself.  The classes here take values
+# one at a time and keep only a fixed amount of information, so they can summarize results
+# from any number of runs without holding the runs in memory.
+#
+# Percentiles
+# -----------
+# Percentiles are estimated with the P-squared algorithm (Jain and Chlamtac, 1985), which
+# keeps five "markers" for each percentile: the smallest and largest values seen, the
+# estimated percentile, and estimates halfway to it on each side.  As each value arrives,
+# the markers are moved toward the positions they should have, adjusting their heights along
+# a parabola through their neighbors.  The estimates are typically within a small fraction of
+# the spread of the values for the number of runs we use (hundreds or more).  With fewer than
+# five values, the exact percentile is returned.  Values that aren't numbers (NaN) are skipped.
+
+
+import math
+
+
+# Exact percentiles interpolate linearly between the sorted values, as numpy and Excel's
+# PERCENTILE.INC do.
+def ExactPercentile(SortedValues, Percent):
+	if not SortedValues:
+		return float("nan")
+	Position = (len(SortedValues) - 1) * Percent / 100
+	Lower = int(math.floor(Position))
+	Upper = min(Lower + 1, len(SortedValues) - 1)
+	return SortedValues[Lower] + (SortedValues[Upper] - SortedValues[Lower]) * (Position - Lower)
+
+
+class P2Percentile:
+
+	def __init__(self, Percent):
+		self.Percent = Percent
+		Fraction = Percent / 100
+		self.Heights = []
+		self.Positions = [1, 2, 3, 4, 5]
+		self.DesiredPositions = [1, 1 + 2 * Fraction, 1 + 4 * Fraction, 3 + 2 * Fraction, 5]
+		self.Increments = [0, Fraction / 2, Fraction, (1 + Fraction) / 2, 1]
+		self.Count = 0
+
+	def Add(self, Value):
+		if Value != Value:
+			return
+		self.Count += 1
+		Heights = self.Heights
+		if self.Count <= 5:
+			Heights.append(Value)
+			Heights.sort()
+			return
+
+		# Find the cell the value falls in, extending the range if needed.
+		if Value < Heights[0]:
+			Heights[0] = Value
+			Cell = 0
+		elif Value >= Heights[4]:
+			Heights[4] = Value
+			Cell = 3
+		else:
+			Cell = 0
+			while Value >= Heights[Cell + 1]:
+				Cell += 1
+		for Marker in range(Cell + 1, 5):
+			self.Positions[Marker] += 1
+		for Marker in range(5):
+			self.DesiredPositions[Marker] += self.Increments[Marker]
+
+		# Move the middle markers that are at least one position away from where they should be.
+		Positions = self.Positions
+		for Marker in (1, 2, 3):
+			Offset = self.DesiredPositions[Marker] - Positions[Marker]
+			if (Offset >= 1 and Positions[Marker + 1] - Positions[Marker] > 1) or (Offset <= -1 and Positions[Marker - 1] - Positions[Marker] < -1):
+				Step = 1 if Offset > 0 else -1
+				Height = self.Parabolic(Marker, Step)
+				if not Heights[Marker - 1] < Height < Heights[Marker + 1]:
+					Height = Heights[Marker] + Step * (Heights[Marker + Step] - Heights[Marker]) / (Positions[Marker + Step] - Positions[Marker])
+				Heights[Marker] = Height
+				Positions[Marker] += Step
+
+	def Parabolic(self, Marker, Step):
+		Heights = self.Heights
+		Positions = self.Positions
+		return Heights[Marker] + Step / (Positions[Marker + 1] - Positions[Marker - 1]) * (
+			(Positions[Marker] - Positions[Marker - 1] + Step) * (Heights[Marker + 1] - Heights[Marker]) / (Positions[Marker + 1] - Positions[Marker])
+			+ (Positions[Marker + 1] - Positions[Marker] - Step) * (Heights[Marker] - Heights[Marker - 1]) / (Positions[Marker] - Positions[Marker - 1]))
+
+	def Value(self):
+		if self.Count <= 5:
+			return ExactPercentile(self.Heights, self.Percent)
+		return self.Heights[2]
+
+
+# A series of values (such as one variable's values for each simulated year) is summarized by
+# a set of percentiles and the mean of the values at each position.
+class SeriesSummary:
+
+	def __init__(self, Length, Percents):
+		self.Percents = list(Percents)
+		self.Estimators = [[P2Percentile(Percent) for Percent in self.Percents] for Position in range(Length)]
+		self.Sums = [0.0] * Length
+		self.Counts = [0] * Length
+
+	def Add(self, Values):
+		for Position, Value in enumerate(Values):
+			if Value != Value:
+				continue
+			for Estimator in self.Estimators[Position]:
+				Estimator.Add(Value)
+			self.Sums[Position] += Value
+			self.Counts[Position] += 1
+
+	def Percentile(self, Percent):
+		Index = self.Percents.index(Percent)
+		return [Estimators[Index].Value() for Estimators in self.Estimators]
+
+	def Mean(self):
+		return [Sum / Count if Count else float("nan") for Sum, Count in zip(self.Sums, self.Counts)]
+
+
+# Mergeable Summaries
+# -------------------
+# The P-squared estimates above can't be combined, so a file split into pieces and summarized
+# in several processes (as AggregateRunResults.py does) uses the summaries below instead.  Each
+# can be merged with another summary of the same kind, giving the summary of all the values
+# either has seen.  Values may be added one at a time or in lists, which is much faster.
+#
+# Moments keeps the count, mean, and sum of squared differences from the mean (Welford's
+# method, which avoids the loss of precision of summing squares), and the smallest and largest
+# values.  Two are merged with the formulas of Chan, Golub, and LeVeque (1979), which are also
+# used to add a list of values (as a summary of the list).
+class Moments:
+
+	def __init__(self):
+		self.Count = 0
+		self.Mean = 0.0
+		self.SquaredDifferences = 0.0
+		self.Minimum = float("nan")
+		self.Maximum = float("nan")
+
+	def Add(self, Value):
+		if Value != Value:
+			return
+		self.Count += 1
+		Difference = Value - self.Mean
+		self.Mean += Difference / self.Count
+		self.SquaredDifferences += Difference * (Value - self.Mean)
+		if self.Count == 1 or Value < self.Minimum:
+			self.Minimum = Value
+		if self.Count == 1 or Value > self.Maximum:
+			self.Maximum = Value
+
+	def AddValues(self, Values):
+		Values = [Value for Value in Values if Value == Value]
+		if not Values:
+			return
+		Summary = Moments()
+		Summary.Count = len(Values)
+		Summary.Mean = math.fsum(Values) / len(Values)
+		Summary.SquaredDifferences = math.fsum((Value - Summary.Mean) ** 2 for Value in Values)
+		Summary.Minimum = min(Values)
+		Summary.Maximum = max(Values)
+		self.Merge(Summary)
+
+	def Merge(self, Other):
+		if Other.Count == 0:
+			return
+		if self.Count == 0:
+			self.Count, self.Mean, self.SquaredDifferences, self.Minimum, self.Maximum = Other.Count, Other.Mean, Other.SquaredDifferences, Other.Minimum, Other.Maximum
+			return
+		Count = self.Count + Other.Count
+		Difference = Other.Mean - self.Mean
+		self.Mean += Difference * Other.Count / Count
+		self.SquaredDifferences += Other.SquaredDifferences + Difference * Difference * self.Count * Other.Count / Count
+		self.Count = Count
+		self.Minimum = min(self.Minimum, Other.Minimum)
+		self.Maximum = max(self.Maximum, Other.Maximum)
+
+	# The sample standard deviation (NaN for fewer than two values)
+	def StandardDeviation(self):
+		if self.Count < 2:
+			return float("nan")
+		return math.sqrt(max(self.SquaredDifferences, 0) / (self.Count - 1))
+
+
+# Percentiles are estimated with a t-digest (Dunning and Ertl, 2019), which summarizes the
+# values as a sorted list of clusters ("centroids"), each with a mean and a number of values.
+# Clusters near the middle of the distribution may hold many values, but clusters near the
+# ends hold few, so extreme percentiles stay accurate.  The number of clusters is limited by
+# the Compression (about half of it, at most), whatever the number of values.  New values
+# are collected in a buffer and merged into the clusters when it fills.  Two digests are
+# merged by merging their clusters.  Until there are more values than the Compression, each
+# value has its own cluster and the percentiles are exact (as in ExactPercentile).
+class TDigest:
+
+	def __init__(self, Compression=100):
+		self.Compression = Compression
+		self.Means = []
+		self.Weights = []
+		self.Buffer = []
+		self.Count = 0
+		self.Minimum = float("nan")
+		self.Maximum = float("nan")
+
+	def Add(self, Value):
+		if Value == Value:
+			self.AddValues([Value])
+
+	def AddValues(self, Values):
+		Values = [Value for Value in Values if Value == Value]
+		if not Values:
+			return
+		if self.Count == 0 or min(Values) < self.Minimum:
+			self.Minimum = min(Values)
+		if self.Count == 0 or max(Values) > self.Maximum:
+			self.Maximum = max(Values)
+		self.Count += len(Values)
+		self.Buffer.extend(Values)
+		if len(self.Buffer) >= 5 * self.Compression:
+			self.Compress()
+
+	def Merge(self, Other):
+		if Other.Count == 0:
+			return
+		if self.Count == 0 or Other.Minimum < self.Minimum:
+			self.Minimum = Other.Minimum
+		if self.Count == 0 or Other.Maximum > self.Maximum:
+			self.Maximum = Other.Maximum
+		self.Count += Other.Count
+		self.Buffer.extend(Other.Buffer)
+		self.Compress(list(zip(Other.Means, Other.Weights)))
+
+	# The scale function k(q) = Compression / (2 pi) * asin(2q - 1) limits each cluster to the
+	# values between q and the q for which k is one larger.
+	def Compress(self, OtherClusters=()):
+		if not self.Buffer and not OtherClusters:
+			return
+		Points = sorted(list(zip(self.Means, self.Weights)) + list(OtherClusters) + [(Value, 1) for Value in self.Buffer])
+		self.Buffer = []
+		Total = self.Count
+		if Total <= self.Compression:
+			self.Means = [Mean for Mean, Weight in Points]
+			self.Weights = [Weight for Mean, Weight in Points]
+			return
+		Means = [Points[0][0]]
+		Weights = [Points[0][1]]
+		Cumulative = 0
+		Limit = self.QuantileLimit(0, Total)
+		for Mean, Weight in Points[1:]:
+			if Cumulative + Weights[-1] + Weight <= Limit:
+				Weights[-1] += Weight
+				Means[-1] += (Mean - Means[-1]) * Weight / Weights[-1]
+			else:
+				Cumulative += Weights[-1]
+				Limit = self.QuantileLimit(Cumulative, Total)
+				Means.append(Mean)
+				Weights.append(Weight)
+		self.Means = Means
+		self.Weights = Weights
+	# This returns the number of values (counting from the smallest) a cluster starting after
+	# Cumulative values may reach.
+	def QuantileLimit(self, Cumulative, Total):
+		Scale = math.asin(2 * Cumulative / Total - 1) * self.Compression / (2 * math.pi) + 1
+		if Scale >= self.Compression / 4:
+			return Total
+		return Total * (math.sin(Scale * 2 * math.pi / self.Compression) + 1) / 2
+
+	# Each cluster's values are taken to be spread evenly around its mean, so the values are
+	# numbered from 0 (the smallest) as in ExactPercentile, and each cluster's mean is placed at
+	# the middle of its values' numbers.  Percentiles are interpolated between the means of
+	# neighboring clusters (and the smallest and largest values at the ends, which are exact).
+	def Percentile(self, Percent):
+		self.Compress()
+		if len(self.Means) == self.Count:
+			return ExactPercentile(self.Means, Percent)
+		Position = (self.Count - 1) * Percent / 100
+		if Position <= 0:
+			return self.Minimum
+		Previous, PreviousMean = 0, self.Minimum
+		Cumulative = 0
+		for Mean, Weight in zip(self.Means, self.Weights):
+			Center = Cumulative + (Weight - 1) / 2
+			if Position < Center:
+				return PreviousMean + (Mean - PreviousMean) * (Position - Previous) / (Center - Previous)
+			Previous, PreviousMean = Center, Mean
+			Cumulative += Weight
+		if Previous >= self.Count - 1:
+			return self.Maximum
+		return PreviousMean + (self.Maximum - PreviousMean) * (Position - Previous) / (self.Count - 1 - Previous)
+
+
+# A mergeable summary of a series of values (such as one variable's values for each simulated
+# year), with the moments and a t-digest of the values at each position.  Series are kept in a
+# buffer and added to the summaries of each position in lists.
+class MergeableSeriesSummary:
+
+	def __init__(self, Length, Compression=100):
+		self.Moments = [Moments() for Position in range(Length)]
+		self.Digests = [TDigest(Compression) for Position in range(Length)]
+		self.Buffer = []
+		self.BufferSize = 5 * Compression
+
+	# The list of Values is kept, not copied, so it must not be changed afterward.
+	def Add(self, Values):
+		self.Buffer.append(Values)
+		if len(self.Buffer) >= self.BufferSize:
+			self.Flush()
+
+	def Flush(self):
+		for Position, Values in enumerate(zip(*self.Buffer)):
+			self.Moments[Position].AddValues(Values)
+			self.Digests[Position].AddValues(Values)
+		self.Buffer = []
+
+	def Merge(self, Other):
+		self.Flush()
+		Other.Flush()
+		for Position in range(len(self.Moments)):
+			self.Moments[Position].Merge(Other.Moments[Position])
+			self.Digests[Position].Merge(Other.Digests[Position])
+
+	def Percentile(self, Percent):
+		self.Flush()
+		return [Digest.Percentile(Percent) for Digest in self.Digests]
+
+	def Count(self):
+		self.Flush()
+		return [Summary.Count for Summary in self.Moments]
+
+	def Mean(self):
+		self.Flush()
+		return [Summary.Mean if Summary.Count else float("nan") for Summary in self.Moments]
+
+	def StandardDeviation(self):
+		self.Flush()
+		return [Summary.StandardDeviation() for Summary in self.Moments]
+
+	def Minimum(self):
+		self.Flush()
+		return [Summary.Minimum for Summary in self.Moments]
+
+	def Maximum(self):
+		self.Flush()
+		return [Summary.Maximum for Summary in self.Moments]
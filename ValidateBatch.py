@@ -0,0 +1,330 @@
+# ValidateBatch.py
+#
+# This is a Python module and script that checks a Vensim command script before it is run,
+# so that mistakes in the policy lists and settings of the generator scripts are found in
+# seconds rather than hours into a batch.  It reads the commands of the script and checks
+# every name and file they refer to:
+#	- the model file loaded by SPECIAL>LOADMODEL exists
+#	- each lever set by SETVAL is a lever in the model, and its subscripts (such as
+#	  "[cooling and ventilation,urban residential]") match the lever's subscripts
+#	- each settings file read by READCIN exists, and its settings are levers in the model
+#	  (as ScenarioLibrary.py checks them)
+#	- the policy implementation schedule file selected by each run exists
+#	- each variable list used by VDF2TAB or SAVELIST exists, and its variables (with their
+#	  subscripts) are in the model
+#	- the folder of each results file exists
+# The names are checked against the index of the model built by ModelIndex.py, so the model
+# must be a .mdl file for them to be checked.
+#
+# It then estimates the size of the batch: the number of runs, the time they will take, and
+# the disk space they will use, and compares these with the budgets below.  The time is
+# estimated from the per-run timings recorded by RunVensimBatch.py (in its TimingLogFile), so
+# it is most accurate when the timings come from an earlier batch of the same kind.  The disk
+# space is estimated as PlanSavelist.py estimates it: the results files, plus the .vdf file of
+# each run name (each run overwrites the .vdf file of the previous run with the same name).
+#
+# Checking Scripts as They Are Generated
+# --------------------------------------
+# The generator scripts (such as CreateCombinationsScript.py) write their command scripts with
+# WriteCheckedScript, if their PreflightCheck setting is True, so each script is checked as it
+# is written.  If there are any problems, or the batch is over budget, they write the error to
+# the command script instead, as they do for other errors, so the batch fails at once rather
+# than part way through.  Run this script by itself to check existing command scripts and
+# report their estimated sizes.
+
+
+# File Names
+# ----------
+CommandScripts = ["GeneratedCombinationsScript.cmd", "GeneratedContributionTestScript.cmd", "GeneratedCarbonCapToTaxScript.cmd", "GeneratedDataLoggingScript.cmd"]
+	# Command scripts to check when this script is run by itself (any that don't exist are skipped)
+TimingLogFile = "BatchTimings.jsonl" # The log of per-run timings written by RunVensimBatch.py (see its TimingLogFile setting)
+
+
+# Budgets
+# -------
+# A command script that is estimated to exceed any of these is refused.  Use 0 for no limit.
+MaxRuns = 100000 # The largest number of model runs in one command script
+MaxHours = 72 # The longest estimated time to carry out one command script, in hours
+MaxDiskGB = 50 # The most disk space one command script may use (results files and .vdf files), in GB
+			   # A command script is also refused if the disk it writes to doesn't have enough free space for it.
+
+
+# Other Settings
+# --------------
+AssumedSecondsPerRun = 30 # The time each run is assumed to take if the TimingLogFile has no runs in it
+ParallelRuns = 1 # The number of runs carried out at once (for example, by VensimWorkerPool.py or DistributedBatch.py)
+MaxProblemsReported = 20 # At most this many problems are listed in an error
+
+
+import json
+import os
+import shutil
+import ModelIndex
+import PlanSavelist
+import ScenarioLibrary
+
+
+# Reading the Commands
+# --------------------
+# This returns the command name of a line (such as "SIMULATE>SETVAL") and its arguments, the
+# text after the first "|".
+def SplitCommand(Line):
+	Name, Separator, Arguments = Line.partition("|")
+	return Name.strip().upper(), Arguments.strip()
+
+# This reads the commands of a script and returns a summary of the batch: the names and files
+# it refers to and the numbers needed for the estimates.  Each .vdf file's SAVELIST is the one
+# in effect when its run is simulated (None if there is none, so the whole model is saved).
+# Levers holds the first setting of each lever (for checking its name), and NonNumericValues
+# every distinct setting of a lever that isn't a number, wherever it appears.  Exports counts
+# the VDF2TAB commands exporting each variable list.  The lines are read one at a time, and the
+# same levers and files are set again in every run, so the summary doesn't grow with the number
+# of runs.
+def ReadBatch(Lines):
+	Batch = {"ModelFiles": {}, "Levers": {}, "SettingsFiles": {}, "Schedules": {}, "VariableLists": {}, "ResultsFiles": {},
+		"Runs": 0, "Exports": {}, "NonNumericValues": {}, "RunNames": set(), "Savelists": set()}
+	Savelist = None
+	ScheduleSelector = ModelIndex.CanonicalName("Policy Implementation Schedule Selector")
+	LeverKeys = {} # The setting key of each lever reference, and whether it is the schedule selector
+	for Line in Lines:
+		Name, Arguments = SplitCommand(Line)
+		if Name == "SPECIAL>LOADMODEL":
+			Batch["ModelFiles"][Arguments.strip('"')] = None
+		elif Name == "SIMULATE>RUNNAME":
+			Batch["RunNames"].add(Arguments)
+		elif Name == "SIMULATE>SETVAL":
+			Reference, Separator, Value = Arguments.rpartition("=")
+			if Reference not in LeverKeys:
+				LeverKeys[Reference] = (ScenarioLibrary.SettingKey(Reference), ModelIndex.CanonicalName(Reference) == ScheduleSelector)
+			Key, IsSchedule = LeverKeys[Reference]
+			Batch["Levers"].setdefault(Key, (Reference.strip(), Value.strip()))
+			try:
+				float(Value)
+			except ValueError:
+				Batch["NonNumericValues"][(Reference.strip(), Value.strip())] = None
+			if IsSchedule:
+				Batch["Schedules"][Value.strip()] = None
+		elif Name == "SIMULATE>READCIN" and Arguments:
+			Batch["SettingsFiles"][Arguments] = None
+		elif Name == "SIMULATE>SAVELIST":
+			Savelist = Arguments or None
+			if Savelist:
+				Batch["VariableLists"][Savelist] = None
+		elif Name == "MENU>RUN":
+			Batch["Runs"] += 1
+			Batch["Savelists"].add(Savelist)
+		elif Name == "MENU>VDF2TAB":
+			Fields = Arguments.split("|")
+			Batch["ResultsFiles"][Fields[1]] = None
+			Batch["VariableLists"][Fields[2]] = None
+			Batch["Exports"][Fields[2]] = Batch["Exports"].get(Fields[2], 0) + 1
+	for Key in ("ModelFiles", "SettingsFiles", "Schedules", "VariableLists", "ResultsFiles"):
+		Batch[Key] = list(Batch[Key])
+	return Batch
+
+
+# Checking the References
+# -----------------------
+# A variable may be exported with subscripts that name one of its elements (or a whole range)
+# in each of its dimensions, such as "Output Total CO2e Emissions by Sector[electricity sector]".
+def SubscriptMatches(Index, EquationSubscript, Subscript):
+	if ModelIndex.CanonicalName(EquationSubscript.rstrip("!")) == ModelIndex.CanonicalName(Subscript.rstrip("!")):
+		return True
+	Range = Index["Subscripts"].get(ModelIndex.CanonicalName(EquationSubscript.rstrip("!")))
+	return Range is not None and ModelIndex.CanonicalName(Subscript) in [ModelIndex.CanonicalName(Element) for Element in Range["Elements"]]
+
+def CheckVariable(Index, Reference, Source):
+	Variable = ModelIndex.FindVariable(Index, Reference)
+	if Variable is None:
+		return [Source + ": " + Reference + " is not a variable in the model."]
+	Subscripts = ModelIndex.SplitSubscripts(Reference)[1]
+	if Subscripts and not any(len(Equation["Subscripts"]) == len(Subscripts) and all(SubscriptMatches(Index, EquationSubscript, Subscript)
+			for EquationSubscript, Subscript in zip(Equation["Subscripts"], Subscripts)) for Equation in Variable["Equations"]):
+		return [Source + ": the subscripts of " + Reference + " don't match the variable's subscripts (" + ", ".join("[" + ",".join(Equation["Subscripts"]) + "]" for Equation in Variable["Equations"]) + ")."]
+	return []
+
+# The files a script refers to are found relative to the folder the script is in, as Vensim
+# finds them.  This returns a list of problems; the model's names are only checked if Index
+# is given.
+def CheckBatch(Batch, ScriptFile, Index):
+
+	Folder = os.path.dirname(os.path.abspath(ScriptFile))
+	Problems = []
+	for ModelFile in Batch["ModelFiles"]:
+		if not os.path.exists(os.path.join(Folder, ModelFile)):
+			Problems.append(ScriptFile + ": the model file " + ModelFile + " does not exist.")
+	if not Batch["ModelFiles"]:
+		Problems.append(ScriptFile + ": the script does not load a model (with SPECIAL>LOADMODEL).  If it holds an error message instead, the script that generated it found a problem.")
+
+	# The levers set by SETVAL are checked as the settings of a scenario are.
+	for Reference, Value in Batch["NonNumericValues"]:
+		Problems.append(ScriptFile + ": the value of " + Reference + " (\"" + Value + "\") is not a number.")
+	if Index is not None:
+		Problems += ScenarioLibrary.CheckScenario({"File": ScriptFile, "Settings": Batch["Levers"]}, Index)
+
+	for SettingsFile in Batch["SettingsFiles"]:
+		if not os.path.exists(os.path.join(Folder, SettingsFile)):
+			Problems.append(ScriptFile + ": the settings file " + SettingsFile + " does not exist.")
+			continue
+		try:
+			Settings = ScenarioLibrary.ReadSettings(os.path.relpath(os.path.join(Folder, SettingsFile)))
+		except ValueError as Problem:
+			Problems.append(str(Problem))
+			continue
+		if Index is not None:
+			Problems += ScenarioLibrary.CheckScenario({"File": SettingsFile, "Settings": Settings}, Index)
+
+	for ModelFile in Batch["ModelFiles"][:1]:
+		for Schedule in Batch["Schedules"]:
+			ScheduleFile = os.path.join("InputData", "plcy-schd", "FoPITY", "FoPITY-" + Schedule + ".csv")
+			if not os.path.exists(os.path.join(Folder, os.path.dirname(ModelFile), ScheduleFile)):
+				Problems.append(ScriptFile + ": policy implementation schedule " + Schedule + " is selected, but " + ScheduleFile + " does not exist.")
+
+	for ListFile in Batch["VariableLists"]:
+		if not os.path.exists(os.path.join(Folder, ListFile)):
+			Problems.append(ScriptFile + ": the variable list " + ListFile + " does not exist.")
+		elif Index is not None:
+			for Reference in ModelIndex.ReadVariableList(os.path.join(Folder, ListFile)):
+				Problems += CheckVariable(Index, Reference, ListFile)
+
+	for ResultsFile in Batch["ResultsFiles"]:
+		if not os.path.isdir(os.path.join(Folder, os.path.dirname(ResultsFile))):
+			Problems.append(ScriptFile + ": the folder for the results file " + ResultsFile + " does not exist.")
+	return Problems
+
+
+# Estimating the Size of the Batch
+# --------------------------------
+# The time each run takes is the mean of the runs in the timing log, and the time spent before
+# and after the runs (loading the model) is added once.  This returns the estimated seconds
+# and a description of where the time per run came from.
+def EstimateSeconds(Runs, LogFileName):
+	Records = []
+	if os.path.exists(LogFileName):
+		with open(LogFileName, 'r') as LogFile:
+			Records = [json.loads(Line) for Line in LogFile if Line.strip()]
+	RunSeconds = [Record["TotalSeconds"] for Record in Records if Record["Part"] == "run"]
+	if not RunSeconds:
+		return AssumedSecondsPerRun * Runs / ParallelRuns, format(AssumedSecondsPerRun, "g") + " seconds per run (assumed; " + os.path.basename(LogFileName) + " has no timings)"
+	SecondsPerRun = sum(RunSeconds) / len(RunSeconds)
+	FixedSeconds = sum(Record["TotalSeconds"] for Record in Records if Record["Part"] != "run")
+	return FixedSeconds + SecondsPerRun * Runs / ParallelRuns, format(SecondsPerRun, ".1f") + " seconds per run, from " + str(len(RunSeconds)) + " runs in " + os.path.basename(LogFileName)
+
+# This returns the estimated bytes of the results files and of the .vdf files.  A variable list
+# that doesn't exist, or a variable that isn't in the model, adds nothing (they are problems).
+def EstimateBytes(Batch, ScriptFile, Index, ModelFile):
+	Folder = os.path.dirname(os.path.abspath(ScriptFile))
+	TimePoints = PlanSavelist.SavedTimePoints(Index, ModelFile)
+
+	def ListBytes(ListFile, SizeFunction):
+		if not os.path.exists(os.path.join(Folder, ListFile)):
+			return 0
+		References = ModelIndex.ReadVariableList(os.path.join(Folder, ListFile))
+		return sum(SizeFunction(Index, Reference, TimePoints) for Reference in References if ModelIndex.FindVariable(Index, Reference) is not None)
+
+	ResultsBytes = sum(ListBytes(ListFile, PlanSavelist.ExportedBytes) * Count for ListFile, Count in Batch["Exports"].items())
+	FullModelBytes = sum(PlanSavelist.SavedBytes(Index, Variable["Name"], TimePoints) for Variable in Index["Variables"].values() if Variable["Kind"] != "lookup")
+	VDFBytes = max([FullModelBytes if Savelist is None else ListBytes(Savelist, PlanSavelist.SavedBytes) for Savelist in Batch["Savelists"]], default=0)
+	return ResultsBytes, VDFBytes * max(len(Batch["RunNames"]), 1)
+
+
+# Validating a Script
+# -------------------
+# This checks a command script (given as its lines) and estimates its size.  It returns a
+# report: a dictionary with the script's Problems, its Runs, its estimated Seconds (with a
+# description of the estimate in TimeSource), its estimated ResultsBytes and VDFBytes (None
+# if they could not be estimated), and Notes about anything that could not be checked.
+def ValidateScript(Lines, ScriptFile):
+
+	Batch = ReadBatch(Lines)
+	Folder = os.path.dirname(os.path.abspath(ScriptFile))
+	Report = {"Problems": [], "Runs": Batch["Runs"], "ResultsBytes": None, "VDFBytes": None, "Notes": []}
+
+	Index = None
+	ModelFile = os.path.join(Folder, Batch["ModelFiles"][0]) if Batch["ModelFiles"] else None
+	if ModelFile is not None and os.path.exists(ModelFile):
+		if os.path.splitext(ModelFile)[1].lower() == ".mdl":
+			Index = ModelIndex.LoadModelIndex(ModelFile)
+		else:
+			Report["Notes"].append("The names of levers and variables can only be checked against a .mdl model file, so they were not checked.")
+	Report["Problems"] = CheckBatch(Batch, ScriptFile, Index)
+
+	Report["Seconds"], Report["TimeSource"] = EstimateSeconds(Batch["Runs"], os.path.join(Folder, TimingLogFile))
+	if Index is not None:
+		try:
+			Report["ResultsBytes"], Report["VDFBytes"] = EstimateBytes(Batch, ScriptFile, Index, ModelFile)
+		except (OSError, ValueError, IndexError):
+			Report["Notes"].append("The disk space could not be estimated, because the model's INITIAL TIME and FINAL TIME could not be read from InputData/plcy-schd.")
+	return Report
+
+# This returns a list of the budgets a report exceeds.
+def CheckBudgets(Report, ScriptFile):
+	OverBudget = []
+	if MaxRuns and Report["Runs"] > MaxRuns:
+		OverBudget.append(ScriptFile + " has " + str(Report["Runs"]) + " runs, more than MaxRuns (" + str(MaxRuns) + ").")
+	if MaxHours and Report["Seconds"] > MaxHours * 3600:
+		OverBudget.append(ScriptFile + " is estimated to take " + format(Report["Seconds"] / 3600, ".1f") + " hours (at " + Report["TimeSource"] + "), more than MaxHours (" + format(MaxHours, "g") + ").")
+	if Report["ResultsBytes"] is not None:
+		DiskBytes = Report["ResultsBytes"] + Report["VDFBytes"]
+		FreeBytes = shutil.disk_usage(os.path.dirname(os.path.abspath(ScriptFile))).free
+		if MaxDiskGB and DiskBytes > MaxDiskGB * 10**9:
+			OverBudget.append(ScriptFile + " is estimated to use " + PlanSavelist.FormatBytes(DiskBytes) + " of disk space, more than MaxDiskGB (" + format(MaxDiskGB, "g") + ").")
+		elif DiskBytes > FreeBytes:
+			OverBudget.append(ScriptFile + " is estimated to use " + PlanSavelist.FormatBytes(DiskBytes) + " of disk space, but only " + PlanSavelist.FormatBytes(FreeBytes) + " is free.")
+	return OverBudget
+
+def DescribeReport(Report):
+	Lines = [str(Report["Runs"]) + " runs, estimated to take " + format(Report["Seconds"] / 3600, ".2f") + " hours (" + Report["TimeSource"] + ")"]
+	if Report["ResultsBytes"] is not None:
+		Lines.append("Estimated disk space: " + PlanSavelist.FormatBytes(Report["ResultsBytes"] + Report["VDFBytes"]) + " (results files " + PlanSavelist.FormatBytes(Report["ResultsBytes"])
+			+ ", .vdf files " + PlanSavelist.FormatBytes(Report["VDFBytes"]) + ")")
+	return Lines + Report["Notes"]
+
+# This returns the lines of the parts of a command script as they are written to Script, so a
+# script is checked as it is written, without holding all of it in memory.
+def WrittenLines(ScriptParts, Script):
+	Remainder = ""
+	for Part in ScriptParts:
+		Script.write(Part)
+		Lines = (Remainder + Part).split("\n")
+		Remainder = Lines.pop()
+		yield from Lines
+	if Remainder:
+		yield Remainder
+
+# This is called by the generator scripts with the parts of the command script they are about to
+# write.  The parts are written to a temporary file as they are checked, and the file replaces
+# ScriptFile if there are no problems; otherwise it is removed and a ValueError describing the
+# problems is raised.
+def WriteCheckedScript(ScriptParts, ScriptFile):
+	TemporaryFile = ScriptFile + ".tmp"
+	try:
+		with open(TemporaryFile, 'w') as Script:
+			Lines = WrittenLines(ScriptParts, Script)
+			Report = ValidateScript(Lines, ScriptFile)
+			for Line in Lines: # ReadBatch reads every line, but the whole script must be written in any case
+				pass
+		Problems = Report["Problems"] + CheckBudgets(Report, ScriptFile)
+		if Problems:
+			if len(Problems) > MaxProblemsReported:
+				Problems = Problems[:MaxProblemsReported] + ["(" + str(len(Problems) - MaxProblemsReported) + " more problems were found.)"]
+			raise ValueError("Error: " + "  ".join(Problems))
+		os.replace(TemporaryFile, ScriptFile)
+	finally:
+		if os.path.exists(TemporaryFile):
+			os.remove(TemporaryFile)
+	print(ScriptFile + ": " + "  ".join(DescribeReport(Report)))
+
+if __name__ == "__main__":
+	for ScriptFile in CommandScripts:
+		if not os.path.exists(ScriptFile):
+			continue
+		with open(ScriptFile, 'r') as Script:
+			Report = ValidateScript(Script, ScriptFile)
+		print(ScriptFile + ":")
+		Problems = Report["Problems"] + CheckBudgets(Report, ScriptFile)
+		for Line in DescribeReport(Report) + Problems:
+			print("\t" + Line)
+		if not Problems:
+			print("\tNo problems were found.")
+		print()
@@ -0,0 +1,129 @@
+# VensimExecutors.py
+#
+# This is a Python module used by RunVensimBatch.py (and other scripts that carry out
+# Vensim command scripts themselves) to send commands to Vensim one at a time.  It is not
+# meant to be run by itself.
+#
+# Normally, a generated command script is run by opening it in Vensim.  Vensim then carries
+# out the whole script without reporting how long each command took.  By sending the same
+# commands through the Vensim DLL instead, a Python script can time each command and look at
+# the files it produces as it goes.
+#
+# Executors
+# ---------
+# An executor is an object with a Command(Text) method that carries out one line of a Vensim
+# command script (such as "MENU>RUN|O") and raises an error if Vensim reports a failure.  Two
+# kinds are provided:
+#	- VensimDLL, which sends the commands to the Vensim DLL (included with Vensim DSS, and
+#	  only available on Windows).  Its results are real model results.
+#	- StandIn, which imitates the effect of each command on the file system, writing a
+#	  placeholder .vdf file and rows of made-up values to the results file.  Its results are
+#	  NOT model results.  It exists so that the scripts that drive Vensim can be tried out
+#	  (for example, on a computer without Vensim) and produce files of the right format.
+
+
+import ctypes
+import math
+import os
+import time
+import zlib
+
+
+# The Vensim DLL
+# --------------
+# The DLL is named vendll32.dll (for 32-bit Python) or vendll64.dll (for 64-bit Python) and
+# is installed with Vensim DSS.  vensim_be_quiet(2) stops Vensim from showing dialog boxes,
+# which would otherwise halt an unattended batch.  vensim_command returns 1 on success.
+DLLFile = "vendll64.dll" if ctypes.sizeof(ctypes.c_void_p) == 8 else "vendll32.dll"
+
+class VensimDLL:
+
+	def __init__(self, LibraryFile=DLLFile):
+		if not hasattr(ctypes, "windll"):
+			raise OSError("The Vensim DLL is only available on Windows.  Use the StandIn executor to try scripts elsewhere.")
+		self.Library = ctypes.windll.LoadLibrary(LibraryFile)
+		self.Library.vensim_command.argtypes = [ctypes.c_char_p]
+		self.Library.vensim_command.restype = ctypes.c_int
+		self.Library.vensim_be_quiet.argtypes = [ctypes.c_int]
+		self.Library.vensim_be_quiet(2)
+
+	def Command(self, Text):
+		if self.Library.vensim_command(Text.encode("latin-1")) != 1:
+			raise RuntimeError("Vensim was unable to carry out the command: " + Text)
+
+
+# The Stand-In Executor
+# ---------------------
+# The stand-in writes results for the simulated years given in InputData (the same years the
+# model uses), with values that depend on the variable and on the nonzero SETVAL and READCIN
+# settings in effect, so runs with different settings produce different rows.  (About a third
+# of the variables are never affected by settings, as with real outputs that policies don't
+# reach.)  RunSeconds and VDFBytes control how long each simulated run takes and how large its
+# .vdf file is.
+class StandIn:
+
+	def __init__(self, RunSeconds=0, VDFBytes=1000000):
+		self.RunSeconds = RunSeconds
+		self.VDFBytes = VDFBytes
+		self.RunName = "Current"
+		self.SaveList = None
+		self.Settings = {}
+		self.RunSettings = []
+		with open(os.path.join("InputData", "plcy-schd", "IT", "IT.csv"), 'r') as InitialTimeFile:
+			InitialYear = int(float(InitialTimeFile.read().split(",")[-1]))
+		with open(os.path.join("InputData", "plcy-schd", "FT", "FT.csv"), 'r') as FinalTimeFile:
+			FinalYear = int(float(FinalTimeFile.read().split(",")[-1]))
+		self.Years = list(range(InitialYear, FinalYear + 1))
+
+	def Command(self, Text):
+		Command, Separator, Arguments = Text.partition("|")
+		Command = Command.strip().upper()
+
+		# As in Vensim, settings made with SETVAL and READCIN only last for the next run.
+		if Command == "SIMULATE>SETVAL":
+			Name, Value = Arguments.split("=", 1)
+			self.Settings[Name.strip()] = Value.strip()
+		elif Command == "SIMULATE>READCIN":
+			if Arguments.strip():
+				with open(Arguments.strip(), 'r') as SettingsFile:
+					for Line in SettingsFile:
+						if "=" in Line:
+							Name, Value = Line.split("=", 1)
+							self.Settings[Name.strip()] = Value.strip()
+		elif Command == "SIMULATE>RUNNAME":
+			self.RunName = Arguments.strip()
+		elif Command == "SIMULATE>SAVELIST":
+			self.SaveList = Arguments.strip() or None
+		elif Command == "MENU>RUN":
+			time.sleep(self.RunSeconds)
+			with open(self.RunName + ".vdf", 'wb') as VDFFile:
+				VDFFile.write(repr(sorted(self.Settings.items())).encode("utf-8").ljust(self.VDFBytes, b"\0"))
+			self.RunSettings = sorted((Name, Value) for Name, Value in self.Settings.items() if Value not in ("0", "0.0"))
+			self.Settings = {}
+		elif Command == "MENU>VDF2TAB":
+			self.WriteResults(Arguments)
+		elif Command == "FILE>DELETE":
+			if os.path.exists(Arguments.strip()):
+				os.remove(Arguments.strip())
+		# Other commands (such as SPECIAL>LOADMODEL) have no effect on the files we imitate.
+
+	# The arguments follow the format written by the generator scripts:
+	# VDF file|results file|variable list|options|||:annotations
+	def WriteResults(self, Arguments):
+		Arguments, Separator, Annotations = Arguments.partition(":")
+		Fields = Arguments.split("|")
+		Append = "+" in Fields[3] if len(Fields) > 3 else False
+		with open(Fields[2], 'r') as VariableList:
+			Variables = [Line.strip() for Line in VariableList if Line.strip()]
+		SettingsHash = zlib.crc32(repr(self.RunSettings).encode("utf-8"))
+		with open(Fields[1], 'a' if Append else 'w') as ResultsFile:
+			if not Append:
+				ResultsFile.write("Time\t" + Annotations + "\t" + "\t".join(str(Year) for Year in self.Years) + "\n")
+			for Variable in Variables:
+				VariableHash = zlib.crc32(Variable.encode("utf-8"))
+				Scale = 1 + VariableHash % 1000
+				Effect = 1
+				if self.RunSettings and VariableHash % 3 != 0:
+					Effect += (zlib.crc32(Variable.encode("utf-8"), SettingsHash) % 100 - 50) / 10000
+				Values = [Scale * (1 + 0.02 * math.sin(Year)) * Effect ** (Year - self.Years[0]) for Year in self.Years]
+				ResultsFile.write(Variable + "\t" + Annotations + "\t" + "\t".join("%.6g" % Value for Value in Values) + "\n")
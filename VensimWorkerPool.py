@@ -0,0 +1,290 @@
+# VensimWorkerPool.py
+#
+# This is a Python script, and a module used by other scripts, that performs model runs in a
+# pool of worker processes, each of which loads the model once and then performs any number
+# of runs.  Every generated command script begins by loading the model, and loading the EPS
+# (and the input data files it reads with GET DIRECT functions) takes much longer than a
+# single run.  When runs are requested a few at a time (for example, by a script searching
+# for a policy setting), loading the model for each batch would take most of the time.
+#
+# Runs
+# ----
+# Each run is described by a dictionary with any of the following entries:
+#	"Settings": a dictionary of values for policy levers (or other constants), such as
+#	            {"Fraction of F Gases Avoided": 1}, applied with SETVAL commands
+#	"PolicySchedule": the number of the policy implementation schedule to use
+#	"SettingsFile": a settings file (.cin) to read before applying the "Settings"
+#	"InputDataOverlay": the manifest of a variant of the input data (see InputDataOverlays.py)
+# A run with no entries is a BAU run.  The result of each run is a dictionary holding the
+# simulated "Years", the "Values" of each variable in the OutputVarsFile (keyed by the name of
+# the row in the results, as read by RunResultsReader.py), the "Seconds" the run took, and the
+# number of the "Worker" that performed it.  If Vensim couldn't perform a run, the result
+# holds an "Error" message instead of "Years" and "Values".
+#
+# Using the Pool from Another Script
+# ----------------------------------
+#	from VensimWorkerPool import VensimWorkerPool
+#	with VensimWorkerPool(Workers=4) as Pool:
+#		Results = Pool.Run([{"Settings": {"Fraction of F Gases Avoided": Value}} for Value in (0, 0.5, 1)])
+#
+# Run() waits for all of the runs it was given.  To handle results as they finish, give runs
+# to Submit() (which returns a number identifying the run) and collect them with Completed()
+# or Wait().  The workers are started with the "spawn" method (as on Windows), so a script
+# that uses the pool must create it under 'if __name__ == "__main__":'.
+#
+# Executors
+# ---------
+# Each worker sends its commands to its own executor (see VensimExecutors.py).  "VensimDLL"
+# performs real model runs, on Windows.  "StandIn" writes made-up results of the right format
+# (NOT model results), so scripts using the pool can be tried out on any computer.  Each worker
+# uses its own RunName, so workers don't overwrite each other's .vdf files, and exports each
+# run to its own file in a temporary folder (in the current folder), which is deleted when the
+# pool is closed.
+#
+# For a run with an "InputDataOverlay", the worker creates an overlay of the variant in the
+# temporary folder and loads the model from there (Vensim reads input data relative to the
+# model file), keeping it loaded for following runs of the same variant.  Paths in the
+# commands are relative to the folder of the loaded model, since Vensim may treat them either
+# way, and this also keeps drive letters (whose ":" ends the file names in a VDF2TAB command)
+# out of the commands.
+#
+# Run as a Script
+# ---------------
+# When run by itself, this script performs a run for each of the SettingsFiles and writes
+# their results to the RunResultsFile, with each run labeled by its settings file.
+
+
+# File Names
+# ----------
+ModelFile = "EPS.mdl" # The name of the Vensim model file
+OutputVarsFile = "OutputVarsToExport.lst" # The name of the file containing a list of variables to be included in the results
+RunResultsFile = "WorkerPoolResults.tsv" # The desired filename for the results, when this script is run by itself
+SettingsFiles = ["Scenario_BAU.cin", "Scenario_Example.cin", "Scenario_MEIMTarget.cin"] # The settings files to run, when this
+																						# script is run by itself
+
+# Other Settings
+# --------------
+Workers = 0 # The number of worker processes (0 to use one per processor)
+Executor = "VensimDLL" # "VensimDLL" to run the model in Vensim, or "StandIn" to try out the pool without Vensim
+PolicySchedule = 1 # The number of the policy implementation schedule file to be used (in InputData/plcy-schd/FoPITY)
+StartupTimeout = 600 # Seconds to wait for the workers to load the model before giving up
+
+
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import time
+import EPSScriptGenerators
+import InputDataOverlays
+import VensimExecutors
+from RunResultsReader import IterateRunResults
+
+
+# Commands for a Run
+# ------------------
+# These are the same commands the generated command scripts use.  The settings file is read
+# first, so the "Settings" of the run take precedence over it.  Vensim clears settings made
+# with SETVAL and READCIN after each run, so one run's settings never carry over to the next.
+def RunCommands(Run, RunName, ResultsFile, OutputVarsFile):
+	Commands = "SIMULATE>RUNNAME|" + RunName + "\n"
+	if Run.get("SettingsFile"):
+		Commands += "SIMULATE>READCIN|" + Run["SettingsFile"] + "\n"
+	for Lever, Value in Run.get("Settings", {}).items():
+		Commands += EPSScriptGenerators.SetValCommand(Lever, Value)
+	if Run.get("PolicySchedule") is not None:
+		Commands += EPSScriptGenerators.PolicyScheduleCommand(Run["PolicySchedule"])
+	Commands += ("MENU>RUN|O\n"
+		+ EPSScriptGenerators.VDF2TABCommand(RunName, ResultsFile, OutputVarsFile, True) + RunName + "\n"
+		+ EPSScriptGenerators.DeleteCommand(RunName))
+	return [Line for Line in Commands.split("\n") if Line]
+
+def MakeExecutor(Executor, ExecutorOptions):
+	if Executor == "VensimDLL":
+		return VensimExecutors.VensimDLL(**ExecutorOptions)
+	elif Executor == "StandIn":
+		return VensimExecutors.StandIn(**ExecutorOptions)
+	raise ValueError("Unknown Executor setting: " + str(Executor) + ".  Use \"VensimDLL\" or \"StandIn\".")
+
+
+# The Workers
+# -----------
+# A worker reports "ready" once it has loaded the model (or the error that stopped it), then
+# performs runs from the Tasks queue until it receives None.  Messages on the Results queue
+# are tuples of (Kind, Worker number, Run number, Result).
+def Worker(Number, Executor, ExecutorOptions, ModelFile, OutputVarsFile, WorkFolder, Tasks, Results):
+
+	RunName = "PoolWorker" + str(Number)
+	ModelFolder = os.getcwd()
+	ResultsFile = os.path.abspath(os.path.join(WorkFolder, RunName + ".tsv"))
+	OutputVarsFile = os.path.abspath(OutputVarsFile)
+	OverlayPath = os.path.abspath(os.path.join(WorkFolder, RunName + "-Overlay"))
+	CurrentOverlay = None
+	try:
+		Vensim = MakeExecutor(Executor, ExecutorOptions)
+		Vensim.Command('SPECIAL>LOADMODEL|"' + ModelFile + '"')
+	except Exception as Error:
+		Results.put(("failed", Number, None, str(Error)))
+		return
+	Results.put(("ready", Number, None, None))
+
+	while True:
+		Task = Tasks.get()
+		if Task is None:
+			os.chdir(ModelFolder)
+			InputDataOverlays.RemoveOverlay(OverlayPath)
+			return
+		RunNumber, Run = Task
+		Start = time.perf_counter()
+		try:
+			if Run.get("InputDataOverlay") != CurrentOverlay:
+				CurrentOverlay = False # In case loading the model fails
+				os.chdir(ModelFolder)
+				InputDataOverlays.RemoveOverlay(OverlayPath)
+				if Run.get("InputDataOverlay"):
+					InputDataOverlays.CreateOverlay(OverlayPath, InputDataOverlays.ReadVariantManifest(Run["InputDataOverlay"]), ModelFile)
+					os.chdir(OverlayPath)
+				Vensim.Command('SPECIAL>LOADMODEL|"' + (os.path.basename(ModelFile) if Run.get("InputDataOverlay") else ModelFile) + '"')
+				CurrentOverlay = Run.get("InputDataOverlay")
+			if Run.get("SettingsFile"):
+				Run = dict(Run, SettingsFile=os.path.relpath(os.path.join(ModelFolder, Run["SettingsFile"])))
+			for Line in RunCommands(Run, RunName, os.path.relpath(ResultsFile), os.path.relpath(OutputVarsFile)):
+				Vensim.Command(Line)
+			Result = {"Values": {}}
+			for Years, Variable, Annotations, Values in IterateRunResults(ResultsFile):
+				Result["Years"] = Years
+				Result["Values"][Variable] = Values
+			os.remove(ResultsFile)
+		except Exception as Error:
+			Result = {"Error": str(Error)}
+		Result["Seconds"] = time.perf_counter() - Start
+		Result["Worker"] = Number
+		Results.put(("result", Number, RunNumber, Result))
+
+
+# The Pool
+# --------
+class VensimWorkerPool:
+
+	def __init__(self, Workers=0, Executor="VensimDLL", ExecutorOptions=None, ModelFile=ModelFile, OutputVarsFile=OutputVarsFile):
+		Context = multiprocessing.get_context("spawn")
+		self.Tasks = Context.Queue()
+		self.Results = Context.Queue()
+		self.WorkFolder = tempfile.mkdtemp(prefix="VensimWorkerPool-", dir=os.getcwd())
+		self.NextRunNumber = 1
+		self.Pending = set()
+		self.Finished = {}
+		self.Processes = []
+
+		Start = time.perf_counter()
+		for Number in range(1, (Workers or os.cpu_count() or 1) + 1):
+			Process = Context.Process(target=Worker, args=(Number, Executor, ExecutorOptions or {}, ModelFile, OutputVarsFile, self.WorkFolder, self.Tasks, self.Results), daemon=True)
+			Process.start()
+			self.Processes.append(Process)
+		Ready = 0
+		while Ready < len(self.Processes):
+			Kind, Number, RunNumber, Message = self.Receive(StartupTimeout)
+			if Kind == "failed":
+				self.Close()
+				raise RuntimeError("Worker " + str(Number) + " could not load the model: " + Message)
+			Ready += 1
+		self.StartupSeconds = time.perf_counter() - Start
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *Exception):
+		self.Close()
+
+	# This waits for the next message from the workers, and raises an error if a worker has
+	# stopped unexpectedly (for example, because Vensim crashed) or Timeout seconds pass.
+	def Receive(self, Timeout=None):
+		Waited = 0
+		while True:
+			try:
+				return self.Results.get(timeout=1)
+			except queue.Empty:
+				Waited += 1
+			for Process in self.Processes:
+				if not Process.is_alive():
+					# A worker that failed to start reports why before stopping.
+					try:
+						return self.Results.get(timeout=1)
+					except queue.Empty:
+						pass
+					self.Close()
+					raise RuntimeError("A worker process stopped unexpectedly (exit code " + str(Process.exitcode) + ").")
+			if Timeout is not None and Waited >= Timeout:
+				self.Close()
+				raise RuntimeError("The workers did not respond within " + str(Timeout) + " seconds.")
+
+	def Submit(self, Run):
+		for Entry in Run:
+			if Entry not in ("Settings", "PolicySchedule", "SettingsFile", "InputDataOverlay"):
+				raise ValueError("Unknown entry in run description: " + str(Entry) + ".  Use \"Settings\", \"PolicySchedule\", \"SettingsFile\", or \"InputDataOverlay\".")
+		RunNumber = self.NextRunNumber
+		self.NextRunNumber += 1
+		self.Tasks.put((RunNumber, Run))
+		self.Pending.add(RunNumber)
+		return RunNumber
+
+	def ReceiveResult(self):
+		Kind, Number, RunNumber, Result = self.Receive()
+		self.Pending.discard(RunNumber)
+		self.Finished[RunNumber] = Result
+		return RunNumber
+
+	# This yields (run number, result) for every submitted run not yet collected, as the runs
+	# finish.
+	def Completed(self):
+		while self.Finished or self.Pending:
+			if not self.Finished:
+				self.ReceiveResult()
+			RunNumber = next(iter(self.Finished))
+			yield RunNumber, self.Finished.pop(RunNumber)
+
+	# This waits for the given runs to finish, and returns their results in the same order.
+	def Wait(self, RunNumbers):
+		for RunNumber in RunNumbers:
+			if RunNumber not in self.Pending and RunNumber not in self.Finished:
+				raise ValueError("Run " + str(RunNumber) + " was not submitted, or its result was already collected.")
+		while any(RunNumber not in self.Finished for RunNumber in RunNumbers):
+			self.ReceiveResult()
+		return [self.Finished.pop(RunNumber) for RunNumber in RunNumbers]
+
+	# This performs the runs and returns their results in the same order, raising an error if
+	# any run failed.
+	def Run(self, Runs):
+		Results = self.Wait([self.Submit(Run) for Run in Runs])
+		for Run, Result in zip(Runs, Results):
+			if "Error" in Result:
+				raise RuntimeError("The run " + repr(Run) + " failed: " + Result["Error"])
+		return Results
+
+	def Close(self):
+		for Process in self.Processes:
+			if Process.is_alive():
+				self.Tasks.put(None)
+		for Process in self.Processes:
+			Process.join(10)
+			if Process.is_alive():
+				Process.terminate()
+		self.Processes = []
+		shutil.rmtree(self.WorkFolder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+	with VensimWorkerPool(Workers, Executor, ModelFile=ModelFile, OutputVarsFile=OutputVarsFile) as Pool:
+		print("Started " + str(len(Pool.Processes)) + " workers in " + format(Pool.StartupSeconds, ".1f") + " seconds.")
+		Start = time.perf_counter()
+		Results = Pool.Run([{"SettingsFile": SettingsFile, "PolicySchedule": PolicySchedule} for SettingsFile in SettingsFiles])
+		print("Performed " + str(len(Results)) + " runs in " + format(time.perf_counter() - Start, ".1f") + " seconds.")
+
+	f = open(RunResultsFile, 'w')
+	for SettingsFile, Result in zip(SettingsFiles, Results):
+		if SettingsFile == SettingsFiles[0]:
+			f.write("Time\tSettingsFile=" + SettingsFile + "\t" + "\t".join(str(Year) for Year in Result["Years"]) + "\n")
+		for Variable, Values in Result["Values"].items():
+			f.write(Variable + "\tSettingsFile=" + SettingsFile + "\t" + "\t".join("%.6g" % Value for Value in Values) + "\n")
+	f.close()